@@ -0,0 +1,131 @@
+"""
+Подготовка фидов для воспроизведения.
+
+Запись живого фида Binance (по умолчанию - 1m свечи символов из strems.py):
+    PYTHONPATH=. python bench/record.py live --out bench/feeds/kline.gz --seconds 300
+
+Синтетический фид без сети (свечи N символов, обновление каждые 250 мс,
+либо события user data stream):
+    PYTHONPATH=. python bench/record.py kline --out bench/feeds/kline.gz --symbols 300 --seconds 60
+    PYTHONPATH=. python bench/record.py userdata --out bench/feeds/userdata.gz --events 20000
+
+Для user data stream живую запись удобнее вести самим сервисом: WS_RECORD_PATH=/path/userdata.gz.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import websockets
+
+from common.replay import FrameRecorder
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def record_live(out: str, url: str, seconds: float):
+    recorder = FrameRecorder(out)
+    deadline = time.monotonic() + seconds
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+                recorder.write(message)
+    finally:
+        recorder.close()
+    print(f"Записано кадров: {recorder.frames} -> {out}")
+
+
+def kline_frame(symbol: str, event_ms: int, open_ms: int, price: float, is_closed: bool) -> str:
+    data = {
+        "e": "kline", "E": event_ms, "s": symbol,
+        "k": {
+            "t": open_ms, "T": open_ms + 59_999, "s": symbol, "i": "1m", "f": 100, "L": 200,
+            "o": f"{price:.4f}", "c": f"{price * 1.001:.4f}", "h": f"{price * 1.002:.4f}",
+            "l": f"{price * 0.999:.4f}", "v": "1234.5", "n": 100, "x": is_closed,
+            "q": "123456.7", "V": "600.1", "Q": "60000.2", "B": "0",
+        },
+    }
+    return json.dumps({"stream": f"{symbol.lower()}@kline_1m", "data": data}, separators=(",", ":"))
+
+
+def synthetic_kline(out: str, symbols: int, seconds: int, interval_ms: int = 250):
+    names = [f"SYM{i}USDT" for i in range(symbols)]
+    prices = {name: 10 + random.random() * 1000 for name in names}
+    recorder = FrameRecorder(out)
+    start_ms = int(time.time() * 1000)
+    start_ms -= start_ms % 60_000
+    for tick in range(seconds * 1000 // interval_ms):
+        now_ms = start_ms + tick * interval_ms
+        open_ms = now_ms - now_ms % 60_000
+        # Последнее обновление минуты - закрытая свеча
+        is_closed = (now_ms + interval_ms) % 60_000 == 0
+        for name in names:
+            prices[name] *= 1 + random.uniform(-0.0005, 0.0005)
+            recorder.write(kline_frame(name, now_ms, open_ms, prices[name], is_closed), now_ms / 1000)
+    recorder.close()
+    print(f"Записано кадров: {recorder.frames} -> {out}")
+
+
+def synthetic_userdata(out: str, events: int, symbols: int = 50, interval_ms: int = 5):
+    recorder = FrameRecorder(out)
+    now_ms = int(time.time() * 1000)
+    for i in range(events):
+        symbol = f"SYM{random.randrange(symbols)}USDT"
+        event_ms = now_ms + i * interval_ms
+        if i % 2:
+            side = random.choice(["LONG", "SHORT"])
+            amount = random.choice(["0", "1.5", "-2"])
+            event = {
+                "e": "ACCOUNT_UPDATE", "E": event_ms, "T": event_ms,
+                "a": {"m": "ORDER", "B": [], "P": [{
+                    "s": symbol, "pa": amount, "ep": "100.5", "cr": "0", "up": "0.1",
+                    "mt": "cross", "iw": "0", "ps": side,
+                }]},
+            }
+        else:
+            event = {
+                "e": "ORDER_TRADE_UPDATE", "E": event_ms, "T": event_ms,
+                "o": {
+                    "s": symbol, "c": f"bench{i}", "S": "BUY", "o": "LIMIT", "f": "GTC", "q": "1.5",
+                    "p": "100.5", "ap": "0", "sp": "0", "x": "NEW", "X": "NEW", "i": i,
+                    "ps": "LONG", "wt": "CONTRACT_PRICE", "T": event_ms,
+                },
+            }
+        recorder.write(json.dumps(event, separators=(",", ":")), event_ms / 1000)
+    recorder.close()
+    print(f"Записано кадров: {recorder.frames} -> {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["live", "kline", "userdata"])
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--url", default="")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    if args.mode == "live":
+        url = args.url
+        if not url:
+            sys.path.insert(0, os.path.join(ROOT, "marketservise"))
+            from strems import streams
+            url = f"wss://fstream.binance.com/stream?streams={'/'.join(streams)}"
+        asyncio.run(record_live(args.out, url, args.seconds))
+    elif args.mode == "kline":
+        synthetic_kline(args.out, args.symbols, args.seconds)
+    else:
+        synthetic_userdata(args.out, args.events)
+
+
+if __name__ == "__main__":
+    main()
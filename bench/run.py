@@ -0,0 +1,254 @@
+"""
+Бенчмарк сервисов на записанном фиде без обращения к Binance.
+
+Для каждого сервиса поднимается локальный ReplayServer (и mock REST для
+exchangeInfo / listenKey), сервис запускается отдельным процессом с
+BINANCE_WS_URL / BINANCE_FAPI_URL на них, после прогрева с его эндпоинта
+метрик снимаются: устойчивая скорость (сообщений/с), p50/p99 задержки
+от отправки кадра до подтверждения записи в Redis и максимальный RSS процесса.
+
+Нужен отдельный Redis (REDIS_HOST/REDIS_PORT/REDIS_PASSWORD из окружения):
+сервисы пишут в него как в боевой, а перед запуском удаляются ключи universe:*.
+
+    PYTHONPATH=. python bench/record.py kline --out bench/feeds/kline.gz
+    PYTHONPATH=. python bench/record.py userdata --out bench/feeds/userdata.gz
+    PYTHONPATH=. python bench/run.py --speed 0 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import urllib.request
+
+import redis.asyncio as redis
+from aiohttp import web
+
+from common.replay import ReplayServer, read_frames
+from common.universe import EXCHANGE_INFO_CACHE_KEY, UNIVERSE_KEY
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Сервис: каталог, путь WebSocket, префикс метрик
+SERVICES = {
+    "marketservise": {"ws_path": "/stream", "prefix": "marketdata", "feed": "bench/feeds/kline.gz"},
+    "userdataservise": {"ws_path": "/ws", "prefix": "userdata", "feed": "bench/feeds/userdata.gz"},
+}
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+
+def parse_metrics(text: str) -> list:
+    """
+    Текст Prometheus -> список (имя, {метки}, значение).
+    """
+    result = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels or ""))
+        result.append((name, labels, float(value)))
+    return result
+
+
+def scrape(port: int) -> list:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        return parse_metrics(response.read().decode())
+
+
+def total(samples: list, name: str) -> float:
+    return sum(value for sample_name, labels, value in samples if sample_name == name)
+
+
+def buckets(samples: list, name: str, stage: str) -> dict:
+    return {
+        float(labels["le"]): value
+        for sample_name, labels, value in samples
+        if sample_name == f"{name}_bucket" and labels.get("stage") == stage
+    }
+
+
+def bucket_quantile(q: float, before: dict, after: dict) -> float:
+    """
+    Квантиль по приращению кумулятивной гистограммы за интервал замера
+    (линейная интерполяция внутри ячейки, как histogram_quantile в Prometheus).
+    """
+    bounds = sorted(after)
+    counts = [after[bound] - before.get(bound, 0.0) for bound in bounds]
+    if not counts or counts[-1] <= 0:
+        return 0.0
+    rank = q * counts[-1]
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in zip(bounds, counts):
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            width = count - previous_count
+            fraction = (rank - previous_count) / width if width else 1.0
+            return previous_bound + (bound - previous_bound) * fraction
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def feed_symbols(path: str) -> list:
+    symbols = set()
+    for _, frame in read_frames(path):
+        match = re.search(r'"s":"([A-Z0-9]+)"', frame)
+        if match:
+            symbols.add(match.group(1))
+    return sorted(symbols)
+
+
+async def start_mock_rest(symbols: list, port: int) -> web.AppRunner:
+    async def exchange_info(request):
+        return web.json_response({"symbols": [
+            {"symbol": s, "contractType": "PERPETUAL", "status": "TRADING", "quoteAsset": "USDT"} for s in symbols
+        ]})
+
+    async def listen_key(request):
+        return web.json_response({"listenKey": "bench"})
+
+    app = web.Application()
+    app.router.add_get("/fapi/v1/exchangeInfo", exchange_info)
+    app.router.add_post("/fapi/v1/listenKey", listen_key)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def reset_universe():
+    client = redis.Redis(
+        host=os.getenv("REDIS_HOST", "127.0.0.1"), port=int(os.getenv("REDIS_PORT", "6379")),
+        password=os.getenv("REDIS_PASSWORD") or None
+    )
+    await client.delete(UNIVERSE_KEY, EXCHANGE_INFO_CACHE_KEY)
+    await client.aclose()
+
+
+async def wait_for_metrics(port: int, process: subprocess.Popen, timeout: float = 30.0) -> list:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервис завершился с кодом {process.returncode}")
+        try:
+            return await asyncio.to_thread(scrape, port)
+        except OSError:
+            await asyncio.sleep(0.5)
+    raise RuntimeError("Эндпоинт метрик не поднялся")
+
+
+async def bench_service(service: str, feed: str, speed: float, warmup: float, duration: float,
+                        ws_port: int, rest_port: int, metrics_port: int) -> dict:
+    config = SERVICES[service]
+    replay = ReplayServer(feed, speed=speed, loop=True)
+    await replay.start(port=ws_port)
+    rest = await start_mock_rest(feed_symbols(feed), rest_port)
+    await reset_universe()
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        BINANCE_WS_URL=f"ws://127.0.0.1:{ws_port}{config['ws_path']}",
+        BINANCE_FAPI_URL=f"http://127.0.0.1:{rest_port}",
+        METRICS_PORT=str(metrics_port),
+        BACKFILL_ENABLED="0",
+        API_KEY_BIN="bench",
+    )
+    env.setdefault("REDIS_HOST", "127.0.0.1")
+    env.setdefault("REDIS_PORT", "6379")
+    process = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=os.path.join(ROOT, service), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    prefix = config["prefix"]
+    histogram = f"{prefix}_ingest_latency_seconds"
+    messages = f"{prefix}_ws_messages_total"
+    try:
+        await wait_for_metrics(metrics_port, process)
+        await asyncio.sleep(warmup)
+        before = await asyncio.to_thread(scrape, metrics_port)
+        started = time.monotonic()
+        max_rss = 0.0
+        while time.monotonic() - started < duration:
+            await asyncio.sleep(1)
+            max_rss = max(max_rss, rss_mb(process.pid))
+        after = await asyncio.to_thread(scrape, metrics_port)
+        elapsed = time.monotonic() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        await rest.cleanup()
+        await replay.stop()
+
+    latency_before = buckets(before, histogram, "redis_ack")
+    latency_after = buckets(after, histogram, "redis_ack")
+    return {
+        "service": service,
+        "msgs_per_sec": (total(after, messages) - total(before, messages)) / elapsed,
+        "p50_ms": bucket_quantile(0.5, latency_before, latency_after) * 1000,
+        "p99_ms": bucket_quantile(0.99, latency_before, latency_after) * 1000,
+        "rss_mb": max_rss,
+    }
+
+
+async def run(args):
+    results = []
+    for service in args.services:
+        feed = os.path.join(ROOT, args.feed or SERVICES[service]["feed"])
+        if not os.path.exists(feed):
+            print(f"{service}: нет фида {feed}, см. bench/record.py")
+            continue
+        results.append(await bench_service(
+            service, feed, args.speed, args.warmup, args.duration, args.ws_port, args.rest_port, args.metrics_port
+        ))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'сервис':<18}{'сообщ/с':>12}{'p50, мс':>10}{'p99, мс':>10}{'RSS, МБ':>10}")
+    for result in results:
+        print(
+            f"{result['service']:<18}{result['msgs_per_sec']:>12.0f}{result['p50_ms']:>10.2f}"
+            f"{result['p99_ms']:>10.2f}{result['rss_mb']:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--services", nargs="+", default=list(SERVICES), choices=list(SERVICES))
+    parser.add_argument("--feed", default="", help="фид для всех сервисов вместо фидов по умолчанию")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 - как записано, N - в N раз быстрее, 0 - максимум")
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--ws-port", type=int, default=8765)
+    parser.add_argument("--rest-port", type=int, default=8766)
+    parser.add_argument("--metrics-port", type=int, default=9190)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import json
+import struct
+from decimal import Decimal
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+# Соответствие полей свечи ключам kline-события Binance
+BINANCE_KLINE_KEYS = {
+    "start_time": "t",
+    "close_time": "T",
+    "symbol": "s",
+    "interval": "i",
+    "first_trade_id": "f",
+    "last_trade_id": "L",
+    "open": "o",
+    "close": "c",
+    "high": "h",
+    "low": "l",
+    "volume": "v",
+    "number_of_trades": "n",
+    "is_closed": "x",
+    "quote_volume": "q",
+    "taker_buy_base_volume": "V",
+    "taker_buy_quote_volume": "Q",
+}
+
+CANDLE_FIELDS = tuple(BINANCE_KLINE_KEYS)
+
+
+if msgspec is not None:
+    class Candle(msgspec.Struct, rename=BINANCE_KLINE_KEYS, gc=False):
+        """
+        Свеча с уже разобранными числовыми полями.
+        Декодируется напрямую из data.k без промежуточных словарей.
+        """
+        start_time: int
+        close_time: int
+        symbol: str
+        interval: str
+        first_trade_id: int
+        last_trade_id: int
+        open: float
+        close: float
+        high: float
+        low: float
+        volume: float
+        number_of_trades: int
+        is_closed: bool
+        quote_volume: float
+        taker_buy_base_volume: float
+        taker_buy_quote_volume: float
+
+    class _KlineEvent(msgspec.Struct):
+        k: Candle
+
+    class _KlineFrame(msgspec.Struct):
+        data: _KlineEvent
+
+    # strict=False - цены и объёмы приходят строками и разбираются в float при декодировании
+    _frame_decoder = msgspec.json.Decoder(_KlineFrame, strict=False)
+
+    def decode_kline(message) -> Candle:
+        """
+        Разбирает combined-stream сообщение и возвращает свечу из data.k.
+        """
+        return _frame_decoder.decode(message).data.k
+
+else:
+    class Candle:
+        """
+        Свеча с уже разобранными числовыми полями (вариант без msgspec).
+        """
+        __slots__ = CANDLE_FIELDS
+
+        def __init__(self, start_time, close_time, symbol, interval, first_trade_id, last_trade_id,
+                     open, close, high, low, volume, number_of_trades, is_closed,
+                     quote_volume, taker_buy_base_volume, taker_buy_quote_volume):
+            self.start_time = start_time
+            self.close_time = close_time
+            self.symbol = symbol
+            self.interval = interval
+            self.first_trade_id = first_trade_id
+            self.last_trade_id = last_trade_id
+            self.open = open
+            self.close = close
+            self.high = high
+            self.low = low
+            self.volume = volume
+            self.number_of_trades = number_of_trades
+            self.is_closed = is_closed
+            self.quote_volume = quote_volume
+            self.taker_buy_base_volume = taker_buy_base_volume
+            self.taker_buy_quote_volume = taker_buy_quote_volume
+
+    def decode_kline(message) -> Candle:
+        """
+        Разбирает combined-stream сообщение и возвращает свечу из data.k.
+        """
+        k = json.loads(message)["data"]["k"]
+        return Candle(
+            int(k["t"]), int(k["T"]), k["s"], k["i"], int(k["f"]), int(k["L"]),
+            float(k["o"]), float(k["c"]), float(k["h"]), float(k["l"]), float(k["v"]),
+            int(k["n"]), bool(k["x"]),
+            float(k["q"]), float(k["V"]), float(k["Q"])
+        )
+
+
+# Формат хранения - те же ключи и типы, что у прежнего json.dumps(dict) с полями
+# биржи: цены и объёмы - строками, время и идентификаторы - числами. Строки цен
+# собираются из float, поэтому совпадают с биржевыми по значению, а не побайтно:
+# десятичная запись без экспоненты, кратчайшая из точно восстанавливающих float
+# ("0.00001234" остаётся "0.00001234", "37000.10" становится "37000.1").
+# Значения длиннее 15-17 значащих цифр (крупные quote_volume) округляются до точности float.
+# first_trade_id / last_trade_id = -1 у свечей, догруженных через REST
+# /fapi/v1/klines после разрыва соединения (REST не отдаёт идентификаторы
+# сделок); то же значение и в упакованном формате. Остальные поля у таких свечей полные.
+_JSON_TEMPLATE = (
+    '{"start_time": %d, "close_time": %d, "symbol": "%s", "interval": "%s", '
+    '"first_trade_id": %d, "last_trade_id": %d, '
+    '"open": "%s", "close": "%s", "high": "%s", "low": "%s", "volume": "%s", '
+    '"number_of_trades": %d, "is_closed": %s, "quote_volume": "%s", '
+    '"taker_buy_base_volume": "%s", "taker_buy_quote_volume": "%s"}'
+)
+
+
+def format_decimal(value: float) -> str:
+    """
+    Кратчайшая запись float без экспоненты: 1.234e-05 -> "0.00001234".
+    """
+    text = repr(value)
+    if "e" in text:
+        # repr переходит на экспоненту вне 1e-4..1e16 - раскрываем те же цифры
+        text = format(Decimal(text), "f")
+    return text
+
+
+def candle_to_json(candle: Candle) -> str:
+    return _JSON_TEMPLATE % (
+        candle.start_time, candle.close_time, candle.symbol, candle.interval,
+        candle.first_trade_id, candle.last_trade_id,
+        format_decimal(candle.open), format_decimal(candle.close),
+        format_decimal(candle.high), format_decimal(candle.low), format_decimal(candle.volume),
+        candle.number_of_trades, "true" if candle.is_closed else "false", format_decimal(candle.quote_volume),
+        format_decimal(candle.taker_buy_base_volume), format_decimal(candle.taker_buy_quote_volume)
+    )
+
+
+def candle_from_json(raw) -> Candle:
+    """
+    Обратное преобразование для читателей candles:* / candle_current:*.
+    """
+    data = json.loads(raw)
+    return Candle(
+        int(data["start_time"]), int(data["close_time"]), data["symbol"], data["interval"],
+        int(data["first_trade_id"]), int(data["last_trade_id"]),
+        float(data["open"]), float(data["close"]), float(data["high"]), float(data["low"]),
+        float(data["volume"]), int(data["number_of_trades"]), bool(data["is_closed"]),
+        float(data["quote_volume"]), float(data["taker_buy_base_volume"]),
+        float(data["taker_buy_quote_volume"])
+    )
+
+
+# Упакованный формат закрытой свечи: байт версии + фиксированная раскладка little-endian.
+# Символ и интервал не хранятся - они есть в ключе candles:{symbol}:{interval}.
+PACKED_VERSION = 1
+_PACKED_LAYOUT = struct.Struct("<BqqqqdddddqBddd")
+PACKED_CANDLE_SIZE = _PACKED_LAYOUT.size
+
+
+def pack_candle(candle: Candle) -> bytes:
+    return _PACKED_LAYOUT.pack(
+        PACKED_VERSION,
+        candle.start_time, candle.close_time, candle.first_trade_id, candle.last_trade_id,
+        candle.open, candle.close, candle.high, candle.low, candle.volume,
+        candle.number_of_trades, 1 if candle.is_closed else 0,
+        candle.quote_volume, candle.taker_buy_base_volume, candle.taker_buy_quote_volume
+    )
+
+
+def unpack_candle(data: bytes, symbol: str, interval: str) -> Candle:
+    (version, start_time, close_time, first_trade_id, last_trade_id,
+     open_, close, high, low, volume, number_of_trades, is_closed,
+     quote_volume, taker_buy_base_volume, taker_buy_quote_volume) = _PACKED_LAYOUT.unpack(data)
+    if version != PACKED_VERSION:
+        raise ValueError(f"Неизвестная версия упакованной свечи: {version}")
+    return Candle(
+        start_time, close_time, symbol, interval, first_trade_id, last_trade_id,
+        open_, close, high, low, volume, number_of_trades, bool(is_closed),
+        quote_volume, taker_buy_base_volume, taker_buy_quote_volume
+    )
+
+
+def decode_stored_candle(raw, symbol: str, interval: str) -> Candle:
+    """
+    Читает элемент списка candles:* в любом из форматов: JSON (начинается с "{")
+    или упакованный. Так в одном списке могут лежать свечи до и после смены формата.
+    """
+    if isinstance(raw, str):
+        return candle_from_json(raw)
+    if raw[:1] == b"{":
+        return candle_from_json(raw)
+    return unpack_candle(raw, symbol, interval)
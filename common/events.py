@@ -0,0 +1,278 @@
+"""
+Шина событий по свечам на Redis Streams.
+
+marketservise публикует каждую закрытую свечу в stream:candles:{interval}
+(и, при включённой опции, прореженные текущие свечи в stream:candles_current:{interval}).
+Потребители читают через группы потребителей с доставкой at-least-once:
+сообщение подтверждается (XACK) только после успешной обработки,
+неподтверждённые сообщения перечитываются после перезапуска и забираются
+у «зависших» потребителей через XAUTOCLAIM. Сообщение, которое не удалось
+обработать max_deliveries раз, подтверждается и переносится в стрим
+недоставленных {stream}:dead, чтобы не блокировать остальные.
+Отставание и число неподтверждённых сообщений каждого потребителя
+отдаются метриками candle_stream_consumer_lag_ms / candle_stream_consumer_pending.
+
+Пример:
+    client = redis.Redis(host=..., password=..., decode_responses=False)
+    consumer = CandleStreamConsumer(client, group="openinterest", consumer="oi-1")
+    await consumer.run(handle_candle)   # async def handle_candle(candle): ...
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+from common import metrics
+from common.candle import decode_stored_candle
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTERS = metrics.counter(
+    "candle_stream_dead_letters_total", "Сообщений, перенесённых в стрим недоставленных", ["stream", "group"]
+)
+
+# Работающие потребители процесса - для метрик отставания
+_consumers = weakref.WeakSet()
+
+
+def closed_stream_key(interval: str) -> str:
+    return f"stream:candles:{interval}"
+
+
+def current_stream_key(interval: str) -> str:
+    return f"stream:candles_current:{interval}"
+
+
+def dead_letter_key(stream: str) -> str:
+    return f"{stream}:dead"
+
+
+def stream_id_ms(entry_id) -> int:
+    """
+    Время (мс) из идентификатора записи Redis Stream "1700000000000-0".
+    """
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    return int(entry_id.split("-", 1)[0])
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _consumer_lag(field: str) -> dict:
+    return {
+        (consumer.group, consumer.consumer, stream): item[field]
+        for consumer in list(_consumers)
+        for stream, item in consumer.last_lag.items()
+    }
+
+
+metrics.gauge(
+    "candle_stream_consumer_lag_ms", "Отставание потребителя от последней записи стрима, мс",
+    lambda: _consumer_lag("lag_ms"), ["group", "consumer", "stream"]
+)
+metrics.gauge(
+    "candle_stream_consumer_pending", "Неподтверждённых сообщений потребителя",
+    lambda: _consumer_lag("pending"), ["group", "consumer", "stream"]
+)
+
+
+class CandleStreamConsumer:
+    """
+    Потребитель свечей из Redis Streams в составе группы.
+    Клиент Redis должен быть создан с decode_responses=False:
+    в упакованном формате свеча передаётся байтами.
+    """
+
+    def __init__(self, client, group: str, consumer: str, intervals=("1m",), current: bool = False,
+                 count: int = 100, block_ms: int = 5000, claim_idle_ms: int = 60000, start_id: str = "$",
+                 max_deliveries: int = 5, dead_letter_maxlen: int = 10000):
+        self.client = client
+        self.group = group
+        self.consumer = consumer
+        self.streams = [closed_stream_key(interval) for interval in intervals]
+        if current:
+            self.streams += [current_stream_key(interval) for interval in intervals]
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.start_id = start_id
+        self.max_deliveries = max_deliveries
+        self.dead_letter_maxlen = dead_letter_maxlen
+        # Последний обработанный идентификатор по каждому стриму - для метрики отставания
+        self.last_acked = {}
+        # Последний результат lag() - его отдают метрики
+        self.last_lag = {}
+        # Курсоры по своим неподтверждённым сообщениям; стрим удаляется, когда они прочитаны
+        self._pending_cursors = {stream: "0" for stream in self.streams}
+
+    async def ensure_groups(self):
+        for stream in self.streams:
+            try:
+                await self.client.xgroup_create(stream, self.group, id=self.start_id, mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    def _decode(self, fields: dict):
+        symbol = _text(fields[b"symbol"])
+        interval = _text(fields[b"interval"])
+        return decode_stored_candle(fields[b"data"], symbol, interval)
+
+    async def read(self) -> list:
+        """
+        Возвращает список (stream, entry_id, candle).
+        После запуска сначала один раз проходятся неподтверждённые сообщения этого
+        потребителя (курсор сдвигается на последнюю отданную запись, так что
+        необработанное сообщение не перечитывается по кругу), затем - новые.
+        Повторные доставки необработанных сообщений - в claim_stale.
+        """
+        if self._pending_cursors:
+            ids = dict(self._pending_cursors)
+            block = None
+        else:
+            ids = {stream: ">" for stream in self.streams}
+            block = self.block_ms
+
+        response = await self.client.xreadgroup(self.group, self.consumer, ids, count=self.count, block=block)
+        result = []
+        returned = set()
+        for stream, entries in response or []:
+            stream = _text(stream)
+            for entry_id, fields in entries:
+                entry_id = _text(entry_id)
+                returned.add(stream)
+                if stream in self._pending_cursors:
+                    self._pending_cursors[stream] = entry_id
+                if not fields:
+                    # Сообщение удалено из стрима триммингом, но ещё числится в pending
+                    await self.client.xack(stream, self.group, entry_id)
+                    continue
+                result.append((stream, entry_id, self._decode(fields)))
+
+        if block is None:
+            # Стримы, по которым pending больше ничего не вернул, пройдены
+            for stream in list(self._pending_cursors):
+                if stream not in returned:
+                    del self._pending_cursors[stream]
+        return result
+
+    async def dead_letter_exhausted(self, stream: str, min_idle_ms: int, consumer: str = None) -> int:
+        """
+        Сообщения, доставленные max_deliveries раз и не подтверждённые дольше
+        min_idle_ms, переносит в стрим недоставленных и подтверждает.
+        """
+        pending = await self.client.xpending_range(
+            stream, self.group, min="-", max="+", count=self.count, consumername=consumer, idle=min_idle_ms
+        )
+        moved = 0
+        for item in pending:
+            if item["times_delivered"] < self.max_deliveries:
+                continue
+            entry_id = _text(item["message_id"])
+            entries = await self.client.xrange(stream, min=entry_id, max=entry_id)
+            if entries:
+                fields = dict(entries[0][1])
+                fields.update({
+                    b"source_id": entry_id,
+                    b"group": self.group,
+                    b"consumer": _text(item["consumer"]),
+                    b"deliveries": item["times_delivered"],
+                })
+                await self.client.xadd(
+                    dead_letter_key(stream), fields, maxlen=self.dead_letter_maxlen, approximate=True
+                )
+            await self.client.xack(stream, self.group, entry_id)
+            DEAD_LETTERS.labels(stream, self.group).inc()
+            moved += 1
+            logger.error(
+                f"Сообщение {entry_id} из {stream} не обработано за {item['times_delivered']} доставок, "
+                f"перенесено в {dead_letter_key(stream)}"
+            )
+        return moved
+
+    async def claim_stale(self) -> list:
+        """
+        Забирает сообщения группы (в том числе свои необработанные), не подтверждённые
+        дольше claim_idle_ms. Исчерпавшие max_deliveries сначала уходят в стрим недоставленных.
+        """
+        result = []
+        for stream in self.streams:
+            await self.dead_letter_exhausted(stream, self.claim_idle_ms)
+            response = await self.client.xautoclaim(
+                stream, self.group, self.consumer, self.claim_idle_ms, start_id="0-0", count=self.count
+            )
+            for entry_id, fields in response[1]:
+                if fields:
+                    result.append((stream, _text(entry_id), self._decode(fields)))
+        return result
+
+    async def ack(self, stream: str, entry_id: str):
+        await self.client.xack(stream, self.group, entry_id)
+        self.last_acked[stream] = entry_id
+
+    async def run(self, handler, claim_interval: float = 30.0, lag_interval: float = 15.0):
+        """
+        Бесконечный цикл: читает свечи и вызывает await handler(candle).
+        Сообщение подтверждается только после успешного выполнения handler.
+        Раз в lag_interval секунд обновляет метрики отставания.
+        """
+        await self.ensure_groups()
+        for stream in self.streams:
+            # Свои сообщения, исчерпавшие попытки до перезапуска, не перечитываем
+            await self.dead_letter_exhausted(stream, 0, consumer=self.consumer)
+        _consumers.add(self)
+        next_claim = time.monotonic() + claim_interval
+        next_lag = time.monotonic()
+        while True:
+            try:
+                entries = await self.read()
+                if time.monotonic() >= next_claim:
+                    entries += await self.claim_stale()
+                    next_claim = time.monotonic() + claim_interval
+            except Exception as e:
+                logger.error(f"Ошибка чтения стрима свечей: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for stream, entry_id, candle in entries:
+                try:
+                    await handler(candle)
+                except Exception as e:
+                    # Без XACK сообщение останется в pending и будет доставлено повторно через claim_stale
+                    logger.error(f"Ошибка обработки свечи {candle.symbol} из {stream}: {e}")
+                    continue
+                await self.ack(stream, entry_id)
+
+            if time.monotonic() >= next_lag:
+                next_lag = time.monotonic() + lag_interval
+                try:
+                    self.last_lag = await self.lag()
+                except Exception as e:
+                    logger.error(f"Ошибка расчёта отставания потребителя {self.consumer}: {e}")
+
+    async def lag(self) -> dict:
+        """
+        Отставание потребителя по каждому стриму: число неподтверждённых сообщений
+        и разница (мс) между последней записью в стриме и последней обработанной
+        (если обработанных ещё не было - самой старой неподтверждённой).
+        """
+        result = {}
+        for stream in self.streams:
+            info = await self.client.xinfo_stream(stream)
+            last_generated = info.get("last-generated-id") or info.get(b"last-generated-id")
+            pending = await self.client.xpending_range(
+                stream, self.group, min="-", max="+", count=1, consumername=self.consumer
+            )
+            summary = await self.client.xpending(stream, self.group)
+            consumers = {_text(c["name"]): c["pending"] for c in summary.get("consumers") or []}
+            reference = self.last_acked.get(stream) or (pending[0]["message_id"] if pending else None)
+            lag_ms = 0
+            if last_generated and reference:
+                lag_ms = max(0, stream_id_ms(last_generated) - stream_id_ms(reference))
+            result[stream] = {
+                "pending": consumers.get(self.consumer, 0),
+                "lag_ms": lag_ms,
+            }
+        return result
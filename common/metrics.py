@@ -0,0 +1,252 @@
+"""
+Лёгкие метрики в формате Prometheus без внешних зависимостей.
+
+На горячем пути - только инкремент счётчика или bisect по границам
+гистограммы; текст для Prometheus собирается при запросе /metrics.
+Значения, которые дешевле считать по запросу (глубина очереди и т.п.),
+регистрируются как gauge с функцией.
+
+Пример:
+    LATENCY = histogram("ingest_latency_seconds", "Задержка от времени биржи", ["stage"])
+    RECEIVE = LATENCY.labels("receive")
+    RECEIVE.observe(time.time() - event_time)
+    gauge("queue_depth", "Сообщений в очереди", pipeline.depth)
+    await start_metrics_server(9100)
+"""
+import asyncio
+import bisect
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Границы по умолчанию (секунды): от 1 мс до 30 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Последняя ячейка - всё, что больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля по границам ячеек (верхняя граница ячейки, куда попал квантиль).
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return self.buckets[i] if i < len(self.buckets) else math.inf
+        return math.inf
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Дочерняя метрика для набора значений меток. Её стоит получить один раз
+        и держать ссылку, чтобы не искать по словарю на каждом событии.
+        """
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> list:
+        lines = self._header()
+        for values, child in self._children.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> list:
+        lines = self._header()
+        names = self.labelnames + ("le",)
+        for values, child in self._children.items():
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                total += count
+                labels = _format_labels(names, values + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {total}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Значение считается при запросе: function() возвращает число
+    или словарь {значение метки (или кортеж значений): число}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def render(self) -> list:
+        lines = self._header()
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.error(f"Ошибка расчёта метрики {self.name}: {e}")
+            return lines
+        if isinstance(value, dict):
+            for key, item in value.items():
+                values = key if isinstance(key, tuple) else (key,)
+                lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(item)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом")
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames=(), registry: Registry = REGISTRY) -> Counter:
+    return registry._get_or_create(Counter, name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS,
+              registry: Registry = REGISTRY) -> Histogram:
+    return registry._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def gauge(name: str, documentation: str, function, labelnames=(), registry: Registry = REGISTRY) -> Gauge:
+    """
+    Регистрирует (или заменяет функцию у уже зарегистрированного) gauge.
+    """
+    metric = registry._get_or_create(Gauge, name, documentation, function, labelnames)
+    metric.function = function
+    return metric
+
+
+async def start_metrics_server(port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY):
+    """
+    Минимальный HTTP-сервер: на любой GET отдаёт метрики в текстовом формате Prometheus.
+    Возвращает asyncio.Server; при port <= 0 ничего не запускает.
+    """
+    if port <= 0:
+        return None
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Заголовки запроса не нужны - дочитываем до пустой строки
+            while True:
+                line = await reader.readline()
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+            body = registry.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Ошибка при отдаче метрик: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
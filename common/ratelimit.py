@@ -0,0 +1,156 @@
+"""
+Учёт веса запросов к Binance REST (лимиты одного IP).
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Binance USDS-M для одного IP: (лимит, окно в секундах)
+WEIGHT_LIMITS = {
+    # Общий вес запросов /fapi/*
+    "weight": (2400, 60),
+    # /futures/data/* считаются отдельно: 1000 запросов за 5 минут
+    "futures_data": (1000, 300),
+}
+
+# Стоимость запроса по каждому лимиту
+ENDPOINT_COSTS = {
+    "/fapi/v1/openInterest": {"weight": 1},
+    "/fapi/v1/exchangeInfo": {"weight": 1},
+    "/futures/data/openInterestHist": {"futures_data": 1},
+    "/fapi/v1/listenKey": {"weight": 1},
+    # Вес зависит от limit (см. LIMIT_WEIGHTS); здесь - для limit по умолчанию (500)
+    "/fapi/v1/klines": {"weight": 5},
+    # Ордера не расходуют вес IP - их ограничивают отдельные лимиты ордеров аккаунта
+    "/fapi/v1/order": {"weight": 0},
+}
+DEFAULT_COST = {"weight": 1}
+
+
+def klines_weight(limit: int) -> int:
+    """
+    Вес запроса /fapi/v1/klines по документации Binance зависит от limit.
+    """
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+# Эндпоинты, вес которых считается по параметру limit запроса
+LIMIT_WEIGHTS = {
+    "/fapi/v1/klines": klines_weight,
+}
+
+
+class TokenBucket:
+    """
+    Маркерная корзина: budget маркеров за period секунд равномерно,
+    с запасом на всплеск не более burst_seconds секунд.
+    """
+
+    def __init__(self, budget: float, period: float, burst_seconds: float = 5.0):
+        self.budget = budget
+        self.period = period
+        self.rate = budget / period
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """
+        Сколько ждать, пока в корзине наберётся cost маркеров (0 - можно сейчас).
+        """
+        self._refill(time.monotonic())
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        self.tokens -= cost
+
+    def limit_to(self, remaining: float):
+        """
+        Не даёт корзине выдать больше, чем осталось по данным сервера.
+        """
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, remaining)
+
+
+class WeightRateLimiter:
+    """
+    Общий ограничитель запросов к Binance REST (используется BinanceRestClient).
+
+    Каждый запрос перед отправкой берёт маркеры из корзин по стоимости своего
+    эндпоинта (ENDPOINT_COSTS), поэтому поток запросов распределяется равномерно
+    в пределах fraction от лимита, а не уходит пачкой. По заголовку
+    X-MBX-USED-WEIGHT-1M корзина веса подстраивается под фактический расход IP
+    (с учётом чужих запросов); при исчерпании бюджета запросы ждут начала
+    следующей минуты. На 429/418 все запросы приостанавливаются на Retry-After.
+    """
+
+    def __init__(self, limits: dict = None, fraction: float = 0.5, burst_seconds: float = 5.0):
+        self.limits = limits or WEIGHT_LIMITS
+        self.fraction = fraction
+        self.buckets = {
+            name: TokenBucket(limit * fraction, period, burst_seconds)
+            for name, (limit, period) in self.limits.items()
+        }
+        self.used_weight = 0
+        self.rate_limited = 0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def cost(path: str, params: dict = None) -> dict:
+        weight = LIMIT_WEIGHTS.get(path)
+        if weight is not None and params and "limit" in params:
+            return {"weight": weight(int(params["limit"]))}
+        return ENDPOINT_COSTS.get(path, DEFAULT_COST)
+
+    async def acquire(self, path: str, params: dict = None):
+        """
+        Ждёт, пока запрос к path с параметрами params можно отправить, не выходя за бюджет.
+        """
+        cost = self.cost(path, params)
+        # Под блокировкой запросы получают маркеры строго по очереди, без гонок
+        async with self._lock:
+            while True:
+                now = time.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                wait = max(self.buckets[name].wait_time(amount) for name, amount in cost.items())
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            for name, amount in cost.items():
+                self.buckets[name].take(amount)
+
+    def calibrate(self, headers):
+        """
+        Учитывает X-MBX-USED-WEIGHT-1M из ответа.
+        """
+        used = headers.get("X-MBX-USED-WEIGHT-1M")
+        bucket = self.buckets.get("weight")
+        if used is None or bucket is None:
+            return
+        self.used_weight = int(used)
+        remaining = bucket.budget - self.used_weight
+        if remaining <= 0:
+            # Бюджет этой минуты выбран - ждём начала следующей
+            now = time.time()
+            self._paused_until = max(self._paused_until, (int(now // 60) + 1) * 60)
+        bucket.limit_to(max(remaining, 0))
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.time() + seconds)
@@ -0,0 +1,190 @@
+"""
+Запись и воспроизведение WebSocket-фидов Binance.
+
+FrameRecorder дописывает сырые кадры с временем получения в сжатый gzip-файл
+(одна строка на кадр: "<unix time с>\\t<кадр>"). Файл только дописывается:
+каждый сброс буфера добавляет законченный gzip-член, gzip.open читает их
+подряд. Если процесс завершился без close(), теряются только кадры после
+последнего сброса, а read_frames останавливается на оборванном хвосте.
+
+ReplayServer отдаёт записанные кадры по локальному WebSocket со скоростью 1x,
+Nx или максимальной (speed=0). URL подключения повторяет Binance:
+/stream?streams=a@kline_1m/b@kline_1m отдаёт только эти потоки (SUBSCRIBE и
+UNSUBSCRIBE поддерживаются), любой другой путь (например /ws/<listenKey>) - все кадры.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import re
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+_EVENT_TIME = re.compile(r'"E":\d+')
+
+
+def _stream_name(frame: str) -> str:
+    start = frame.find('"stream":"')
+    if start == -1:
+        return ""
+    start += len('"stream":"')
+    return frame[start:frame.find('"', start)]
+
+
+class FrameRecorder:
+    """
+    Пишет кадры в path. write() синхронный и только буферизует; буфер сжимается
+    в отдельный gzip-член и дописывается на диск не реже раза в flush_interval секунд
+    или при накоплении max_buffer байт.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0, compresslevel: int = 1, max_buffer: int = 1 << 20):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.compresslevel = compresslevel
+        self._file = open(path, "ab")
+        self._buffer = []
+        self._buffered = 0
+        self._flushed_at = time.monotonic()
+        self.frames = 0
+
+    def write(self, frame, received_at: float = None):
+        if isinstance(frame, bytes):
+            frame = frame.decode()
+        if received_at is None:
+            received_at = time.time()
+        line = f"{received_at:.6f}\t{frame}\n".encode()
+        self._buffer.append(line)
+        self._buffered += len(line)
+        self.frames += 1
+        if self._buffered >= self.max_buffer or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        if not self._buffer or self._file.closed:
+            return
+        data = b"".join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+        self._file.write(gzip.compress(data, compresslevel=self.compresslevel))
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+def read_frames(path: str):
+    """
+    Генератор (время получения, кадр) в порядке записи. Оборванный хвост файла
+    (запись прервана посреди gzip-члена) пропускается, прочитанные кадры остаются.
+    """
+    with gzip.open(path, "rt") as file:
+        try:
+            for line in file:
+                if not line.endswith("\n"):
+                    # Незаконченная строка в конце файла
+                    break
+                received_at, _, frame = line.rstrip("\n").partition("\t")
+                if frame:
+                    yield float(received_at), frame
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            logger.warning(f"Запись {path} оборвана, остаток файла пропущен: {e}")
+
+
+class ReplayServer:
+    """
+    speed - множитель скорости воспроизведения относительно записи, 0 - без пауз.
+    loop - воспроизводить файл по кругу.
+    rewrite_event_time - подставлять в поле "E" текущее время отправки, чтобы
+    задержку на стороне сервиса можно было считать от момента воспроизведения.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False, rewrite_event_time: bool = True):
+        self.frames = list(read_frames(path))
+        self.speed = speed
+        self.loop = loop
+        self.rewrite_event_time = rewrite_event_time
+        self.sent = 0
+        self.clients = 0
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        self._server = await websockets.serve(self._handle, host, port, max_size=None)
+        logger.info(f"Воспроизведение {len(self.frames)} кадров на ws://{host}:{port} (скорость {self.speed or 'max'})")
+        return self._server
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    @staticmethod
+    def _requested_streams(path: str):
+        parts = urlsplit(path or "")
+        if not parts.path.rstrip("/").endswith("/stream"):
+            return None
+        streams = parse_qs(parts.query).get("streams", [""])[0]
+        return set(filter(None, streams.split("/")))
+
+    async def _control(self, ws, streams: set):
+        # Ответы на SUBSCRIBE/UNSUBSCRIBE в формате Binance
+        async for message in ws:
+            try:
+                request = json.loads(message)
+                params = request.get("params", [])
+                if request.get("method") == "SUBSCRIBE":
+                    streams.update(params)
+                elif request.get("method") == "UNSUBSCRIBE":
+                    streams.difference_update(params)
+                await ws.send(json.dumps({"result": None, "id": request.get("id")}))
+            except Exception as e:
+                logger.error(f"Ошибка управляющего сообщения: {e}")
+
+    async def _handle(self, ws, path: str = None):
+        if path is None:
+            request = getattr(ws, "request", None)
+            path = request.path if request is not None else getattr(ws, "path", "")
+        streams = self._requested_streams(path)
+        control = asyncio.create_task(self._control(ws, streams if streams is not None else set()))
+        self.clients += 1
+        try:
+            await self._send_frames(ws, streams)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients -= 1
+            control.cancel()
+
+    async def _send_frames(self, ws, streams):
+        while True:
+            started = time.monotonic()
+            first = self.frames[0][0] if self.frames else 0.0
+            for received_at, frame in self.frames:
+                if streams is not None and _stream_name(frame) not in streams:
+                    continue
+                if self.speed:
+                    delay = (received_at - first) / self.speed - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if self.rewrite_event_time:
+                    frame = _EVENT_TIME.sub(f'"E":{int(time.time() * 1000)}', frame, count=1)
+                await ws.send(frame)
+                self.sent += 1
+                if not self.speed and self.sent % 1000 == 0:
+                    # Без пауз send может не уступать управление - даём поработать другим задачам
+                    await asyncio.sleep(0)
+            if not self.loop:
+                break
+            await asyncio.sleep(0)
+        await ws.close()
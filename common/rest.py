@@ -0,0 +1,340 @@
+"""
+Общий асинхронный клиент Binance REST для всех сервисов.
+
+- одна aiohttp-сессия с пулом keep-alive соединений и кэшем DNS;
+- повторы с экспоненциальной задержкой и случайным разбросом (full jitter)
+  на сетевые ошибки, таймауты и 5xx; POST повторяется только если запрос
+  заведомо не ушёл (соединение не установлено), чтобы не продублировать ордер;
+- предохранитель (circuit breaker) на каждый хост: после breaker_threshold
+  ошибок подряд запросы сразу отклоняются breaker_reset секунд, затем
+  пропускается один пробный;
+- учёт веса эндпоинтов через WeightRateLimiter (ожидание бюджета, подстройка
+  по X-MBX-USED-WEIGHT-1M, пауза на Retry-After при 429/418);
+- объединение одинаковых GET: пока запрос в полёте, повторные вызовы с тем же
+  URL и параметрами ждут его ответ, а не идут в сеть.
+
+Пример:
+    async with BinanceRestClient("https://fapi.binance.com", rate_limiter=WeightRateLimiter()) as client:
+        data = await client.get("/fapi/v1/openInterest", {"symbol": "BTCUSDT"})
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import random
+import time
+from urllib.parse import urlencode, urlsplit
+
+import aiohttp
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = metrics.counter("binance_rest_requests_total", "Запросов к Binance REST по результату", ["endpoint", "status"])
+REQUEST_SECONDS = metrics.histogram("binance_rest_request_seconds", "Длительность одной попытки запроса к Binance REST", ["endpoint"])
+WEIGHT_USED = metrics.counter("binance_rest_weight_total", "Израсходованный вес по эндпоинтам", ["endpoint"])
+COALESCED = metrics.counter("binance_rest_coalesced_total", "GET, получивших ответ уже идущего запроса", ["endpoint"])
+RETRIES = metrics.counter("binance_rest_retries_total", "Повторов запросов к Binance REST", ["endpoint"])
+
+
+class BinanceAPIError(Exception):
+    """
+    Ответ Binance с ошибкой (4xx/5xx). code и msg - из тела ответа, если оно есть.
+    """
+
+    def __init__(self, status: int, code=None, msg: str = ""):
+        super().__init__(f"HTTP {status}, code={code}: {msg}")
+        self.status = status
+        self.code = code
+        self.msg = msg
+
+
+class RateLimitError(BinanceAPIError):
+    """
+    Binance вернул 429/418 и попытки исчерпаны.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    Предохранитель хоста разомкнут - запрос не отправлялся.
+    """
+
+
+def sign(params: dict, secret: str) -> str:
+    """
+    HMAC SHA256 подпись строки параметров запроса.
+    """
+    return hmac.new(secret.encode("utf-8"), urlencode(params).encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class CircuitBreaker:
+    """
+    closed - запросы идут; после threshold ошибок подряд - open на reset_timeout
+    секунд; затем half-open: один пробный запрос, успех замыкает, ошибка снова размыкает.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def abandon(self):
+        """
+        Пробный запрос прерван без исхода (отмена, в том числе в ожидании
+        ограничителя): следующий запрос снова может стать пробным.
+        """
+        self._probe = False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    def failure(self):
+        self.failures += 1
+        if self._probe or self.failures >= self.threshold:
+            if self.opened_at is None or self._probe:
+                logger.warning(f"Предохранитель разомкнут после {self.failures} ошибок подряд")
+            self.opened_at = time.monotonic()
+            self._probe = False
+
+
+class _Retry(Exception):
+    """
+    Внутренний сигнал: попытка не удалась, но запрос можно повторить.
+    """
+
+    def __init__(self, error: Exception, delay: float = None):
+        super().__init__(str(error))
+        self.error = error
+        self.delay = delay
+
+
+class BinanceRestClient:
+    def __init__(self, base_url: str = "https://fapi.binance.com", api_key: str = None, api_secret: str = None,
+                 rate_limiter=None, concurrency: int = 20, timeout: float = 30, ttl_dns_cache: int = 300,
+                 keepalive_timeout: float = 60, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 10.0, breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 coalesce: bool = True, recv_window: int = 5000):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.coalesce = coalesce
+        self.recv_window = recv_window
+        self.breakers = {}
+        self._inflight = {}
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Сессия создаётся при первом обращении - внутри работающего цикла событий.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        self.session
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def _url(self, path: str) -> str:
+        return path if "://" in path else f"{self.base_url}{path}"
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def get(self, path: str, params: dict = None, signed: bool = False, api_key: bool = False,
+                  coalesce: bool = None):
+        """
+        GET с разбором JSON. Одинаковые неподписанные GET в полёте объединяются.
+        """
+        coalesce = self.coalesce if coalesce is None else coalesce
+        if not coalesce or signed:
+            return await self.request("GET", path, params, signed=signed, api_key=api_key)
+        key = (self._url(path), tuple(sorted((params or {}).items())), api_key)
+        future = self._inflight.get(key)
+        if future is not None:
+            COALESCED.labels(urlsplit(key[0]).path).inc()
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self.request("GET", path, params, api_key=api_key)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим; без них не должно попасть в лог как «не извлечённое»
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def post(self, path: str, params: dict = None, signed: bool = False, api_key: bool = False):
+        return await self.request("POST", path, params, signed=signed, api_key=api_key)
+
+    async def put(self, path: str, params: dict = None, signed: bool = False, api_key: bool = False):
+        return await self.request("PUT", path, params, signed=signed, api_key=api_key)
+
+    async def delete(self, path: str, params: dict = None, signed: bool = False, api_key: bool = False):
+        return await self.request("DELETE", path, params, signed=signed, api_key=api_key)
+
+    async def request(self, method: str, path: str, params: dict = None, signed: bool = False,
+                      api_key: bool = False):
+        """
+        Запрос с учётом веса, предохранителя и повторов. Возвращает разобранный JSON,
+        ошибки Binance - BinanceAPIError (RateLimitError при исчерпании попыток на 429/418).
+        """
+        url = self._url(path)
+        endpoint = urlsplit(url).path
+        breaker = self.breaker(url)
+        headers = {"X-MBX-APIKEY": self.api_key} if (api_key or signed) and self.api_key else None
+        last_error = None
+        for attempt in range(1, self.max_retries + 1):
+            # Пробный запрос полуоткрытого предохранителя - только этот
+            probe = breaker.state == "half-open"
+            if not breaker.allow():
+                REQUESTS.labels(endpoint, "circuit_open").inc()
+                raise CircuitOpenError(f"Предохранитель {urlsplit(url).netloc} разомкнут, {method} {endpoint} не отправлен")
+            request_params = dict(params or {})
+            if signed:
+                # Метка времени и подпись - заново на каждую попытку
+                request_params.setdefault("recvWindow", self.recv_window)
+                request_params["timestamp"] = int(time.time() * 1000)
+                request_params["signature"] = sign(request_params, self.api_secret)
+            try:
+                return await self._attempt(method, url, endpoint, request_params, headers, breaker)
+            except _Retry as retry:
+                last_error = retry
+            finally:
+                if probe:
+                    # После success()/failure() ничего не меняет; при отмене или
+                    # непредвиденной ошибке иначе хост остался бы закрыт до перезапуска
+                    breaker.abandon()
+            if attempt == self.max_retries:
+                break
+            RETRIES.labels(endpoint).inc()
+            delay = last_error.delay if last_error.delay is not None else self._backoff(attempt)
+            logger.warning(
+                f"{method} {endpoint}: {last_error.error}, повтор через {delay:.2f} с "
+                f"(попытка {attempt}/{self.max_retries})"
+            )
+            await asyncio.sleep(delay)
+        raise last_error.error
+
+    async def _attempt(self, method: str, url: str, endpoint: str, params: dict, headers, breaker: CircuitBreaker):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(endpoint, params)
+        started = time.monotonic()
+        try:
+            async with self.session.request(method, url, params=params, headers=headers) as response:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.calibrate(response.headers)
+                    for amount in self.rate_limiter.cost(endpoint, params).values():
+                        WEIGHT_USED.labels(endpoint).inc(amount)
+                status = response.status
+                REQUESTS.labels(endpoint, str(status)).inc()
+                if status < 400:
+                    breaker.success()
+                    return await response.json(content_type=None)
+                error = await self._api_error(response)
+        except aiohttp.ClientConnectorError as e:
+            # Соединение не установлено - запрос не ушёл, повтор безопасен и для POST
+            REQUESTS.labels(endpoint, "network").inc()
+            breaker.failure()
+            raise _Retry(e)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            REQUESTS.labels(endpoint, "network").inc()
+            breaker.failure()
+            if method == "POST":
+                raise
+            raise _Retry(e)
+        finally:
+            REQUEST_SECONDS.labels(endpoint).observe(time.monotonic() - started)
+
+        if status in (418, 429):
+            # Хост отвечает - это не отказ для предохранителя, паузу держит ограничитель
+            breaker.success()
+            retry_after = float(response.headers.get("Retry-After", "60"))
+            if self.rate_limiter is not None:
+                self.rate_limiter.rate_limited += 1
+                self.rate_limiter.pause(retry_after)
+            logger.warning(f"Binance ограничил запросы (HTTP {status}), пауза {retry_after} с")
+            # Ожидание паузы - в acquire ограничителя; без него ждём здесь
+            raise _Retry(RateLimitError(status, error.code, error.msg), 0 if self.rate_limiter is not None else retry_after)
+        if status >= 500:
+            breaker.failure()
+            if method == "POST":
+                raise error
+            raise _Retry(error)
+        # Прочие 4xx - ошибка запроса, а не хоста: предохранитель не трогаем и не повторяем
+        breaker.success()
+        raise error
+
+    @staticmethod
+    async def _api_error(response) -> BinanceAPIError:
+        text = await response.text()
+        try:
+            body = await response.json(content_type=None)
+        except Exception:
+            body = None
+        if isinstance(body, dict):
+            return BinanceAPIError(response.status, body.get("code"), body.get("msg", text))
+        return BinanceAPIError(response.status, None, text)
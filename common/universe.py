@@ -0,0 +1,107 @@
+"""
+Список торгуемых символов (universe) вместо зашитого в код strems.py.
+
+Источники по приоритету:
+1. Redis-множество universe:symbols - если задано вручную, используется как есть;
+2. закэшированный снимок exchangeInfo (universe:exchange_info, с TTL);
+3. свежий запрос /fapi/v1/exchangeInfo (результат кладётся в кэш);
+4. запасной список, переданный при создании (например, из strems.py).
+
+По умолчанию (all_symbols=False) символы exchangeInfo (2, 3) сужаются до
+запасного списка: набор остаётся прежним курируемым strems.py, а из него
+выпадают только символы, которые больше не торгуются. all_symbols=True -
+все бессрочные USDT-контракты в статусе TRADING.
+"""
+import json
+import logging
+
+from common.rest import BinanceRestClient
+
+logger = logging.getLogger(__name__)
+
+UNIVERSE_KEY = "universe:symbols"
+EXCHANGE_INFO_CACHE_KEY = "universe:exchange_info"
+EXCHANGE_INFO_PATH = "/fapi/v1/exchangeInfo"
+
+
+def symbol_from_stream(stream: str) -> str:
+    """
+    "btcusdt@kline_1m" -> "BTCUSDT"
+    """
+    return stream.split("@")[0].upper()
+
+
+def stream_for(symbol: str, kind: str = "kline_1m") -> str:
+    """
+    "BTCUSDT" -> "btcusdt@kline_1m"
+    """
+    return f"{symbol.lower()}@{kind}"
+
+
+def symbols_from_exchange_info(info: dict, quote_asset: str = "USDT") -> list:
+    """
+    Бессрочные контракты в статусе TRADING с нужной валютой котировки.
+    """
+    return sorted(
+        item["symbol"]
+        for item in info.get("symbols", [])
+        if item.get("contractType") == "PERPETUAL"
+        and item.get("status") == "TRADING"
+        and item.get("quoteAsset") == quote_asset
+    )
+
+
+class UniverseLoader:
+    """
+    redis_client - клиент redis.asyncio с decode_responses=True,
+    client - общий BinanceRestClient сервиса (запрос exchangeInfo идёт
+    с его повторами и учётом веса), all_symbols - не сужать exchangeInfo
+    до fallback.
+    """
+
+    def __init__(self, redis_client, client: BinanceRestClient, cache_ttl: int = 3600, fallback=(),
+                 all_symbols: bool = False):
+        self.redis = redis_client
+        self.client = client
+        self.cache_ttl = cache_ttl
+        self.fallback = sorted(fallback)
+        self.all_symbols = all_symbols
+        self.last = None
+
+    def _restrict(self, symbols: list) -> list:
+        if self.all_symbols or not self.fallback:
+            return symbols
+        curated = set(self.fallback)
+        return [symbol for symbol in symbols if symbol in curated]
+
+    async def fetch_exchange_info_symbols(self) -> list:
+        return symbols_from_exchange_info(await self.client.get(EXCHANGE_INFO_PATH))
+
+    async def _load(self) -> list:
+        manual = await self.redis.smembers(UNIVERSE_KEY)
+        if manual:
+            return sorted(manual)
+
+        cached = await self.redis.get(EXCHANGE_INFO_CACHE_KEY)
+        if cached:
+            return self._restrict(json.loads(cached))
+
+        symbols = await self.fetch_exchange_info_symbols()
+        if symbols:
+            # В кэше - полный список биржи, сужение - у каждого читателя своё
+            await self.redis.set(EXCHANGE_INFO_CACHE_KEY, json.dumps(symbols), ex=self.cache_ttl)
+        return self._restrict(symbols)
+
+    async def load(self) -> list:
+        """
+        Актуальный список символов. При ошибке возвращается последний
+        успешно загруженный список, а до первой успешной загрузки - запасной.
+        """
+        try:
+            symbols = await self._load()
+            if symbols:
+                self.last = symbols
+                return symbols
+        except Exception as e:
+            logger.error(f"Не удалось загрузить список символов: {e}")
+        return list(self.last or self.fallback)
@@ -0,0 +1,177 @@
+from common.candle import Candle
+
+MINUTE_MS = 60_000
+
+# Длительность интервалов Binance в миллисекундах
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 180_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1h": 3_600_000,
+    "2h": 7_200_000,
+    "4h": 14_400_000,
+    "6h": 21_600_000,
+    "8h": 28_800_000,
+    "12h": 43_200_000,
+    "1d": 86_400_000,
+}
+
+
+class _Bucket:
+    """
+    Свёртка закрытых минутных баров внутри одной свечи старшего таймфрейма.
+    """
+    __slots__ = (
+        "start_time", "open", "high", "low", "close", "volume", "number_of_trades",
+        "quote_volume", "taker_buy_base_volume", "taker_buy_quote_volume",
+        "first_trade_id", "last_trade_id", "last_start", "bars", "complete"
+    )
+
+    def __init__(self, start_time: int):
+        self.start_time = start_time
+        self.bars = 0
+        self.last_start = -1
+        # False, если в свёртке не хватает минутных баров интервала
+        self.complete = True
+
+    def expected_start(self) -> int:
+        # Начало следующего минутного бара, который должен прийти без пропуска
+        return self.start_time if self.bars == 0 else self.last_start + MINUTE_MS
+
+    def fold(self, candle: Candle):
+        if self.bars == 0:
+            self.open = candle.open
+            self.high = candle.high
+            self.low = candle.low
+            self.volume = candle.volume
+            self.number_of_trades = candle.number_of_trades
+            self.quote_volume = candle.quote_volume
+            self.taker_buy_base_volume = candle.taker_buy_base_volume
+            self.taker_buy_quote_volume = candle.taker_buy_quote_volume
+            self.first_trade_id = candle.first_trade_id
+        else:
+            self.high = max(self.high, candle.high)
+            self.low = min(self.low, candle.low)
+            self.volume += candle.volume
+            self.number_of_trades += candle.number_of_trades
+            self.quote_volume += candle.quote_volume
+            self.taker_buy_base_volume += candle.taker_buy_base_volume
+            self.taker_buy_quote_volume += candle.taker_buy_quote_volume
+        self.close = candle.close
+        self.last_trade_id = candle.last_trade_id
+        self.last_start = candle.start_time
+        self.bars += 1
+
+    def to_candle(self, symbol: str, interval: str, size: int, is_closed: bool, partial: Candle = None) -> Candle:
+        """
+        Свеча старшего таймфрейма; partial - ещё не закрытый минутный бар,
+        который добавляется к свёртке без её изменения.
+        """
+        if self.bars == 0:
+            return Candle(
+                self.start_time, self.start_time + size - 1, symbol, interval,
+                partial.first_trade_id, partial.last_trade_id,
+                partial.open, partial.close, partial.high, partial.low, partial.volume,
+                partial.number_of_trades, is_closed, partial.quote_volume,
+                partial.taker_buy_base_volume, partial.taker_buy_quote_volume
+            )
+        if partial is None:
+            return Candle(
+                self.start_time, self.start_time + size - 1, symbol, interval,
+                self.first_trade_id, self.last_trade_id,
+                self.open, self.close, self.high, self.low, self.volume,
+                self.number_of_trades, is_closed, self.quote_volume,
+                self.taker_buy_base_volume, self.taker_buy_quote_volume
+            )
+        return Candle(
+            self.start_time, self.start_time + size - 1, symbol, interval,
+            self.first_trade_id, partial.last_trade_id,
+            self.open, partial.close, max(self.high, partial.high), min(self.low, partial.low),
+            self.volume + partial.volume, self.number_of_trades + partial.number_of_trades, is_closed,
+            self.quote_volume + partial.quote_volume,
+            self.taker_buy_base_volume + partial.taker_buy_base_volume,
+            self.taker_buy_quote_volume + partial.taker_buy_quote_volume
+        )
+
+
+class TimeframeAggregator:
+    """
+    Инкрементально строит свечи старших таймфреймов из минутного потока.
+
+    Закрытые минутные бары сворачиваются в текущую свечу каждого таймфрейма,
+    незакрытый бар только добавляется к свёртке при выдаче текущей свечи,
+    поэтому обработка одного сообщения стоит O(1) на таймфрейм.
+    Свеча таймфрейма считается закрытой, когда закрывается последний минутный
+    бар её интервала (или когда приходит бар уже следующего интервала).
+    Начало последней закрытой свечи запоминается: повторы минутных баров
+    закрытого интервала (например, перекрытие догрузки после переподключения)
+    не открывают его заново.
+
+    Неполная свеча - старт сервиса посреди интервала, пропуск минутного бара
+    или потеря последнего бара интервала - не выдаётся ни текущей, ни
+    закрытой: её объём и цена открытия были бы неверными. Такие интервалы
+    учитываются в счётчике incomplete. Пропуски после переподключения
+    закрывает догрузка 1m-баров через REST (backfill.py), которая проходит
+    через агрегатор раньше новых сообщений.
+    """
+
+    def __init__(self, intervals=("5m", "15m", "1h")):
+        self.intervals = [(interval, INTERVAL_MS[interval]) for interval in intervals]
+        self._buckets = {}
+        # (symbol, interval) -> start_time последней закрытой свечи
+        self._closed = {}
+        # Интервалов, отброшенных из-за недостающих минутных баров
+        self.incomplete = 0
+
+    def on_candle(self, candle: Candle) -> list:
+        """
+        Принимает минутную свечу и возвращает свечи старших таймфреймов,
+        которые нужно записать: закрытые и текущие. Бары других интервалов игнорируются.
+        """
+        if candle.interval != "1m":
+            return []
+        result = []
+        for interval, size in self.intervals:
+            start = candle.start_time - candle.start_time % size
+            key = (candle.symbol, interval)
+            if start <= self._closed.get(key, -1):
+                # Бар из уже закрытого интервала - игнорируем
+                continue
+            bucket = self._buckets.get(key)
+
+            if bucket is None or bucket.start_time != start:
+                if bucket is not None and bucket.start_time > start:
+                    # Бар из уже закрытого интервала - игнорируем
+                    continue
+                if bucket is not None:
+                    # Последний минутный бар прошлого интервала потерян - свеча неполная
+                    self._closed[key] = bucket.start_time
+                    self.incomplete += 1
+                bucket = _Bucket(start)
+                self._buckets[key] = bucket
+
+            if candle.is_closed and candle.start_time <= bucket.last_start:
+                # Повтор уже учтённого бара
+                continue
+            if candle.start_time > bucket.expected_start():
+                # Старт посреди интервала или пропуск минутного бара
+                bucket.complete = False
+
+            if not candle.is_closed:
+                if bucket.complete:
+                    result.append(bucket.to_candle(candle.symbol, interval, size, False, candle))
+                continue
+
+            bucket.fold(candle)
+            if candle.close_time + 1 >= start + size:
+                if bucket.complete:
+                    result.append(bucket.to_candle(candle.symbol, interval, size, True))
+                else:
+                    self.incomplete += 1
+                self._closed[key] = start
+                del self._buckets[key]
+            elif bucket.complete:
+                result.append(bucket.to_candle(candle.symbol, interval, size, False))
+        return result
@@ -1,77 +1,350 @@
 from os import getenv
 import asyncio
-import websockets
-import json
+import functools
+import multiprocessing
+import time
+import zlib
 import redis.asyncio as redis
 from strems import streams
 import logging
-from redis_client import RedisClient
+from redis_client import RedisClient, CandleBatchWriter, parse_retention
+from pipeline import MessagePipeline, INGEST_LATENCY, extract_event_time
+from common.candle import decode_kline
+from ringbuffer import CandleRingBuffer
+from store_api import start_store_server
+from aggregator import TimeframeAggregator
+from backfill import CloseTimeTracker, GapRetrier, KlineBackfiller
+from connections import ConnectionManager
+from common.universe import UniverseLoader, stream_for, symbol_from_stream
+from common.ratelimit import WeightRateLimiter
+from common.rest import BinanceRestClient
+from common import metrics
+from common.replay import FrameRecorder
 
 REDIS_HOST = getenv("REDIS_HOST")
 REDIS_PORT = getenv("REDIS_PORT")
 REDIS_PASSWORD = getenv("REDIS_PASSWORD")
 
+# Шардирование: потоки раскладываются по KLINE_SHARDS независимым соединениям,
+# при KLINE_SHARD_PROCESSES=1 каждый шард работает в своём процессе
+KLINE_SHARDS = int(getenv("KLINE_SHARDS", "1"))
+KLINE_SHARD_PROCESSES = getenv("KLINE_SHARD_PROCESSES", "0") == "1"
+RECONNECT_BASE_DELAY = float(getenv("RECONNECT_BASE_DELAY", "1"))
+RECONNECT_MAX_DELAY = float(getenv("RECONNECT_MAX_DELAY", "60"))
+
+# Список символов: обновляется на лету (SUBSCRIBE/UNSUBSCRIBE), не больше
+# MAX_STREAMS_PER_CONNECTION потоков на соединение, остальные - в новые соединения
+UNIVERSE_REFRESH_INTERVAL = int(getenv("UNIVERSE_REFRESH_INTERVAL", "60"))
+MAX_STREAMS_PER_CONNECTION = int(getenv("MAX_STREAMS_PER_CONNECTION", "200"))
+KLINE_STREAM_KIND = getenv("KLINE_STREAM_KIND", "kline_1m")
+UNIVERSE_CACHE_TTL = int(getenv("UNIVERSE_CACHE_TTL", "3600"))
+# 0 - символы exchangeInfo только из курируемого strems.py (без снятых с торгов),
+# 1 - все бессрочные USDT-контракты в статусе TRADING
+UNIVERSE_ALL_SYMBOLS = getenv("UNIVERSE_ALL_SYMBOLS", "0") == "1"
+
+# Конвейер обработки: фиксированный пул воркеров с ограниченными очередями
+PIPELINE_WORKERS = int(getenv("PIPELINE_WORKERS", "8"))
+PIPELINE_QUEUE_SIZE = int(getenv("PIPELINE_QUEUE_SIZE", "1000"))
+PIPELINE_DROP_WHEN_FULL = getenv("PIPELINE_DROP_WHEN_FULL", "0") == "1"
+STATS_INTERVAL = int(getenv("STATS_INTERVAL", "60"))
+
+# Окно накопления записей в Redis; 0 - писать каждую свечу сразу
+REDIS_FLUSH_INTERVAL_MS = int(getenv("REDIS_FLUSH_INTERVAL_MS", "50"))
+
+# Формат закрытых свечей в candles:{symbol}:{interval}: json или packed,
+# и глубина хранения по интервалам, например "1m:1440,5m:288"
+CANDLE_ENCODING = getenv("CANDLE_ENCODING", "json")
+CANDLE_RETENTION = parse_retention(getenv("CANDLE_RETENTION", ""))
+
+# Публикация свечей в Redis Streams (stream:candles:{interval}): MAXLEN стрима, 0 - отключено.
+# Текущие свечи публикуются в stream:candles_current:{interval} не чаще раза в интервал на символ
+STREAM_MAXLEN = int(getenv("STREAM_MAXLEN", "10000"))
+STREAM_CURRENT_INTERVAL_MS = int(getenv("STREAM_CURRENT_INTERVAL_MS", "0"))
+
+# Глубина кольцевого буфера свечей в памяти (баров на символ); 0 - не вести буфер
+RING_BUFFER_SIZE = int(getenv("RING_BUFFER_SIZE", "1440"))
+# HTTP-доступ стратегий к буферу (бары и индикаторы, см. store_api.py); 0 - отключено.
+# В режиме процессов шард N слушает STORE_API_PORT + N
+STORE_API_PORT = int(getenv("STORE_API_PORT", "9201"))
+STORE_API_HOST = getenv("STORE_API_HOST", "127.0.0.1")
+
+# Старшие таймфреймы, которые строятся локально из минутного потока, например "5m,15m,1h"
+AGGREGATE_INTERVALS = [i.strip() for i in getenv("AGGREGATE_INTERVALS", "").split(",") if i.strip()]
+
+# Догрузка пропущенных свечей через REST после переподключения
+BACKFILL_ENABLED = getenv("BACKFILL_ENABLED", "1") == "1"
+BACKFILL_CONCURRENCY = int(getenv("BACKFILL_CONCURRENCY", "10"))
+# Пропуск, не догруженный при подключении, догружается в фоне (поток при этом читается):
+# задержка от BACKFILL_RETRY_DELAY до BACKFILL_RETRY_MAX_DELAY с, не больше
+# BACKFILL_MAX_ATTEMPTS попыток (0 - без ограничения), затем пропуск остаётся в логе и метриках
+BACKFILL_RETRY_DELAY = float(getenv("BACKFILL_RETRY_DELAY", "5"))
+BACKFILL_RETRY_MAX_DELAY = float(getenv("BACKFILL_RETRY_MAX_DELAY", "300"))
+BACKFILL_MAX_ATTEMPTS = int(getenv("BACKFILL_MAX_ATTEMPTS", "10"))
+BINANCE_FAPI_URL = getenv("BINANCE_FAPI_URL", "https://fapi.binance.com")
+# Доля лимита веса Binance на весь сервис (в режиме процессов делится между шардами)
+RATE_LIMIT_FRACTION = float(getenv("RATE_LIMIT_FRACTION", "0.5"))
+
+WS_BASE_URL = getenv("BINANCE_WS_URL", "wss://fstream.binance.com/stream")
+
+# Запись сырых кадров WebSocket в gzip-файл для воспроизведения (bench/); пусто - не писать.
+# В режиме процессов путь должен содержать {shard}, например /data/kline.{shard}.gz
+WS_RECORD_PATH = getenv("WS_RECORD_PATH", "")
+
+# Порт HTTP-эндпоинта метрик Prometheus (/metrics); 0 - отключено.
+# В режиме процессов шард N слушает METRICS_PORT + N
+METRICS_PORT = int(getenv("METRICS_PORT", "9101"))
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PARSE_LATENCY = INGEST_LATENCY.labels("parse")
 
-def rename_candle_keys(raw_candle: dict) -> dict:
-    return {
-        "start_time": raw_candle.get("t"),
-        "close_time": raw_candle.get("T"),
-        "symbol": raw_candle.get("s"),
-        "interval": raw_candle.get("i"),
-        "first_trade_id": raw_candle.get("f"),
-        "last_trade_id": raw_candle.get("L"),
-        "open": raw_candle.get("o"),
-        "close": raw_candle.get("c"),
-        "high": raw_candle.get("h"),
-        "low": raw_candle.get("l"),
-        "volume": raw_candle.get("v"),
-        "number_of_trades": raw_candle.get("n"),
-        "is_closed": raw_candle.get("x"),
-        "quote_volume": raw_candle.get("q"),
-        "taker_buy_base_volume": raw_candle.get("V"),
-        "taker_buy_quote_volume": raw_candle.get("Q")
-    }
-
-async def process_message(message: str, redis_client: RedisClient):
-    
-    try:
-        data = json.loads(message)
-        raw_candle = data['data']['k']
-        candle = rename_candle_keys(raw_candle)
-        
-        if candle["is_closed"]:
-            await redis_client.save_closed_candle_in_list(candle)
-        else:
-            await redis_client.save_current_candle(candle)
-    except Exception as e:
-        logger.error(f"Ошибка при обработке сообщения: {e}")
-
-async def receive_messages(ws, redis_client: RedisClient):
-    async for message in ws:
-        # Создаем отдельную задачу для обработки сообщения
-        asyncio.create_task(process_message(message, redis_client))
 
-async def subscribe_kline_streams():
-    # url = "wss://fstream.binance.com/stream?streams=btcusdt@kline_5m/cosusdt@kline_5m"
-    # Формируем URL, объединяя элементы списка streams через "/"
-    streams_part = "/".join(streams)
-    url = f"wss://fstream.binance.com/stream?streams={streams_part}"
-    redis_client = RedisClient(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
-    
+async def save_candle(candle, writer, event_time: float = 0.0):
+    if candle.is_closed:
+        await writer.save_closed_candle_in_list(candle, event_time)
+    else:
+        await writer.save_current_candle(candle, event_time)
+
+async def process_candle(candle, writer, store: CandleRingBuffer = None,
+                         aggregator: TimeframeAggregator = None, tracker: CloseTimeTracker = None,
+                         event_time: float = 0.0):
+    if candle.is_closed:
+        # Закрытая свеча, уже записанная (например, догруженная через REST), повторно не пишется
+        if tracker is not None and not tracker.update(candle):
+            return
+        if store is not None:
+            store.append(candle)
+    await save_candle(candle, writer, event_time)
+
+    if aggregator is not None:
+        for aggregated in aggregator.on_candle(candle):
+            await save_candle(aggregated, writer, event_time)
+
+async def process_message(message: str, handle_candle):
+    # Исключения не перехватываются: их учитывает и логирует воркер конвейера (счётчик errors)
+    candle = decode_kline(message)
+    event_time = extract_event_time(message)
+    if event_time:
+        PARSE_LATENCY.observe(time.time() - event_time)
+    await handle_candle(candle, event_time=event_time)
+
+async def report_stats_loop(pipeline: MessagePipeline, writer, name: str):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        logger.info(f"[{name}] Конвейер: {pipeline.stats()}")
+        if isinstance(writer, CandleBatchWriter):
+            logger.info(f"[{name}] Запись в Redis: {writer.stats()}")
+
+def shard_index(stream: str, shards: int) -> int:
+    """
+    Стабильный номер шарда для потока: не зависит от порядка списка и от
+    процесса, поэтому один и тот же символ всегда попадает в один шард.
+    """
+    return zlib.crc32(stream.encode()) % shards
+
+
+def split_streams(all_streams: list, shards: int) -> list:
+    shards = max(1, shards)
+    result = [[] for _ in range(shards)]
+    for stream in all_streams:
+        result[shard_index(stream, shards)].append(stream)
+    return [part for part in result if part]
+
+
+async def universe_refresh_loop(universe: UniverseLoader, manager: ConnectionManager, select, name: str):
+    """
+    Периодически перечитывает список символов и применяет изменения на лету.
+    """
+    if UNIVERSE_REFRESH_INTERVAL <= 0:
+        await asyncio.Future()
     while True:
+        await asyncio.sleep(UNIVERSE_REFRESH_INTERVAL)
         try:
-            # Возможно, имеет смысл увеличить ping_timeout, если сервер ожидает быстрее
-            async with websockets.connect(url, ping_interval=180, ping_timeout=600) as ws:
-                # logger.info(f"Подключение к Binance WebSocket установлено")
-                print(f"Подключение к Binance WebSocket установлено")
-                await receive_messages(ws, redis_client)
+            target = select(await universe.load())
+            if set(target) == manager.streams():
+                continue
+            result = await manager.apply(target)
+            logger.info(
+                f"[{name}] Подписки обновлены: +{result['added']} -{result['removed']}, "
+                f"перенесено {result['moved']}, соединений {len(manager.connections)}"
+            )
         except Exception as e:
-            logger.error(f"Ошибка соединения: {e}")
-        logger.info(f"Переподключаемся через 5 секунд...")
-        await asyncio.sleep(5)
+            logger.error(f"[{name}] Ошибка обновления списка символов: {e}")
+
+
+async def run_shards(shard_ids: list, name: str = "main"):
+    """
+    Запускает указанные шарды в текущем event loop с общим конвейером обработки.
+    """
+    redis_client = RedisClient(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        candle_encoding=CANDLE_ENCODING,
+        retention=CANDLE_RETENTION,
+        stream_maxlen=STREAM_MAXLEN,
+        stream_current_interval_ms=STREAM_CURRENT_INTERVAL_MS
+    )
+    writer = redis_client
+    if REDIS_FLUSH_INTERVAL_MS > 0:
+        writer = CandleBatchWriter(redis_client, flush_interval=REDIS_FLUSH_INTERVAL_MS / 1000)
+        writer.start()
+    candle_store = CandleRingBuffer(capacity=RING_BUFFER_SIZE) if RING_BUFFER_SIZE > 0 else None
+    aggregator = TimeframeAggregator(AGGREGATE_INTERVALS) if AGGREGATE_INTERVALS else None
+    tracker = CloseTimeTracker()
+    handle_candle = functools.partial(
+        process_candle, writer=writer, store=candle_store, aggregator=aggregator, tracker=tracker
+    )
+    pipeline = MessagePipeline(
+        lambda message: process_message(message, handle_candle),
+        workers=PIPELINE_WORKERS,
+        queue_size=PIPELINE_QUEUE_SIZE,
+        drop_when_full=PIPELINE_DROP_WHEN_FULL
+    )
+    pipeline.start()
+
+    # Один REST-клиент и ограничитель на все запросы шардов (klines и exchangeInfo)
+    rate_limiter = WeightRateLimiter(fraction=RATE_LIMIT_FRACTION * len(shard_ids) / max(1, KLINE_SHARDS))
+    async with BinanceRestClient(BINANCE_FAPI_URL, rate_limiter=rate_limiter) as rest_client:
+        backfiller = KlineBackfiller(rest_client, concurrency=BACKFILL_CONCURRENCY)
+        # Недогруженные при подключении пропуски вставляются в историю по времени,
+        # когда догрузятся (writer сначала сбрасывает буфер, чтобы не обогнать его)
+        async def insert_late_candles(symbol: str, interval: str, candles: list):
+            if isinstance(writer, CandleBatchWriter):
+                await writer.flush()
+            await redis_client.merge_closed_candles(symbol, interval, candles)
+
+        gap_retrier = GapRetrier(
+            backfiller, insert_late_candles,
+            base_delay=BACKFILL_RETRY_DELAY, max_delay=BACKFILL_RETRY_MAX_DELAY, max_attempts=BACKFILL_MAX_ATTEMPTS
+        )
+
+        async def on_connect(conn_id: int, conn_streams: list):
+            # Свечи, закрывшиеся за время разрыва, догружаем до чтения новых сообщений
+            if not BACKFILL_ENABLED:
+                return
+            try:
+                result = await backfiller.backfill(conn_streams, tracker, handle_candle)
+            except Exception as e:
+                logger.error(f"[conn {conn_id}] Ошибка догрузки пропущенных свечей: {e}")
+                return
+            if result["gaps"]:
+                logger.info(
+                    f"[conn {conn_id}] Догружено {result['candles']} свечей по {result['gaps']} потокам "
+                    f"за {result['seconds']:.2f} с"
+                )
+            if result["failed"]:
+                # Не переподключаемся: поток читается дальше, пропуск догружается в фоне
+                gap_retrier.add(result["failed_gaps"])
+                logger.warning(
+                    f"[conn {conn_id}] Пропуски по {result['failed']} потокам не догружены, "
+                    f"повтор в фоне"
+                )
+
+        universe = UniverseLoader(
+            redis_client.client, rest_client,
+            cache_ttl=UNIVERSE_CACHE_TTL,
+            fallback=[symbol_from_stream(stream) for stream in streams],
+            all_symbols=UNIVERSE_ALL_SYMBOLS
+        )
+
+        def select(symbols: list) -> list:
+            # Только потоки своих шардов
+            result = [stream_for(symbol, KLINE_STREAM_KIND) for symbol in symbols]
+            return [stream for stream in result if shard_index(stream, KLINE_SHARDS) in shard_ids]
+
+        target = select(await universe.load())
+        logger.info(f"[{name}] Потоков: {len(target)}, шардов: {len(shard_ids)}")
+        recorder = FrameRecorder(WS_RECORD_PATH.format(shard=min(shard_ids))) if WS_RECORD_PATH else None
+        manager = ConnectionManager(
+            pipeline,
+            on_connect,
+            max_streams=MAX_STREAMS_PER_CONNECTION,
+            group_of=lambda stream: shard_index(stream, KLINE_SHARDS),
+            base_url=WS_BASE_URL,
+            reconnect_base_delay=RECONNECT_BASE_DELAY,
+            reconnect_max_delay=RECONNECT_MAX_DELAY,
+            recorder=recorder
+        )
+        manager.start(split_streams(target, KLINE_SHARDS))
+
+        metrics.gauge("marketdata_pipeline_queue_depth", "Сообщений в очередях конвейера", pipeline.depth)
+        metrics.gauge("marketdata_pipeline_errors", "Сообщений, обработка которых завершилась ошибкой", lambda: pipeline.errors)
+        metrics.gauge(
+            "marketdata_ws_streams", "Потоков на соединении",
+            lambda: {c.conn_id: len(c.streams) for c in manager.connections}, ["conn"]
+        )
+        metrics.gauge("marketdata_backfill_pending_gaps", "Пропусков, ожидающих фоновой догрузки", gap_retrier.pending)
+        metrics.gauge(
+            "marketdata_backfill_retried", "Пропуски фоновой догрузки по исходу",
+            lambda: {"recovered": gap_retrier.recovered, "abandoned": gap_retrier.abandoned}, ["outcome"]
+        )
+        if aggregator is not None:
+            metrics.gauge(
+                "marketdata_aggregator_incomplete", "Свечей старших таймфреймов, не выданных из-за пропущенных 1m-баров",
+                lambda: aggregator.incomplete
+            )
+        if isinstance(writer, CandleBatchWriter):
+            metrics.gauge("marketdata_redis_pending", "Записей, ожидающих сброса в Redis", writer.pending)
+            metrics.gauge(
+                "marketdata_redis_dropped", "Закрытых свечей, отброшенных сверх глубины хранения при сбое Redis",
+                lambda: writer.dropped
+            )
+        await metrics.start_metrics_server(METRICS_PORT + min(shard_ids) if METRICS_PORT else 0)
+        if candle_store is not None and STORE_API_PORT:
+            await start_store_server(candle_store, STORE_API_PORT + min(shard_ids), STORE_API_HOST)
+
+        try:
+            await asyncio.gather(
+                report_stats_loop(pipeline, writer, name),
+                universe_refresh_loop(universe, manager, select, name),
+                gap_retrier.run()
+            )
+        finally:
+            if recorder is not None:
+                # Дописываем буфер и закрываем файл записи
+                recorder.close()
+
+
+async def subscribe_kline_streams():
+    await run_shards(list(range(KLINE_SHARDS)))
+
+
+def run_shard_process(shard_id: int):
+    # У каждого процесса свой event loop, конвейер и подключение к Redis
+    asyncio.run(run_shards([shard_id], name=f"shard {shard_id}"))
+
+
+def run_shard_processes(shards: int):
+    """
+    Запускает по процессу на шард и перезапускает упавшие процессы.
+    """
+    def start(shard_id):
+        process = multiprocessing.Process(
+            target=run_shard_process,
+            args=(shard_id,),
+            name=f"kline-shard-{shard_id}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    processes = [start(shard_id) for shard_id in range(shards)]
+    while True:
+        time.sleep(5)
+        for shard_id, process in enumerate(processes):
+            if not process.is_alive():
+                logger.error(f"[shard {shard_id}] Процесс завершился (код {process.exitcode}), перезапускаем")
+                processes[shard_id] = start(shard_id)
+
+
+def main():
+    logger.info(f"Шардов: {KLINE_SHARDS}, процессы: {KLINE_SHARD_PROCESSES}")
+    if KLINE_SHARD_PROCESSES and KLINE_SHARDS > 1:
+        run_shard_processes(KLINE_SHARDS)
+    else:
+        asyncio.run(subscribe_kline_streams())
 
 if __name__ == '__main__':
-    asyncio.run(subscribe_kline_streams())
+    main()
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import random
+import time
+
+from common import metrics
+from common.candle import Candle
+from common.rest import BinanceRestClient
+from aggregator import INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_FAILED = metrics.counter(
+    "marketdata_backfill_failed_total", "Потоков, пропуск по которым не удалось догрузить при подключении"
+)
+
+KLINES_PATH = "/fapi/v1/klines"
+KLINES_MAX_LIMIT = 1000
+
+
+def parse_stream(stream: str) -> tuple:
+    """
+    "btcusdt@kline_1m" -> ("BTCUSDT", "1m")
+    """
+    symbol, kind = stream.split("@")
+    return symbol.upper(), kind.split("_", 1)[1]
+
+
+def rest_kline_to_candle(symbol: str, interval: str, row: list) -> Candle:
+    # [open_time, open, high, low, close, volume, close_time, quote_volume,
+    #  trades, taker_buy_base, taker_buy_quote, ignore]
+    # Идентификаторов сделок REST не возвращает, поэтому first/last_trade_id = -1 (см. common/candle.py)
+    return Candle(
+        int(row[0]), int(row[6]), symbol, interval, -1, -1,
+        float(row[1]), float(row[4]), float(row[2]), float(row[3]), float(row[5]),
+        int(row[8]), True, float(row[7]), float(row[9]), float(row[10])
+    )
+
+
+class CloseTimeTracker:
+    """
+    Последний close_time закрытой свечи по (символ, интервал).
+    """
+
+    def __init__(self):
+        self.last_close = {}
+
+    def update(self, candle: Candle) -> bool:
+        """
+        Запоминает close_time; возвращает False, если свеча уже была учтена.
+        """
+        key = (candle.symbol, candle.interval)
+        last = self.last_close.get(key)
+        if last is not None and candle.close_time <= last:
+            return False
+        self.last_close[key] = candle.close_time
+        return True
+
+    def get(self, symbol: str, interval: str):
+        return self.last_close.get((symbol, interval))
+
+
+class KlineBackfiller:
+    """
+    Догружает через REST свечи, закрывшиеся, пока соединение было разорвано.
+
+    Запросы идут параллельно, но не более concurrency одновременно, через общий
+    BinanceRestClient сервиса: вес /fapi/v1/klines (по limit) учитывает его
+    WeightRateLimiter, паузу на 429/418 и повторы - сам клиент. Если запрос
+    так и не удался (в том числе RateLimitError после повторов), поток считается
+    не догруженным (failed в результате backfill).
+    """
+
+    def __init__(self, client: BinanceRestClient, concurrency: int = 10):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def _get_klines(self, symbol: str, interval: str, start_time: int, end_time: int, limit: int) -> list:
+        params = {
+            "symbol": symbol,
+            "interval": interval,
+            "startTime": start_time,
+            "endTime": end_time,
+            "limit": limit
+        }
+        async with self.semaphore:
+            return await self.client.get(KLINES_PATH, params)
+
+    async def fetch_closed(self, symbol: str, interval: str, start_time: int, now_ms: int) -> list:
+        """
+        Закрытые свечи с open_time >= start_time и close_time < now_ms, по порядку.
+        """
+        size = INTERVAL_MS[interval]
+        candles = []
+        while start_time + size <= now_ms:
+            missing = (now_ms - start_time) // size
+            limit = int(min(missing, KLINES_MAX_LIMIT))
+            rows = await self._get_klines(symbol, interval, start_time, now_ms - 1, limit)
+            if not rows:
+                break
+            for row in rows:
+                candle = rest_kline_to_candle(symbol, interval, row)
+                if candle.close_time < now_ms:
+                    candles.append(candle)
+            start_time = int(rows[-1][0]) + size
+            if len(rows) < limit:
+                break
+        return candles
+
+    async def backfill(self, streams: list, tracker: CloseTimeTracker, on_candle) -> dict:
+        """
+        Ищет пропуски после последнего известного close_time по каждому потоку
+        и передаёт недостающие закрытые свечи в on_candle строго по порядку и без повторов.
+        Потоки без истории (первое подключение) пропускаются.
+        failed - потоки, пропуск по которым не догружен (ошибка или ограничение
+        запросов), failed_gaps - их диапазоны (symbol, interval, start_time, end_ms)
+        для фоновой догрузки (GapRetrier).
+        """
+        started = time.monotonic()
+        now_ms = int(time.time() * 1000)
+        gaps = []
+        for stream in streams:
+            symbol, interval = parse_stream(stream)
+            last_close = tracker.get(symbol, interval)
+            if last_close is None or interval not in INTERVAL_MS:
+                continue
+            if last_close + INTERVAL_MS[interval] < now_ms:
+                gaps.append((symbol, interval, last_close + 1))
+
+        async def recover(symbol, interval, start_time):
+            try:
+                candles = await self.fetch_closed(symbol, interval, start_time, now_ms)
+            except Exception as e:
+                BACKFILL_FAILED.inc()
+                logger.error(f"Пропуск {symbol} {interval} с {start_time} не догружен: {e}")
+                return 0, (symbol, interval, start_time, now_ms)
+            written = 0
+            for candle in sorted(candles, key=lambda c: c.close_time):
+                last_close = tracker.get(symbol, interval)
+                if last_close is not None and candle.close_time <= last_close:
+                    continue
+                await on_candle(candle)
+                written += 1
+            return written, None
+
+        results = await asyncio.gather(*(recover(*gap) for gap in gaps))
+        failed_gaps = [gap for written, gap in results if gap is not None]
+        return {
+            "gaps": len(gaps),
+            "candles": sum(written for written, gap in results),
+            "failed": len(failed_gaps),
+            "failed_gaps": failed_gaps,
+            "seconds": time.monotonic() - started,
+        }
+
+
+class GapRetrier:
+    """
+    Фоновая догрузка пропусков, не догруженных при подключении.
+
+    Соединение не переподключается ради пропуска и продолжает читать поток,
+    а диапазон пропуска запоминается и догружается здесь с экспоненциальной
+    задержкой (base_delay * 2^n, не больше max_delay, с разбросом). Догруженные
+    свечи старше уже полученных из потока, поэтому они не проходят обычную
+    обработку (tracker, кольцевой буфер, агрегатор), а передаются в
+    on_candles(symbol, interval, candles) - вставка в историю по времени
+    (RedisClient.merge_closed_candles). После max_attempts неудачных попыток
+    пропуск отбрасывается (счётчик abandoned); 0 - без ограничения.
+    """
+
+    def __init__(self, backfiller: KlineBackfiller, on_candles, base_delay: float = 5.0,
+                 max_delay: float = 300.0, max_attempts: int = 10):
+        self.backfiller = backfiller
+        self.on_candles = on_candles
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        # (symbol, interval) -> [start_time, end_ms, attempts, next_at]
+        self.gaps = {}
+        self.recovered = 0
+        self.abandoned = 0
+        self._wakeup = asyncio.Event()
+
+    def _delay(self, attempts: int) -> float:
+        return random.uniform(0.5, 1.0) * min(self.max_delay, self.base_delay * 2 ** attempts)
+
+    def add(self, gaps: list):
+        """
+        Запоминает диапазоны (symbol, interval, start_time, end_ms); повторный
+        пропуск того же потока объединяется с ещё не догруженным.
+        """
+        for symbol, interval, start_time, end_ms in gaps:
+            pending = self.gaps.get((symbol, interval))
+            if pending is not None:
+                pending[0] = min(pending[0], start_time)
+                pending[1] = max(pending[1], end_ms)
+                continue
+            self.gaps[(symbol, interval)] = [start_time, end_ms, 0, time.monotonic() + self._delay(0)]
+        if gaps:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self.gaps)
+
+    async def retry_due(self):
+        """
+        Одна попытка по каждому пропуску, время которого подошло.
+        """
+        now = time.monotonic()
+        due = [(key, gap) for key, gap in self.gaps.items() if gap[3] <= now]
+
+        async def retry(key, gap):
+            symbol, interval = key
+            start_time, end_ms = gap[0], gap[1]
+            try:
+                candles = await self.backfiller.fetch_closed(symbol, interval, start_time, end_ms)
+                if candles:
+                    await self.on_candles(symbol, interval, candles)
+            except Exception as e:
+                gap[2] += 1
+                if self.max_attempts and gap[2] >= self.max_attempts:
+                    del self.gaps[key]
+                    self.abandoned += 1
+                    logger.error(
+                        f"Пропуск {symbol} {interval} {start_time}-{end_ms} не догружен "
+                        f"за {gap[2]} попыток, отказываемся: {e}"
+                    )
+                    return
+                gap[3] = time.monotonic() + self._delay(gap[2])
+                logger.warning(
+                    f"Фоновая догрузка {symbol} {interval} не удалась (попытка {gap[2]}): {e}, "
+                    f"повтор через {gap[3] - time.monotonic():.0f} с"
+                )
+                return
+            if gap[0] == start_time and gap[1] == end_ms:
+                # Пока шла догрузка, диапазон мог расшириться новым пропуском - тогда он остаётся
+                del self.gaps[key]
+            self.recovered += 1
+            logger.info(f"Пропуск {symbol} {interval} {start_time}-{end_ms} догружен в фоне: {len(candles)} свечей")
+
+        await asyncio.gather(*(retry(key, gap) for key, gap in due))
+
+    async def run(self):
+        while True:
+            if self.gaps:
+                wait = max(0.0, min(gap[3] for gap in self.gaps.values()) - time.monotonic())
+            else:
+                wait = None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            await self.retry_due()
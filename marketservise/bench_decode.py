@@ -0,0 +1,118 @@
+"""
+Микро-бенчмарк разбора kline-сообщений: прежний путь
+(json.loads -> словарь с переименованными ключами -> json.dumps)
+против типизированного decode_kline -> candle_to_json.
+Дополнительно печатает размер свечи в байтах для форматов json и packed.
+
+Запуск из корня репозитория:
+    PYTHONPATH=. python marketservise/bench_decode.py bench/feeds/kline.gz   # запись FrameRecorder (bench/record.py, WS_RECORD_PATH)
+    PYTHONPATH=. python marketservise/bench_decode.py frames.txt             # сообщения, по одному на строку
+    PYTHONPATH=. python marketservise/bench_decode.py              # синтетические сообщения
+"""
+import json
+import random
+import sys
+import time
+
+from common.candle import decode_kline, candle_to_json, pack_candle, PACKED_CANDLE_SIZE, msgspec
+from common.replay import read_frames
+
+
+def legacy_rename_candle_keys(raw_candle: dict) -> dict:
+    return {
+        "start_time": raw_candle.get("t"),
+        "close_time": raw_candle.get("T"),
+        "symbol": raw_candle.get("s"),
+        "interval": raw_candle.get("i"),
+        "first_trade_id": raw_candle.get("f"),
+        "last_trade_id": raw_candle.get("L"),
+        "open": raw_candle.get("o"),
+        "close": raw_candle.get("c"),
+        "high": raw_candle.get("h"),
+        "low": raw_candle.get("l"),
+        "volume": raw_candle.get("v"),
+        "number_of_trades": raw_candle.get("n"),
+        "is_closed": raw_candle.get("x"),
+        "quote_volume": raw_candle.get("q"),
+        "taker_buy_base_volume": raw_candle.get("V"),
+        "taker_buy_quote_volume": raw_candle.get("Q")
+    }
+
+
+def legacy_path(message: str) -> str:
+    data = json.loads(message)
+    candle = legacy_rename_candle_keys(data["data"]["k"])
+    return json.dumps(candle)
+
+
+def typed_path(message: str) -> str:
+    return candle_to_json(decode_kline(message))
+
+
+def synthetic_frames(count: int) -> list:
+    frames = []
+    now = int(time.time() * 1000)
+    for i in range(count):
+        symbol = f"SYM{i % 400}USDT"
+        price = random.uniform(0.001, 50000)
+        frames.append(json.dumps({
+            "stream": f"{symbol.lower()}@kline_1m",
+            "data": {
+                "e": "kline", "E": now, "s": symbol,
+                "k": {
+                    "t": now - 60000, "T": now - 1, "s": symbol, "i": "1m",
+                    "f": 100 + i, "L": 200 + i,
+                    "o": f"{price:.4f}", "c": f"{price * 1.001:.4f}",
+                    "h": f"{price * 1.002:.4f}", "l": f"{price * 0.999:.4f}",
+                    "v": f"{random.uniform(1, 1e6):.3f}", "n": 100,
+                    "x": i % 50 == 0, "q": f"{random.uniform(1, 1e7):.4f}",
+                    "V": f"{random.uniform(1, 1e5):.3f}", "Q": f"{random.uniform(1, 1e6):.4f}",
+                    "B": "0"
+                }
+            }
+        }, separators=(",", ":")))
+    return frames
+
+
+def load_frames(path: str) -> list:
+    """
+    Kline-кадры из записи: .gz - формат FrameRecorder (время и кадр через табуляцию),
+    иначе - текст с одним сообщением на строку.
+    """
+    if path.endswith(".gz"):
+        return [frame for _, frame in read_frames(path) if '"k":' in frame]
+    with open(path, "rt", encoding="utf-8") as f:
+        return [line.strip() for line in f if '"k":' in line]
+
+
+def run(name: str, func, frames: list, rounds: int = 5) -> float:
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for message in frames:
+            func(message)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(frames) / best
+    print(f"{name:<10} {rate:>12,.0f} msg/s")
+    return rate
+
+
+def main():
+    frames = load_frames(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frames(50_000)
+    print(f"Сообщений: {len(frames)}, msgspec: {'да' if msgspec is not None else 'нет'}")
+    legacy = run("legacy", legacy_path, frames)
+    typed = run("typed", typed_path, frames)
+    print(f"Ускорение: x{typed / legacy:.2f}")
+
+    candles = [decode_kline(message) for message in frames]
+    legacy_size = sum(len(legacy_path(message).encode()) for message in frames) / len(frames)
+    json_size = sum(len(candle_to_json(candle).encode()) for candle in candles) / len(candles)
+    packed_size = sum(len(pack_candle(candle)) for candle in candles) / len(candles)
+    assert packed_size == PACKED_CANDLE_SIZE
+    print(f"Байт на свечу: legacy json {legacy_size:.0f}, json {json_size:.0f}, packed {packed_size:.0f} "
+          f"(x{legacy_size / packed_size:.1f} меньше)")
+
+
+if __name__ == "__main__":
+    main()
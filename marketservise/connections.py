@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+import websockets
+
+from common import metrics
+from pipeline import INGEST_LATENCY, extract_event_time
+
+logger = logging.getLogger(__name__)
+
+RECEIVE_LATENCY = INGEST_LATENCY.labels("receive")
+WS_MESSAGES = metrics.counter("marketdata_ws_messages_total", "Сообщений, прочитанных из соединения", ["conn"])
+WS_RECONNECTS = metrics.counter("marketdata_ws_reconnects_total", "Переподключений соединения", ["conn"])
+
+WS_BASE_URL = "wss://fstream.binance.com/stream"
+
+# Binance принимает не более 10 входящих сообщений в секунду на соединение
+CONTROL_MESSAGE_INTERVAL = 0.2
+CONTROL_MESSAGE_MAX_PARAMS = 200
+
+
+def is_control_response(message: str) -> bool:
+    """
+    Ответ на SUBSCRIBE/UNSUBSCRIBE: {"result":null,"id":1} - это не данные потока.
+    """
+    return message.startswith('{"result"') or message.startswith('{"id"') or message.startswith('{"error"')
+
+
+class KlineConnection:
+    """
+    Одно combined-stream соединение со своим набором потоков.
+
+    Переподключается само, с экспоненциальной задержкой и джиттером, поэтому
+    обрыв одного соединения не затрагивает остальные символы. Набор потоков
+    меняется на лету сообщениями SUBSCRIBE/UNSUBSCRIBE без переподключения;
+    при переподключении URL строится из актуального набора.
+    on_connect(conn_id, streams) вызывается после подключения до чтения сообщений.
+    recorder (common.replay.FrameRecorder) - запись сырых кадров для воспроизведения.
+    """
+
+    def __init__(self, conn_id: int, streams, pipeline, on_connect=None, base_url: str = WS_BASE_URL,
+                 reconnect_base_delay: float = 1.0, reconnect_max_delay: float = 60.0, recorder=None):
+        self.conn_id = conn_id
+        self.streams = set(streams)
+        self.pipeline = pipeline
+        self.on_connect = on_connect
+        self.base_url = base_url
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.recorder = recorder
+        self.ws = None
+        self.reconnects = 0
+        self._request_id = 0
+        self._control_lock = asyncio.Lock()
+        self._task = None
+        self._messages = WS_MESSAGES.labels(conn_id)
+        self._reconnects = WS_RECONNECTS.labels(conn_id)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        WS_MESSAGES.remove(self.conn_id)
+        WS_RECONNECTS.remove(self.conn_id)
+
+    async def _receive(self, ws):
+        async for message in ws:
+            self._messages.inc()
+            if self.recorder is not None:
+                self.recorder.write(message)
+            if is_control_response(message):
+                if '"error"' in message:
+                    logger.error(f"[conn {self.conn_id}] Ошибка управляющего сообщения: {message}")
+                continue
+            event_time = extract_event_time(message)
+            if event_time:
+                RECEIVE_LATENCY.observe(time.time() - event_time)
+            # Передаём сообщение в конвейер; при заполненной очереди ждём
+            await self.pipeline.put(message)
+
+    async def run(self):
+        delay = self.reconnect_base_delay
+        while True:
+            connected_at = None
+            try:
+                subscribed = sorted(self.streams)
+                # url = "wss://fstream.binance.com/stream?streams=btcusdt@kline_5m/cosusdt@kline_5m"
+                url = f"{self.base_url}?streams={'/'.join(subscribed)}"
+                # Возможно, имеет смысл увеличить ping_timeout, если сервер ожидает быстрее
+                async with websockets.connect(url, ping_interval=180, ping_timeout=600) as ws:
+                    connected_at = time.monotonic()
+                    self.ws = ws
+                    logger.info(f"[conn {self.conn_id}] Подключение к Binance WebSocket установлено ({len(subscribed)} потоков)")
+                    # Набор мог измениться, пока шло подключение
+                    added = self.streams.difference(subscribed)
+                    removed = set(subscribed).difference(self.streams)
+                    if added:
+                        await self._send_control("SUBSCRIBE", sorted(added))
+                    if removed:
+                        await self._send_control("UNSUBSCRIBE", sorted(removed))
+                    if self.on_connect is not None:
+                        await self.on_connect(self.conn_id, sorted(self.streams))
+                    await self._receive(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[conn {self.conn_id}] Ошибка соединения: {e}")
+            finally:
+                self.ws = None
+
+            self.reconnects += 1
+            self._reconnects.inc()
+            # Соединение прожило достаточно долго - начинаем отсчёт задержки заново
+            if connected_at is not None and time.monotonic() - connected_at > self.reconnect_max_delay:
+                delay = self.reconnect_base_delay
+            sleep_for = delay / 2 + random.uniform(0, delay / 2)
+            logger.info(f"[conn {self.conn_id}] Переподключаемся через {sleep_for:.1f} секунд...")
+            await asyncio.sleep(sleep_for)
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    async def _send_control(self, method: str, streams: list):
+        ws = self.ws
+        if ws is None:
+            return
+        async with self._control_lock:
+            for i in range(0, len(streams), CONTROL_MESSAGE_MAX_PARAMS):
+                self._request_id += 1
+                request = {"method": method, "params": streams[i:i + CONTROL_MESSAGE_MAX_PARAMS], "id": self._request_id}
+                await ws.send(json.dumps(request))
+                await asyncio.sleep(CONTROL_MESSAGE_INTERVAL)
+
+    async def subscribe(self, streams: list):
+        self.streams.update(streams)
+        try:
+            await self._send_control("SUBSCRIBE", streams)
+        except Exception as e:
+            # Соединение оборвалось - потоки попадут в URL при переподключении
+            logger.error(f"[conn {self.conn_id}] Не удалось отправить SUBSCRIBE: {e}")
+
+    async def unsubscribe(self, streams: list):
+        self.streams.difference_update(streams)
+        try:
+            await self._send_control("UNSUBSCRIBE", streams)
+        except Exception as e:
+            logger.error(f"[conn {self.conn_id}] Не удалось отправить UNSUBSCRIBE: {e}")
+
+
+class ConnectionManager:
+    """
+    Распределяет потоки по соединениям и применяет изменения списка на лету.
+
+    Каждое соединение принадлежит группе (шарду): group_of(stream) - номер
+    шарда потока, по умолчанию все потоки в одной группе. Новые потоки
+    добавляются в наименее загруженное соединение своей группы, у которого
+    есть место; если все они заполнены до max_streams, для группы открывается
+    новое. Соединения сверх лимита (например, после уменьшения max_streams)
+    отдают лишние потоки соединениям той же группы. Опустевшие соединения закрываются.
+    """
+
+    def __init__(self, pipeline, on_connect=None, max_streams: int = 200, group_of=None, **connection_options):
+        self.pipeline = pipeline
+        self.on_connect = on_connect
+        self.max_streams = max_streams
+        self.group_of = group_of or (lambda stream: 0)
+        self.connection_options = connection_options
+        self.connections = []
+        # conn_id -> группа соединения
+        self.groups = {}
+        self._next_id = 0
+
+    def _open(self, streams, group: int) -> KlineConnection:
+        connection = KlineConnection(
+            self._next_id, streams, self.pipeline, self.on_connect, **self.connection_options
+        )
+        self._next_id += 1
+        self.connections.append(connection)
+        self.groups[connection.conn_id] = group
+        connection.start()
+        return connection
+
+    def start(self, groups: list):
+        """
+        Открывает соединения для начального распределения потоков (списки групп).
+        """
+        for streams in groups:
+            by_group = {}
+            for stream in streams:
+                by_group.setdefault(self.group_of(stream), []).append(stream)
+            for group, part in by_group.items():
+                for i in range(0, len(part), self.max_streams):
+                    self._open(part[i:i + self.max_streams], group)
+
+    def streams(self) -> set:
+        result = set()
+        for connection in self.connections:
+            result |= connection.streams
+        return result
+
+    async def apply(self, target) -> dict:
+        """
+        Приводит набор подписок к target: лишние потоки отписываются,
+        новые подписываются на существующих соединениях без переподключения.
+        """
+        target = set(target)
+        current = self.streams()
+        removed = current - target
+        added = sorted(target - current)
+
+        for connection in self.connections:
+            to_remove = sorted(connection.streams & removed)
+            if to_remove:
+                await connection.unsubscribe(to_remove)
+
+        # Переносим избыток из переполненных соединений
+        moved = []
+        for connection in self.connections:
+            overflow = len(connection.streams) - self.max_streams
+            if overflow > 0:
+                extra = sorted(connection.streams)[-overflow:]
+                await connection.unsubscribe(extra)
+                moved += extra
+        added = sorted(set(added) | set(moved))
+
+        plan = {}
+        pending = {}
+        for stream in added:
+            group = self.group_of(stream)
+            candidates = [
+                c for c in self.connections
+                if self.groups[c.conn_id] == group
+                and len(c.streams) + len(plan.get(c.conn_id, ())) < self.max_streams
+            ]
+            if not candidates:
+                pending.setdefault(group, []).append(stream)
+                continue
+            connection = min(candidates, key=lambda c: len(c.streams) + len(plan.get(c.conn_id, ())))
+            plan.setdefault(connection.conn_id, []).append(stream)
+
+        for connection in self.connections:
+            if connection.conn_id in plan:
+                await connection.subscribe(plan[connection.conn_id])
+        for group, streams in pending.items():
+            for i in range(0, len(streams), self.max_streams):
+                self._open(streams[i:i + self.max_streams], group)
+
+        for connection in [c for c in self.connections if not c.streams]:
+            await connection.close()
+            self.connections.remove(connection)
+            del self.groups[connection.conn_id]
+
+        return {"added": len(added) - len(moved), "removed": len(removed), "moved": len(moved)}
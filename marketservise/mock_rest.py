@@ -0,0 +1,111 @@
+"""
+Локальный mock REST-сервера Binance для /fapi/v1/klines и замер времени
+восстановления пропуска через KlineBackfiller.
+
+Запуск сервера из корня репозитория (для BINANCE_FAPI_URL=http://127.0.0.1:8099):
+    PYTHONPATH=. python marketservise/mock_rest.py --port 8099 --latency-ms 30
+
+Замер догрузки: 400 символов, пропуск 15 минут:
+    PYTHONPATH=. python marketservise/mock_rest.py --measure --symbols 400 --gap-minutes 15
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+from aggregator import INTERVAL_MS
+from backfill import CloseTimeTracker, KlineBackfiller
+from common.ratelimit import WeightRateLimiter, klines_weight
+from common.rest import BinanceRestClient
+
+
+def make_app(latency_ms: float = 0.0) -> web.Application:
+    state = {"minute": 0, "weight": 0, "requests": 0}
+
+    async def klines(request: web.Request) -> web.Response:
+        interval = request.query.get("interval", "1m")
+        size = INTERVAL_MS[interval]
+        limit = int(request.query.get("limit", "500"))
+        end_time = int(request.query.get("endTime", time.time() * 1000))
+        start_time = int(request.query.get("startTime", end_time - size * limit))
+        start_time -= start_time % size
+
+        minute = int(time.time() // 60)
+        if minute != state["minute"]:
+            state["minute"], state["weight"] = minute, 0
+        state["weight"] += klines_weight(limit)
+        state["requests"] += 1
+
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+        rows = []
+        open_time = start_time
+        while open_time <= end_time and len(rows) < limit:
+            price = 100 + random.random()
+            rows.append([
+                open_time, f"{price:.4f}", f"{price + 0.5:.4f}", f"{price - 0.5:.4f}", f"{price:.4f}",
+                "10.0", open_time + size - 1, "1000.0", 5, "5.0", "500.0", "0"
+            ])
+            open_time += size
+        return web.json_response(rows, headers={"X-MBX-USED-WEIGHT-1M": str(state["weight"])})
+
+    app = web.Application()
+    app["state"] = state
+    app.router.add_get("/fapi/v1/klines", klines)
+    return app
+
+
+async def measure(symbols: int, gap_minutes: int, latency_ms: float, concurrency: int, port: int):
+    runner = web.AppRunner(make_app(latency_ms))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+
+    streams = [f"sym{i}usdt@kline_1m" for i in range(symbols)]
+    tracker = CloseTimeTracker()
+    now_ms = int(time.time() * 1000)
+    last_close = now_ms - now_ms % 60_000 - gap_minutes * 60_000 - 1
+    for stream in streams:
+        tracker.last_close[(stream.split("@")[0].upper(), "1m")] = last_close
+
+    async def on_candle(candle):
+        tracker.update(candle)
+
+    try:
+        async with BinanceRestClient(f"http://127.0.0.1:{port}", rate_limiter=WeightRateLimiter()) as client:
+            backfiller = KlineBackfiller(client, concurrency=concurrency)
+            result = await backfiller.backfill(streams, tracker, on_candle)
+    finally:
+        await runner.cleanup()
+
+    print(
+        f"Символов: {symbols}, пропуск: {gap_minutes} мин, задержка сервера: {latency_ms} мс, "
+        f"параллельно: {concurrency}"
+    )
+    print(
+        f"Догружено свечей: {result['candles']} за {result['seconds']:.3f} с, "
+        f"не догружено потоков: {result['failed']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--measure", action="store_true")
+    parser.add_argument("--symbols", type=int, default=400)
+    parser.add_argument("--gap-minutes", type=int, default=15)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.measure:
+        asyncio.run(measure(args.symbols, args.gap_minutes, args.latency_ms, args.concurrency, args.port))
+    else:
+        web.run_app(make_app(args.latency_ms), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
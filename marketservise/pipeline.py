@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+import zlib
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+# Задержка от времени события биржи (поле E) до каждого этапа:
+# receive - сообщение прочитано из сокета, parse - разобрано, redis_ack - запись подтверждена Redis
+INGEST_LATENCY = metrics.histogram(
+    "marketdata_ingest_latency_seconds", "Задержка от времени события биржи до этапа обработки", ["stage"]
+)
+
+
+def extract_stream_name(message: str) -> str:
+    """
+    Достаёт имя потока из combined-stream сообщения без полного разбора JSON:
+    {"stream":"btcusdt@kline_1m","data":{...}} -> "btcusdt@kline_1m"
+    """
+    start = message.find('"stream":"')
+    if start == -1:
+        return ""
+    start += len('"stream":"')
+    end = message.find('"', start)
+    return message[start:end]
+
+
+def extract_event_time(message: str) -> float:
+    """
+    Время события биржи (поле "E", в секундах) без полного разбора JSON; 0.0, если поля нет.
+    """
+    start = message.find('"E":')
+    if start == -1:
+        return 0.0
+    start += len('"E":')
+    end = start
+    while end < len(message) and message[end].isdigit():
+        end += 1
+    if end == start:
+        return 0.0
+    return int(message[start:end]) / 1000
+
+
+class MessagePipeline:
+    """
+    Ограниченный конвейер обработки сообщений с фиксированным пулом воркеров.
+
+    Сообщение направляется в очередь воркера по хешу имени потока, поэтому
+    все сообщения одного символа обрабатываются одним воркером строго по порядку.
+    Очереди ограничены: при заполнении put() ждёт (backpressure на WebSocket),
+    либо, при drop_when_full=True, выбрасывает незакрытые свечи.
+    Закрытые свечи не выбрасываются никогда.
+    """
+
+    def __init__(self, handler, workers: int = 8, queue_size: int = 1000, drop_when_full: bool = False):
+        self.handler = handler
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self.drop_when_full = drop_when_full
+        self._tasks = []
+
+        # Счётчики
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self._lag_sum = 0.0
+        self._lag_count = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _queue_for(self, message: str) -> asyncio.Queue:
+        stream = extract_stream_name(message)
+        return self.queues[zlib.crc32(stream.encode()) % len(self.queues)]
+
+    async def put(self, message: str):
+        self.received += 1
+        queue = self._queue_for(message)
+        item = (time.monotonic(), message)
+        try:
+            queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.drop_when_full and '"x":true' not in message:
+            self.dropped += 1
+            return
+        # Очередь заполнена - ждём, тем самым притормаживая чтение из сокета
+        self.blocked += 1
+        await queue.put(item)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            enqueued_at, message = await queue.get()
+            lag = time.monotonic() - enqueued_at
+            self._lag_sum += lag
+            self._lag_count += 1
+            if lag > self.max_lag:
+                self.max_lag = lag
+            try:
+                await self.handler(message)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка при обработке сообщения: {e}")
+            finally:
+                queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def stats(self, reset_lag: bool = True) -> dict:
+        """
+        Возвращает счётчики конвейера. Задержка (lag) - время ожидания
+        сообщения в очереди, среднее и максимум с момента прошлого вызова.
+        """
+        avg_lag = self._lag_sum / self._lag_count if self._lag_count else 0.0
+        result = {
+            "queue_depth": self.depth(),
+            "max_queue_depth": max(queue.qsize() for queue in self.queues),
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "errors": self.errors,
+            "avg_lag_ms": avg_lag * 1000,
+            "max_lag_ms": self.max_lag * 1000,
+        }
+        if reset_lag:
+            self._lag_sum = 0.0
+            self._lag_count = 0
+            self.max_lag = 0.0
+        return result
@@ -1,26 +1,143 @@
 
-import json
+import asyncio
+import logging
+import time
 import redis.asyncio as redis
+from common.candle import Candle, candle_to_json, pack_candle, decode_stored_candle
+from common.events import closed_stream_key, current_stream_key
+from pipeline import INGEST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+REDIS_ACK_LATENCY = INGEST_LATENCY.labels("redis_ack")
+
+# Сколько последних закрытых свечей хранить в списке candles:{symbol}:{interval},
+# если для интервала не задано иное (см. parse_retention)
+CLOSED_CANDLES_LIMIT = 5
+
+
+def parse_retention(value: str) -> dict:
+    """
+    "1m:1440,5m:288" -> {"1m": 1440, "5m": 288}
+    """
+    retention = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        interval, limit = part.split(":")
+        retention[interval.strip()] = int(limit)
+    return retention
 
 
 class RedisClient:
-    def __init__(self, host: str, port: int, password: str, db: int = 0):
+    def __init__(self, host: str, port: int, password: str, db: int = 0,
+                 candle_encoding: str = "json", retention: dict = None,
+                 stream_maxlen: int = 0, stream_current_interval_ms: int = 0):
         self.client = redis.Redis(host=host, port=port, db=db, password=password, decode_responses=True)
+        # Упакованные свечи - это байты, читать их нужно клиентом без декодирования ответов
+        self.raw_client = redis.Redis(host=host, port=port, db=db, password=password, decode_responses=False)
+        self.candle_encoding = candle_encoding
+        self.retention = retention or {}
+        # Публикация в Redis Streams: 0 - отключено
+        self.stream_maxlen = stream_maxlen
+        self.stream_current_interval = stream_current_interval_ms / 1000
+        self._current_published = {}
+
+    def closed_candles_limit(self, interval: str) -> int:
+        return self.retention.get(interval, CLOSED_CANDLES_LIMIT)
 
-    async def save_closed_candle_in_list(self, candle: dict):
+    def encode_closed_candle(self, candle: Candle):
+        if self.candle_encoding == "packed":
+            return pack_candle(candle)
+        return candle_to_json(candle)
+
+    def add_closed_to_stream(self, pipe, candle: Candle, value):
+        """
+        Добавляет в пайплайн XADD закрытой свечи в stream:candles:{interval}.
+        """
+        if not self.stream_maxlen:
+            return
+        fields = {"symbol": candle.symbol, "interval": candle.interval, "close_time": candle.close_time, "data": value}
+        pipe.xadd(closed_stream_key(candle.interval), fields, maxlen=self.stream_maxlen, approximate=True)
+
+    def add_current_to_stream(self, pipe, candle: Candle, value):
+        """
+        Добавляет в пайплайн XADD текущей свечи, не чаще раза в stream_current_interval на символ.
+        """
+        if not self.stream_maxlen or not self.stream_current_interval:
+            return
+        key = (candle.symbol, candle.interval)
+        now = time.monotonic()
+        if now - self._current_published.get(key, 0.0) < self.stream_current_interval:
+            return
+        self._current_published[key] = now
+        fields = {"symbol": candle.symbol, "interval": candle.interval, "close_time": candle.close_time, "data": value}
+        pipe.xadd(current_stream_key(candle.interval), fields, maxlen=self.stream_maxlen, approximate=True)
+
+    async def save_closed_candle_in_list(self, candle: Candle, event_time: float = 0.0):
         """
         Сохраняет "закрывшуюся" свечу в конец списка (RPUSH), 
         одновременно обрезая список (LTRIM), 
-        чтобы в нём оставалось не более 50 последних свечей.
+        чтобы в нём оставалось не более closed_candles_limit(interval) последних свечей.
+        event_time - время события биржи (с) для метрики задержки записи.
         """
-        key = f"candles:{candle['symbol']}:{candle['interval']}"
+        key = f"candles:{candle.symbol}:{candle.interval}"
         # Используем пайплайн, чтобы отправить несколько команд одним пакетом
+        value = self.encode_closed_candle(candle)
         async with self.client.pipeline(transaction=False) as pipe:
-            pipe.rpush(key, json.dumps(candle))
-            pipe.ltrim(key, -5, -1)  # Оставляем последние 5 элементов
+            pipe.rpush(key, value)
+            pipe.ltrim(key, -self.closed_candles_limit(candle.interval), -1)
+            self.add_closed_to_stream(pipe, candle, value)
             await pipe.execute()
+        if event_time:
+            REDIS_ACK_LATENCY.observe(time.time() - event_time)
+
+    async def merge_closed_candles(self, symbol: str, interval: str, candles: list) -> int:
+        """
+        Вставляет в candles:{symbol}:{interval} закрытые свечи, которые старше уже
+        записанных (фоновая догрузка пропуска): список пересобирается по start_time,
+        уже записанные свечи не заменяются, длина - не больше closed_candles_limit.
+        Список читается под WATCH, поэтому параллельная запись из потока не теряется.
+        Возвращает, сколько свечей попало в список.
+        """
+        key = f"candles:{symbol}:{interval}"
+        limit = self.closed_candles_limit(interval)
+        fresh = {candle.start_time: (candle, self.encode_closed_candle(candle)) for candle in candles}
+        async with self.raw_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    stored = {}
+                    for item in await pipe.lrange(key, 0, -1):
+                        stored[decode_stored_candle(item, symbol, interval).start_time] = item
+                    merged = {start: value for start, (candle, value) in fresh.items() if start not in stored}
+                    kept = sorted(list(stored) + list(merged))[-limit:]
+                    added = [start for start in kept if start in merged]
+                    if not added:
+                        await pipe.unwatch()
+                        return 0
+                    values = {**merged, **stored}
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.rpush(key, *(values[start] for start in kept))
+                    for start in added:
+                        self.add_closed_to_stream(pipe, fresh[start][0], merged[start])
+                    await pipe.execute()
+                    return len(added)
+                except redis.WatchError:
+                    continue
 
-    async def save_closed_candle(self, candle: dict):
+    async def get_closed_candles(self, symbol: str, interval: str, count: int = None) -> list:
+        """
+        Возвращает последние закрытые свечи (от старых к новым) в любом формате хранения.
+        """
+        key = f"candles:{symbol}:{interval}"
+        start = -count if count else 0
+        raw_items = await self.raw_client.lrange(key, start, -1)
+        return [decode_stored_candle(item, symbol, interval) for item in raw_items]
+
+    async def save_closed_candle(self, candle: Candle):
         """
         Сохраняем каждую закрытую свечу в отдельном ключе с TTL = 1 час.
         Дополнительно добавляем запись в отсортированный набор (Sorted Set),
@@ -28,10 +145,10 @@ class RedisClient:
         """
         # Формируем уникальный ключ, например по close_time
         # Пример: candle:BTCUSDT:1m:1677801600000
-        candle_key = f"candle:{candle['symbol']}:{candle['interval']}:{candle['close_time']}"
+        candle_key = f"candle:{candle.symbol}:{candle.interval}:{candle.close_time}"
 
         # Сохраняем данные свечи
-        await self.client.set(candle_key, json.dumps(candle))
+        await self.client.set(candle_key, candle_to_json(candle))
 
         # Устанавливаем время жизни ключа (TTL) = 3600 секунд (1 час)
         await self.client.expire(candle_key, 1600)
@@ -39,10 +156,160 @@ class RedisClient:
         # Добавляем ключ свечи в Sorted Set с ключом вида:
         # candles_index:BTCUSDT:1m
         # В качестве score используем close_time (float).
-        zset_key = f"candles_index:{candle['symbol']}:{candle['interval']}"
-        close_time_score = float(candle['close_time'])
+        zset_key = f"candles_index:{candle.symbol}:{candle.interval}"
+        close_time_score = float(candle.close_time)
         await self.client.zadd(zset_key, {candle_key: close_time_score})
 
-    async def save_current_candle(self, candle: dict):
-        key = f"candle_current:{candle['symbol']}:{candle['interval']}"
-        await self.client.set(key, json.dumps(candle))
+    async def save_current_candle(self, candle: Candle, event_time: float = 0.0):
+        key = f"candle_current:{candle.symbol}:{candle.interval}"
+        value = candle_to_json(candle)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(key, value)
+            self.add_current_to_stream(pipe, candle, value)
+            await pipe.execute()
+        if event_time:
+            REDIS_ACK_LATENCY.observe(time.time() - event_time)
+
+
+class CandleBatchWriter:
+    """
+    Write-behind буфер записи свечей в Redis.
+
+    Методы save_current_candle / save_closed_candle_in_list только складывают
+    данные в память. Раз в flush_interval секунд всё накопленное отправляется
+    одним пайплайном: для candle_current:* остаётся только последнее обновление
+    по ключу, закрытые свечи дописываются в списки в порядке поступления.
+    Если Redis недоступен, неотправленные закрытые свечи держатся в буфере
+    не больше глубины хранения списка на ключ: более старые всё равно были бы
+    обрезаны LTRIM, поэтому они отбрасываются (счётчик dropped).
+    """
+
+    def __init__(self, redis_client: RedisClient, flush_interval: float = 0.05):
+        self.redis_client = redis_client
+        self.flush_interval = flush_interval
+        self._current = {}
+        self._closed = []
+        self._task = None
+
+        # Статистика сбросов
+        self.batches = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_sum = 0.0
+        self._flush_count = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def save_current_candle(self, candle: Candle, event_time: float = 0.0):
+        key = f"candle_current:{candle.symbol}:{candle.interval}"
+        if key in self._current:
+            self.coalesced += 1
+        self._current[key] = (candle, candle_to_json(candle), event_time)
+
+    async def save_closed_candle_in_list(self, candle: Candle, event_time: float = 0.0):
+        key = f"candles:{candle.symbol}:{candle.interval}"
+        limit = self.redis_client.closed_candles_limit(candle.interval)
+        self._closed.append((key, limit, candle, self.redis_client.encode_closed_candle(candle), event_time))
+
+    async def flush(self):
+        if not self._current and not self._closed:
+            return
+        current, closed = self._current, self._closed
+        self._current, self._closed = {}, []
+
+        started = time.monotonic()
+        try:
+            async with self.redis_client.client.pipeline(transaction=False) as pipe:
+                trimmed = {}
+                for key, limit, candle, value, event_time in closed:
+                    pipe.rpush(key, value)
+                    trimmed[key] = limit
+                    self.redis_client.add_closed_to_stream(pipe, candle, value)
+                for key, limit in trimmed.items():
+                    pipe.ltrim(key, -limit, -1)
+                if current:
+                    pipe.mset({key: value for key, (candle, value, event_time) in current.items()})
+                    for candle, value, event_time in current.values():
+                        self.redis_client.add_current_to_stream(pipe, candle, value)
+                await pipe.execute()
+        except Exception:
+            # Возвращаем неотправленное в буфер, не затирая более свежие обновления
+            for key, value in current.items():
+                self._current.setdefault(key, value)
+            self._closed[:0] = closed
+            self._cap_closed()
+            raise
+
+        # Задержка считается для каждой записи пакета: свеча видна в Redis только после сброса
+        acked_at = time.time()
+        for item in closed:
+            if item[4]:
+                REDIS_ACK_LATENCY.observe(acked_at - item[4])
+        for item in current.values():
+            if item[2]:
+                REDIS_ACK_LATENCY.observe(acked_at - item[2])
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        batch_size = len(current) + len(closed)
+        self.batches += 1
+        self.last_batch_size = batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._flush_ms_sum += elapsed_ms
+        self._flush_count += 1
+
+    def _cap_closed(self):
+        """
+        Оставляет в буфере не больше limit последних закрытых свечей на ключ.
+        """
+        counts = {}
+        kept = []
+        for item in reversed(self._closed):
+            key, limit = item[0], item[1]
+            counts[key] = counts.get(key, 0) + 1
+            if counts[key] <= limit:
+                kept.append(item)
+        dropped = len(self._closed) - len(kept)
+        if dropped:
+            kept.reverse()
+            self._closed = kept
+            self.dropped += dropped
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при пакетной записи свечей в Redis: {e}")
+
+    def pending(self) -> int:
+        return len(self._current) + len(self._closed)
+
+    def stats(self) -> dict:
+        """
+        Размер пакетов и время сброса (среднее и максимум с момента прошлого вызова).
+        """
+        avg_flush = self._flush_ms_sum / self._flush_count if self._flush_count else 0.0
+        result = {
+            "batches": self.batches,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "pending": self.pending(),
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_flush_ms": avg_flush,
+            "max_flush_ms": self.max_flush_ms,
+        }
+        self.max_batch_size = 0
+        self.max_flush_ms = 0.0
+        self._flush_ms_sum = 0.0
+        self._flush_count = 0
+        return result
@@ -0,0 +1,213 @@
+import numpy as np
+
+# Порядок полей в массиве OHLCV
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+FIELDS = {"open": OPEN, "high": HIGH, "low": LOW, "close": CLOSE, "volume": VOLUME}
+
+
+class CandleRingBuffer:
+    """
+    Кольцевой буфер закрытых свечей в памяти процесса.
+
+    Данные всех символов лежат в одном заранее выделенном массиве
+    (символ x capacity x OHLCV), поэтому выборки "последние N баров"
+    по одному символу или по всем сразу делаются без циклов и без Redis.
+    Индикаторы (SMA, EMA, ATR, z-score объёма) обновляются за O(1) на каждую свечу.
+    Дисперсия объёма ведётся по Уэлфорду (среднее и сумма квадратов отклонений),
+    а не как sumsq/n - mean^2: при крупных, почти постоянных объёмах разность
+    больших чисел теряет все значащие цифры. На каждом обороте буфера суммы
+    пересчитываются по окну заново, чтобы не копилась ошибка округления.
+    """
+
+    def __init__(self, symbols=(), capacity: int = 1440, sma_period: int = 20, ema_period: int = 20,
+                 atr_period: int = 14, zscore_period: int = 20):
+        max_period = max(sma_period, zscore_period)
+        if capacity < max_period:
+            raise ValueError(f"capacity ({capacity}) меньше периода индикатора ({max_period})")
+        self.capacity = capacity
+        self.sma_period = sma_period
+        self.ema_period = ema_period
+        self.atr_period = atr_period
+        self.zscore_period = zscore_period
+
+        self.symbols = []
+        self.index = {}
+        self.data = np.full((0, capacity, 5), np.nan)
+        self.times = np.zeros((0, capacity), dtype=np.int64)
+        self.pos = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+
+        # Состояние индикаторов, по одному значению на символ
+        self.sma = np.zeros(0)
+        self.ema = np.zeros(0)
+        self.atr = np.zeros(0)
+        self.volume_zscore = np.zeros(0)
+        self._sma_sum = np.zeros(0)
+        self._vol_mean = np.zeros(0)
+        self._vol_m2 = np.zeros(0)
+        self._prev_close = np.zeros(0)
+
+        for symbol in symbols:
+            self._row(symbol)
+
+    def _row(self, symbol: str) -> int:
+        row = self.index.get(symbol)
+        if row is not None:
+            return row
+
+        row = len(self.symbols)
+        if row >= len(self.data):
+            self._grow(max(16, row * 2))
+        self.symbols.append(symbol)
+        self.index[symbol] = row
+        return row
+
+    def _grow(self, rows: int):
+        extra = rows - len(self.data)
+        self.data = np.concatenate([self.data, np.full((extra, self.capacity, 5), np.nan)])
+        self.times = np.concatenate([self.times, np.zeros((extra, self.capacity), dtype=np.int64)])
+        self.pos = np.concatenate([self.pos, np.zeros(extra, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        for name in ("sma", "ema", "atr", "volume_zscore", "_prev_close"):
+            setattr(self, name, np.concatenate([getattr(self, name), np.full(extra, np.nan)]))
+        for name in ("_sma_sum", "_vol_mean", "_vol_m2"):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(extra)]))
+
+    def append(self, candle) -> bool:
+        """
+        Добавляет закрытую свечу. Повторы и свечи старше последней игнорируются.
+        """
+        row = self._row(candle.symbol)
+        count = self.count[row]
+        pos = self.pos[row]
+        if count and self.times[row, pos - 1] >= candle.start_time:
+            return False
+
+        close = candle.close
+        volume = candle.volume
+
+        # Значения, которые выпадают из окон SMA и z-score
+        if count >= self.sma_period:
+            self._sma_sum[row] -= self.data[row, (pos - self.sma_period) % self.capacity, CLOSE]
+        old_volume = None
+        if count >= self.zscore_period:
+            old_volume = self.data[row, (pos - self.zscore_period) % self.capacity, VOLUME]
+
+        self.data[row, pos] = (candle.open, candle.high, candle.low, close, volume)
+        self.times[row, pos] = candle.start_time
+        self.pos[row] = (pos + 1) % self.capacity
+        self.count[row] = count = min(count + 1, self.capacity)
+
+        # SMA
+        self._sma_sum[row] += close
+        self.sma[row] = self._sma_sum[row] / self.sma_period if count >= self.sma_period else np.nan
+
+        # EMA, начальное значение - первая цена закрытия
+        if np.isnan(self.ema[row]):
+            self.ema[row] = close
+        else:
+            alpha = 2.0 / (self.ema_period + 1)
+            self.ema[row] += alpha * (close - self.ema[row])
+
+        # ATR по Уайлдеру
+        prev_close = self._prev_close[row]
+        if np.isnan(prev_close):
+            true_range = candle.high - candle.low
+        else:
+            true_range = max(candle.high - candle.low, abs(candle.high - prev_close), abs(candle.low - prev_close))
+        if np.isnan(self.atr[row]):
+            self.atr[row] = true_range
+        else:
+            period = min(count, self.atr_period)
+            self.atr[row] += (true_range - self.atr[row]) / period
+        self._prev_close[row] = close
+
+        # z-score объёма в окне zscore_period (Уэлфорд со скользящим окном)
+        window = min(count, self.zscore_period)
+        mean = self._vol_mean[row]
+        if old_volume is None:
+            delta = volume - mean
+            mean += delta / window
+            self._vol_m2[row] += delta * (volume - mean)
+        else:
+            # Новое значение заменяет выпавшее, размер окна не меняется
+            delta = volume - old_volume
+            new_mean = mean + delta / window
+            self._vol_m2[row] += delta * (volume - new_mean + old_volume - mean)
+            mean = new_mean
+        if self.pos[row] == 0:
+            # Оборот буфера - точный пересчёт по окну
+            self._recompute(row)
+            mean = self._vol_mean[row]
+        else:
+            self._vol_mean[row] = mean
+        variance = self._vol_m2[row] / window
+        self.volume_zscore[row] = (volume - mean) / np.sqrt(variance) if variance > 0 else 0.0
+        return True
+
+    def _recompute(self, row: int):
+        """
+        Точные суммы окон SMA и z-score по данным буфера.
+        """
+        count = self.count[row]
+        pos = self.pos[row]
+        if count >= self.sma_period:
+            idx = (pos - self.sma_period + np.arange(self.sma_period)) % self.capacity
+            self._sma_sum[row] = self.data[row, idx, CLOSE].sum()
+        window = min(count, self.zscore_period)
+        idx = (pos - window + np.arange(window)) % self.capacity
+        volumes = self.data[row, idx, VOLUME]
+        self._vol_mean[row] = volumes.mean()
+        self._vol_m2[row] = np.square(volumes - self._vol_mean[row]).sum()
+
+    def last(self, symbol: str, n: int) -> np.ndarray:
+        """
+        Последние n баров символа, массив (k x OHLCV) от старых к новым, k <= n.
+        """
+        row = self.index.get(symbol)
+        if row is None:
+            return np.empty((0, 5))
+        k = min(n, self.count[row])
+        idx = (self.pos[row] - k + np.arange(k)) % self.capacity
+        return self.data[row, idx]
+
+    def last_times(self, symbol: str, n: int) -> np.ndarray:
+        row = self.index.get(symbol)
+        if row is None:
+            return np.empty(0, dtype=np.int64)
+        k = min(n, self.count[row])
+        idx = (self.pos[row] - k + np.arange(k)) % self.capacity
+        return self.times[row, idx]
+
+    def last_all(self, n: int, field: str = "close") -> np.ndarray:
+        """
+        Последние n значений поля по всем символам: массив (символы x n),
+        строки в порядке self.symbols. Недостающие бары заполнены NaN.
+        """
+        n = min(n, self.capacity)
+        rows = len(self.symbols)
+        offsets = np.arange(n)
+        idx = (self.pos[:rows, None] - n + offsets) % self.capacity
+        values = self.data[np.arange(rows)[:, None], idx, FIELDS[field]]
+        missing = offsets < (n - self.count[:rows, None])
+        values[missing] = np.nan
+        return values
+
+    def indicators(self, symbol: str) -> dict:
+        row = self.index.get(symbol)
+        if row is None:
+            return {}
+        return {
+            "sma": float(self.sma[row]),
+            "ema": float(self.ema[row]),
+            "atr": float(self.atr[row]),
+            "volume_zscore": float(self.volume_zscore[row]),
+        }
+
+    def indicator_array(self, name: str) -> np.ndarray:
+        """
+        Значения индикатора по всем символам (в порядке self.symbols).
+        """
+        if name not in ("sma", "ema", "atr", "volume_zscore"):
+            raise ValueError(f"Неизвестный индикатор: {name}")
+        return getattr(self, name)[:len(self.symbols)]
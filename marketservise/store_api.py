@@ -0,0 +1,122 @@
+"""
+Локальный HTTP-доступ к кольцевому буферу свечей (CandleRingBuffer).
+
+Буфер живёт в процессе marketservise (в режиме процессов - свой у каждого
+шарда), поэтому стратегии из других процессов читают бары и индикаторы
+через этот эндпоинт, без LRANGE и разбора JSON из Redis. Ответы - JSON,
+пропуски (NaN) отдаются как null.
+
+    GET /symbols                          -> {"symbols": [...]}
+    GET /last?symbol=BTCUSDT&n=100        -> {"symbol", "fields", "times": [...], "bars": [[o, h, l, c, v], ...]}
+    GET /last_all?n=100&field=close       -> {"field", "symbols": [...], "values": [[...], ...]}
+    GET /indicators?symbol=BTCUSDT        -> {"symbol", "sma", "ema", "atr", "volume_zscore"}
+    GET /indicators                       -> {"symbols": [...], "sma": [...], "ema": [...], ...}
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from ringbuffer import CandleRingBuffer, FIELDS
+
+logger = logging.getLogger(__name__)
+
+INDICATORS = ("sma", "ema", "atr", "volume_zscore")
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+
+def _to_list(values: np.ndarray) -> list:
+    values = values.astype(object)
+    values[np.isnan(values.astype(float))] = None
+    return values.tolist()
+
+
+def handle_query(store: CandleRingBuffer, path: str, params: dict) -> tuple:
+    """
+    Ответ на запрос: (HTTP-статус, тело как словарь).
+    """
+    if path == "/symbols":
+        return 200, {"symbols": list(store.symbols)}
+
+    if path == "/last":
+        symbol = params.get("symbol", "").upper()
+        if symbol not in store.index:
+            return 404, {"error": f"Нет данных по {symbol}"}
+        n = int(params.get("n", "100"))
+        return 200, {
+            "symbol": symbol,
+            "fields": list(FIELDS),
+            "times": store.last_times(symbol, n).tolist(),
+            "bars": _to_list(store.last(symbol, n)),
+        }
+
+    if path == "/last_all":
+        field = params.get("field", "close")
+        if field not in FIELDS:
+            return 400, {"error": f"Неизвестное поле: {field}"}
+        return 200, {
+            "field": field,
+            "symbols": list(store.symbols),
+            "values": _to_list(store.last_all(int(params.get("n", "100")), field)),
+        }
+
+    if path == "/indicators":
+        symbol = params.get("symbol", "").upper()
+        if not symbol:
+            result = {"symbols": list(store.symbols)}
+            result.update({name: _to_list(store.indicator_array(name)) for name in INDICATORS})
+            return 200, result
+        if symbol not in store.index:
+            return 404, {"error": f"Нет данных по {symbol}"}
+        result = {"symbol": symbol}
+        result.update({name: None if np.isnan(value) else value for name, value in store.indicators(symbol).items()})
+        return 200, result
+
+    return 404, {"error": f"Неизвестный путь: {path}"}
+
+
+async def start_store_server(store: CandleRingBuffer, port: int, host: str = "127.0.0.1"):
+    """
+    Минимальный HTTP-сервер запросов к буферу свечей (только GET).
+    Возвращает asyncio.Server; при port <= 0 ничего не запускает.
+    """
+    if port <= 0:
+        return None
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            # Остальные заголовки не нужны - дочитываем до пустой строки
+            while True:
+                line = await reader.readline()
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+            if len(request_line) < 2 or request_line[0] != "GET":
+                status, body = 400, {"error": "Поддерживается только GET"}
+            else:
+                parts = urlsplit(request_line[1])
+                params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+                try:
+                    status, body = handle_query(store, parts.path.rstrip("/") or "/", params)
+                except ValueError as e:
+                    status, body = 400, {"error": str(e)}
+            payload = json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\n".encode()
+                + b"Content-Type: application/json\r\n"
+                + f"Content-Length: {len(payload)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + payload
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Ошибка запроса к буферу свечей: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Буфер свечей доступен на http://{host}:{port}/")
+    return server
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ALERTS_STREAM_KEY = "stream:oi_alerts"
+
+
+class AlertSink:
+    """
+    Неблокирующий приёмник сигналов детектора.
+
+    emit() только кладёт сигнал в память, поэтому оценка никогда не ждёт
+    базу. Две фоновые задачи разбирают буферы независимо:
+    - публикация в Redis Stream stream:oi_alerts (XADD пайплайном раз в
+      publish_interval) - для потребителей, которым важна задержка;
+    - запись в open_interest_log пакетами (executemany) по batch_size или
+      раз в flush_interval.
+    Оба буфера ограничены max_buffer: если база или Redis недоступны, самые
+    старые сигналы отбрасываются (с предупреждением в логе не чаще раза в
+    drop_log_interval секунд), и память не растёт всё время сбоя.
+    """
+
+    def __init__(self, db_manager, redis_client, publish_interval: float = 0.05, flush_interval: float = 1.0,
+                 batch_size: int = 500, max_buffer: int = 10000, stream_maxlen: int = 10000,
+                 drop_log_interval: float = 60.0):
+        self.db_manager = db_manager
+        self.redis = redis_client
+        self.publish_interval = publish_interval
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.stream_maxlen = stream_maxlen
+        self.drop_log_interval = drop_log_interval
+        self._drop_logged_at = 0.0
+        self._to_publish = []
+        self._to_store = []
+        self._store_event = asyncio.Event()
+        self._tasks = []
+
+        # Статистика
+        self.emitted = 0
+        self.published = 0
+        self.stored = 0
+        self.dropped = 0
+        self.dropped_publish = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._publish_loop()),
+                asyncio.create_task(self._store_loop()),
+            ]
+
+    async def stop(self):
+        await self.publish()
+        await self.store()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def emit(self, symbol: str, message: str, **fields):
+        """
+        Сигнал: symbol, текст для open_interest_log и произвольные числовые поля
+        (current, avg, deviation, threshold ...), которые уходят в стрим.
+        """
+        alert = {"symbol": symbol, "message": message, "time": int(time.time() * 1000)}
+        alert.update(fields)
+        self.emitted += 1
+        self._to_publish.append(alert)
+        self._to_store.append(message)
+        self._trim()
+        if len(self._to_store) >= self.batch_size:
+            self._store_event.set()
+
+    async def publish(self):
+        if not self._to_publish:
+            return
+        alerts, self._to_publish = self._to_publish, []
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for alert in alerts:
+                    fields = {"symbol": alert["symbol"], "data": json.dumps(alert)}
+                    pipe.xadd(ALERTS_STREAM_KEY, fields, maxlen=self.stream_maxlen, approximate=True)
+                await pipe.execute()
+            self.published += len(alerts)
+        except Exception:
+            # Не опубликованное возвращаем в начало очереди
+            self._to_publish[:0] = alerts
+            self._trim()
+            raise
+
+    def _trim(self):
+        overflow_publish = len(self._to_publish) - self.max_buffer
+        if overflow_publish > 0:
+            del self._to_publish[:overflow_publish]
+            self.dropped_publish += overflow_publish
+        overflow_store = len(self._to_store) - self.max_buffer
+        if overflow_store > 0:
+            del self._to_store[:overflow_store]
+            self.dropped += overflow_store
+        if max(overflow_publish, overflow_store) > 0 and time.monotonic() - self._drop_logged_at >= self.drop_log_interval:
+            self._drop_logged_at = time.monotonic()
+            logger.warning(
+                f"Буфер сигналов переполнен (max_buffer={self.max_buffer}), отброшены самые старые: "
+                f"всего не опубликовано {self.dropped_publish}, не записано в БД {self.dropped}"
+            )
+
+    async def store(self):
+        while self._to_store:
+            messages = self._to_store[:self.batch_size]
+            del self._to_store[:len(messages)]
+            try:
+                await self.db_manager.save_logs(messages)
+            except Exception:
+                self._to_store[:0] = messages
+                self._trim()
+                raise
+            self.stored += len(messages)
+
+    async def _publish_loop(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.error(f"Ошибка публикации сигналов в Redis: {e}")
+
+    async def _store_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._store_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._store_event.clear()
+            try:
+                await self.store()
+            except Exception as e:
+                logger.error(f"Ошибка записи сигналов в БД: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    def stats(self) -> dict:
+        return {
+            "emitted": self.emitted,
+            "published": self.published,
+            "stored": self.stored,
+            "dropped": self.dropped,
+            "dropped_publish": self.dropped_publish,
+            "pending_store": len(self._to_store),
+            "pending_publish": len(self._to_publish),
+        }
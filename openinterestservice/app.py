@@ -1,20 +1,27 @@
 import warnings
-warnings.filterwarnings("ignore", category=Warning, message="Duplicate entry.*for key 'idx_symbol_timestamp'")
 warnings.filterwarnings("ignore", category=Warning, message="Can't create database.*")
-warnings.filterwarnings("ignore", category=Warning, message="Table 'open_interest_history' already exists")
+warnings.filterwarnings("ignore", category=Warning, message="Table 'open_interest_(series|rollup)' already exists")
 warnings.filterwarnings("ignore", category=Warning, message="Table 'open_interest_log' already exists")
-warnings.filterwarnings("ignore", category=Warning, message="Duplicate key name 'idx_symbol_timestamp'")
 
 import os
 import asyncio
 import logging
-import aiohttp
 import time
-import json
+
+import numpy as np
 
 from strems import streams
 from redis_client import RedisClient
 from db import DBManager
+from rules import PERIODS_MS, parse_rules, windows_by_period
+from histcache import HistCache
+from persister import HistoryPersister
+from alerts import AlertSink
+from scheduler import PollScheduler, ticks
+from common.universe import UniverseLoader
+from common.ratelimit import WeightRateLimiter
+from common.rest import BinanceRestClient
+from common import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,12 +37,96 @@ DB_USER = os.getenv("DB_USER", "myuser")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "mypass")
 DB_NAME = os.getenv("DB_NAME", "open_interest_db")
 
-OPEN_INTEREST_HIST_URL = "https://fapi.binance.com/futures/data/openInterestHist"
-CURRENT_OPEN_INTEREST_URL = "https://fapi.binance.com/fapi/v1/openInterest"
+OPEN_INTEREST_HIST_PATH = "/futures/data/openInterestHist"
+CURRENT_OPEN_INTEREST_PATH = "/fapi/v1/openInterest"
+BINANCE_FAPI_URL = os.getenv("BINANCE_FAPI_URL", "https://fapi.binance.com")
+UNIVERSE_CACHE_TTL = int(os.getenv("UNIVERSE_CACHE_TTL", "3600"))
+# 0 - символы exchangeInfo только из курируемого strems.py (без снятых с торгов),
+# 1 - все бессрочные USDT-контракты в статусе TRADING
+UNIVERSE_ALL_SYMBOLS = os.getenv("UNIVERSE_ALL_SYMBOLS", "0") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102"))
+
+# Доля лимита веса Binance, которую может занять сервис, и максимум одновременных запросов
+RATE_LIMIT_FRACTION = float(os.getenv("RATE_LIMIT_FRACTION", "0.5"))
+REST_CONCURRENCY = int(os.getenv("REST_CONCURRENCY", "20"))
 
+# Основной период: его история пишется в Redis (open_interest:{symbol}) и MariaDB
 PERIOD = "5m"
+PERIOD_MS = PERIODS_MS[PERIOD]
 DEFAULT_LIMIT = 30  # Анализируем последние 30 записей
 
+# Порог отклонения от среднего, шаг сдвига порога после сигнала и его время жизни (с)
+OI_BAND = float(os.getenv("OI_BAND", "0.1"))
+OI_THRESHOLD_STEP = float(os.getenv("OI_THRESHOLD_STEP", "0.01"))
+OI_THRESHOLD_TTL = int(os.getenv("OI_THRESHOLD_TTL", "600"))
+# Правила анализа period:window:band через запятую (см. rules.py), например "5m:30:0.1,15m:20:0.08,1h:24:0.05"
+OI_RULES = os.getenv("OI_RULES", f"{PERIOD}:{DEFAULT_LIMIT}:{OI_BAND}")
+# Запас (с) после закрытия периода, прежде чем запрашивать его точку у Binance
+OI_HIST_SETTLE_DELAY = float(os.getenv("OI_HIST_SETTLE_DELAY", "15"))
+# Режим оценки текущего OI: symbol - каждый символ отдельно по мере ответа биржи,
+# vector - весь тик собирается и оценивается одним векторным проходом
+OI_EVAL_MODE = os.getenv("OI_EVAL_MODE", "symbol")
+# Фоновая запись истории в MariaDB: размер очереди (строк), пакета и максимальная задержка пакета (с)
+PERSIST_QUEUE_SIZE = int(os.getenv("PERSIST_QUEUE_SIZE", "10000"))
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "1000"))
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "1.0"))
+# Как часто сохранять контрольную точку детектора в Redis (с)
+OI_CHECKPOINT_INTERVAL = int(os.getenv("OI_CHECKPOINT_INTERVAL", "60"))
+# Опрос текущего OI: интервалы (с) уровней fast (открытые позиции, недавние сигналы),
+# normal и slow (неликвидные - OI в USDT ниже OI_ILLIQUID_VALUE); как долго сигнал
+# считается недавним (с) и как часто пересчитывать уровни (с)
+OI_POLL_INTERVAL = float(os.getenv("OI_POLL_INTERVAL", "60"))
+OI_POLL_FAST_INTERVAL = float(os.getenv("OI_POLL_FAST_INTERVAL", "15"))
+OI_POLL_SLOW_INTERVAL = float(os.getenv("OI_POLL_SLOW_INTERVAL", "180"))
+OI_ILLIQUID_VALUE = float(os.getenv("OI_ILLIQUID_VALUE", "5000000"))
+OI_RECENT_ALERT_SECONDS = int(os.getenv("OI_RECENT_ALERT_SECONDS", "900"))
+OI_PRIORITY_REFRESH = int(os.getenv("OI_PRIORITY_REFRESH", "30"))
+OI_SCHEDULE_REPORT_INTERVAL = int(os.getenv("OI_SCHEDULE_REPORT_INTERVAL", "300"))
+# Быстрый старт: точки старше этого возраста (с) не загружаются из БД и контрольной точки
+# детектора, а их ключи в Redis удаляются
+OI_WARM_START_MAX_AGE = int(os.getenv("OI_WARM_START_MAX_AGE", "86400"))
+# Обслуживание open_interest_series: период (с), срок хранения сырых точек (сутки, 0 - бессрочно)
+# и на сколько суток вперёд держать готовые секции
+OI_MAINTENANCE_INTERVAL = int(os.getenv("OI_MAINTENANCE_INTERVAL", "3600"))
+OI_RETENTION_DAYS = int(os.getenv("OI_RETENTION_DAYS", "90"))
+OI_PARTITIONS_AHEAD = int(os.getenv("OI_PARTITIONS_AHEAD", "7"))
+
+# Метрики: задержка от времени биржи (поле time ответа openInterest) до получения и до записи в Redis,
+# длительность запросов к REST и итераций циклов
+INGEST_LATENCY = metrics.histogram(
+    "openinterest_ingest_latency_seconds", "Задержка от времени биржи до этапа обработки", ["stage"]
+)
+RECEIVE_LATENCY = INGEST_LATENCY.labels("receive")
+REDIS_ACK_LATENCY = INGEST_LATENCY.labels("redis_ack")
+REQUEST_SECONDS = metrics.histogram("openinterest_request_seconds", "Длительность запроса к Binance с ожиданием лимита", ["endpoint"])
+REQUEST_ERRORS = metrics.counter("openinterest_request_errors_total", "Ошибок запросов к Binance", ["endpoint"])
+EVAL_SECONDS = metrics.histogram(
+    "openinterest_eval_seconds", "Время векторной оценки тика по всем символам",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+CYCLE_SECONDS = metrics.histogram(
+    "openinterest_cycle_seconds", "Длительность итерации цикла сбора", ["loop"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+
+# Общий для обоих циклов ограничитель запросов к Binance
+rate_limiter = WeightRateLimiter(fraction=RATE_LIMIT_FRACTION)
+# Общий REST-клиент: пул соединений, повторы, предохранитель и объединение одинаковых GET
+rest_client = BinanceRestClient(BINANCE_FAPI_URL, rate_limiter=rate_limiter, concurrency=REST_CONCURRENCY)
+metrics.gauge("openinterest_rate_limited_responses", "Ответов 429/418 от Binance", lambda: rate_limiter.rate_limited)
+# Правила анализа: у каждого свои скользящие окна и пороги сигналов;
+# правило прежнего анализа (PERIOD x DEFAULT_LIMIT) пишет в прежние ключи без суффикса
+rules = parse_rules(
+    OI_RULES, step=OI_THRESHOLD_STEP, threshold_ttl=OI_THRESHOLD_TTL, legacy=f"{PERIOD}x{DEFAULT_LIMIT}"
+)
+# Сколько точек истории хранить по каждому периоду; основной период собирается всегда
+hist_windows = windows_by_period(rules)
+hist_windows[PERIOD] = max(hist_windows.get(PERIOD, 0), DEFAULT_LIMIT)
+metrics.gauge("openinterest_used_weight_1m", "X-MBX-USED-WEIGHT-1M из последнего ответа", lambda: rate_limiter.used_weight)
+# Для уровней опроса: время последнего сигнала и последний OI в USDT (sumOpenInterestValue) по символам
+last_alert_at = {}
+oi_value = {}
+
 def parse_symbol_from_stream(stream_name: str) -> str:
     base_symbol = stream_name.split('@')[0]
     return base_symbol.upper()
@@ -48,281 +139,343 @@ def shorten_number(number) -> str:
     else:
         return f"{number / 1_000_000:.1f}M"
 
-async def clear_redis_data_on_startup(redis_client: RedisClient):
+async def clean_stale_redis_keys(redis_client: RedisClient, symbols: list) -> int:
     """
-    Удаляем ключи (open_interest:* и open_interest_current:*),
-    чтобы при запуске скрипта не использовать старые данные.
+    Удаляет через SCAN только устаревшие ключи OI: символов, которых больше нет
+    в списке, и историю, последняя точка которой старше OI_WARM_START_MAX_AGE.
+    Остальное остаётся - после перезапуска его не нужно собирать заново.
     """
-    try:
-        # Удаляем исторические OI
-        hist_keys = await redis_client.client.keys("open_interest:*")
-        if hist_keys:
-            await redis_client.client.delete(*hist_keys)
-            logger.info(f"Удалено {len(hist_keys)} ключей исторических OI")
-
-        # Удаляем текущие OI
-        current_keys = await redis_client.client.keys("open_interest_current:*")
-        if current_keys:
-            await redis_client.client.delete(*current_keys)
-            logger.info(f"Удалено {len(current_keys)} ключей текущих OI")
+    universe = set(symbols)
+    cutoff = int(time.time() * 1000) - OI_WARM_START_MAX_AGE * 1000
+    stale = set()
+    last_ts_keys = await redis_client.scan_keys("open_interest_last_ts:*")
+    if last_ts_keys:
+        values = await redis_client.client.mget(last_ts_keys)
+        for key, value in zip(last_ts_keys, values):
+            symbol = key.split(":", 1)[1]
+            if symbol not in universe or value is None or int(value) < cutoff:
+                stale.add(symbol)
 
+    keys = [key for key in last_ts_keys if key.split(":", 1)[1] in stale]
+    for pattern in ("open_interest:*", "open_interest_current:*"):
+        for key in await redis_client.scan_keys(pattern):
+            symbol = key.split(":", 1)[1]
+            if symbol not in universe or symbol in stale:
+                keys.append(key)
+    await redis_client.unlink_keys(keys)
+    if keys:
+        logger.info(f"Удалено {len(keys)} устаревших ключей OI")
+    return len(keys)
+
+async def warm_start(redis_client: RedisClient, db_manager: DBManager, hist_cache: HistCache, symbols: list):
+    """
+    Быстрый старт: последние точки основного периода по всем символам одним запросом
+    из MariaDB -> Redis одним пайплайном, кэш истории и окна правил этого периода.
+    Цикл истории затем догружает только недостающие точки, а оценка текущего OI
+    работает сразу.
+    """
+    started = time.monotonic()
+    try:
+        await clean_stale_redis_keys(redis_client, symbols)
     except Exception as e:
         logger.error(f"Ошибка при очистке Redis: {e}")
+    try:
+        since = int(time.time() * 1000) - OI_WARM_START_MAX_AGE * 1000
+        universe = set(symbols)
+        window = hist_windows[PERIOD]
+        points = {
+            symbol: items
+            for symbol, items in (await db_manager.series.last_points(window, since)).items()
+            if symbol in universe
+        }
+        await redis_client.load_open_interest_lists(points, window)
+        for symbol, items in points.items():
+            hist_cache.seed(symbol, PERIOD, items)
+            for rule in rules:
+                if rule.period == PERIOD:
+                    rule.detector.add_points(symbol, items)
+            oi_value[symbol] = float(items[-1]["sumOpenInterestValue"])
+        ready = ", ".join(
+            f"{rule.name} {sum(1 for symbol in symbols if rule.detector.ready(symbol))}/{len(symbols)}"
+            for rule in rules
+        )
+        logger.info(
+            f"Быстрый старт за {time.monotonic() - started:.2f} с: история {len(points)} символов из БД, "
+            f"окно заполнено: {ready}"
+        )
+    except Exception as e:
+        logger.error(f"Не удалось загрузить историю OI из БД при старте: {e}")
 
-async def fetch_open_interest(session, symbol: str, limit=DEFAULT_LIMIT) -> list:
+async def fetch_open_interest(client: BinanceRestClient, symbol: str, period: str = PERIOD, limit=DEFAULT_LIMIT,
+                              start_time: int = None) -> list:
     params = {
         "symbol": symbol,
-        "period": PERIOD,
+        "period": period,
         "limit": limit
     }
+    if start_time is not None:
+        params["startTime"] = start_time
+    started = time.monotonic()
     try:
-        async with session.get(OPEN_INTEREST_HIST_URL, params=params) as response:
-            response.raise_for_status()
-            data = await response.json()
-            return data
+        return await client.get(OPEN_INTEREST_HIST_PATH, params)
     except Exception as e:
+        REQUEST_ERRORS.labels("openInterestHist").inc()
         logger.error(f"Ошибка при запросе исторических данных OI для {symbol}: {e}")
         return []
+    finally:
+        REQUEST_SECONDS.labels("openInterestHist").observe(time.monotonic() - started)
 
-async def fetch_current_open_interest(session, symbol: str) -> dict:
+async def fetch_current_open_interest(client: BinanceRestClient, symbol: str) -> dict:
     params = {"symbol": symbol}
+    started = time.monotonic()
     try:
-        async with session.get(CURRENT_OPEN_INTEREST_URL, params=params) as response:
-            response.raise_for_status()
-            data = await response.json()
-            return data
+        return await client.get(CURRENT_OPEN_INTEREST_PATH, params)
     except Exception as e:
+        REQUEST_ERRORS.labels("openInterest").inc()
         logger.error(f"Ошибка при запросе текущего OI для {symbol}: {e}")
         return {}
+    finally:
+        REQUEST_SECONDS.labels("openInterest").observe(time.monotonic() - started)
 
-async def _fetch_current_open_interest(
-    session, 
-    symbol: str, 
-    max_retries: int = 3, 
-    base_delay: float = 1.0
-) -> dict:
-    """
-    Запрашивает текущий OI с API Binance, делая несколько попыток (retry)
-    при таймаутах или сетевых ошибках. 
-    Возвращает словарь с данными (или пустой, если не удалось).
-    """
-    params = {"symbol": symbol}
-    
-    for attempt in range(1, max_retries + 1):
-        try:
-            async with session.get(CURRENT_OPEN_INTEREST_URL, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data
-                else:
-                    # Например, 404 -> символ не найден, 429 -> rate limit, 5xx -> ошибка сервера и т.д.
-                    error_text = await response.text()
-                    logger.error(
-                        f"Ошибка при запросе текущего OI для {symbol} "
-                        f"(HTTP {response.status}, попытка {attempt}/{max_retries}): {error_text}"
-                    )
-                    return {}
-        except asyncio.TimeoutError:
-            # logger.error(
-            #     f"Таймаут запроса текущего OI для {symbol} (попытка {attempt}/{max_retries})"
-            # )
-            # Если это последняя попытка, возвращаемся с пустым словарём (или можно raise).
-            if attempt == max_retries:
-                return {}
-            # Иначе ждём и пробуем снова
-            await asyncio.sleep(base_delay * attempt)
-        except aiohttp.ClientConnectorError as e:
-            logger.error(
-                f"Сетевая ошибка (ClientConnectorError) для {symbol} "
-                f"(попытка {attempt}/{max_retries}): {e}"
-            )
-            if attempt == max_retries:
-                return {}
-            await asyncio.sleep(base_delay * attempt)
-        except Exception as e:
-            logger.error(
-                f"Неизвестная ошибка при запросе текущего OI для {symbol} "
-                f"(попытка {attempt}/{max_retries}): {e}"
-            )
-            return {}
-    
-    return {}
-
-async def _fetch_open_interest(
-    session, 
-    symbol: str, 
-    period: str = "5m", 
-    limit: int = 30,
-    max_retries: int = 3, 
-    base_delay: float = 1.0
-) -> list:
-    """
-    Запрашивает исторические данные OI (openInterestHist) с API Binance, делая несколько попыток.
-    Возвращает список (или пустой, если не удалось).
-    """
-    params = {
-        "symbol": symbol,
-        "period": period,
-        "limit": limit
-    }
-
-    for attempt in range(1, max_retries + 1):
-        try:
-            async with session.get(OPEN_INTEREST_HIST_URL, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data
-                else:
-                    error_text = await response.text()
-                    logger.error(
-                        f"Ошибка при запросе исторических OI для {symbol} "
-                        f"(HTTP {response.status}, попытка {attempt}/{max_retries}): {error_text}"
-                    )
-                    return []
-        except asyncio.TimeoutError:
-            # logger.error(
-            #     f"Таймаут при запросе исторических OI для {symbol} "
-            #     f"(попытка {attempt}/{max_retries})"
-            # )
-            if attempt == max_retries:
-                return []
-            await asyncio.sleep(base_delay * attempt)
-        except aiohttp.ClientConnectorError as e:
-            logger.error(
-                f"Сетевая ошибка (ClientConnectorError) для {symbol} "
-                f"(попытка {attempt}/{max_retries}): {e}"
-            )
-            if attempt == max_retries:
-                return []
-            await asyncio.sleep(base_delay * attempt)
-        except Exception as e:
-            logger.error(
-                f"Неизвестная ошибка при запросе исторических OI для {symbol} "
-                f"(попытка {attempt}/{max_retries}): {e}"
-            )
-            return []
-    
-    return []
+def emit_signal(alerts: AlertSink, rule, symbol: str, current_oi: float, avg_oi: float, deviation: float,
+                threshold: float):
+    message = (
+        f"{symbol}: "
+        f"current: {shorten_number(current_oi)}, avg({rule.name}): {shorten_number(avg_oi)}, "
+        f"deviation: {(deviation * 100):.2f}%"
+    )
+    logger.warning(message)
+    last_alert_at[symbol] = time.time()
+    alerts.emit(
+        symbol, message, rule=rule.name, period=rule.period,
+        current=float(current_oi), avg=float(avg_oi), deviation=float(deviation), threshold=float(threshold)
+    )
 
-async def process_symbol_current_oi(symbol: str, session, redis_client: RedisClient, db_manager: DBManager):
+async def process_symbol_current_oi(symbol: str, client: BinanceRestClient, redis_client: RedisClient, alerts: AlertSink):
     """
     1) Запрашиваем текущий OI с биржи.
     2) Сохраняем в Redis через redis_client.save_current_open_interest.
-    3) Получаем из Redis историю (до 30 записей), вычисляем средний OI и сравниваем c текущим.
+    3) Сравниваем текущий OI со средним по окну детектора (в памяти, без чтения Redis).
     """
     try:
-        data = await fetch_current_open_interest(session, symbol)
-        # data = await fetch_current_open_interest(session, symbol, max_retries=3, base_delay=1.0)
+        data = await fetch_current_open_interest(client, symbol)
         if not data:
             return
+        event_time = data.get("time", 0) / 1000
+        if event_time:
+            RECEIVE_LATENCY.observe(time.time() - event_time)
         
         # Сохраняем текущий OI, используя новый метод
         await redis_client.save_current_open_interest(symbol, data)
-        
-        max_retries = 3
-        for attempt in range(1, max_retries + 1):
-            # Получаем список исторических данных (до 30 записей)
-            hist_data = await redis_client.get_open_interest_list(symbol)
-            
-            # Убедимся, что у нас ровно DEFAULT_LIMIT (30) записей
-            if len(hist_data) >= DEFAULT_LIMIT:
-                # Суммируем поле sumOpenInterest
-                analyz_data = hist_data[-DEFAULT_LIMIT:]
-                sum_list = []
-                for item_str in analyz_data:
-                    item = json.loads(item_str)
-                    sum_list.append(float(item["sumOpenInterest"]))
-
-                avg_oi = sum(sum_list) / len(sum_list)
-                
-                # Текущее значение открытого интереса
-                current_oi = float(data["openInterest"])
-                
-                # Читаем «пороговое» значение из Redis (если нет, используем 0)
-                last_threshold_key = f"last_threshold:{symbol}"
-                threshold_str = await redis_client.client.get(last_threshold_key)
-                last_threshold = float(threshold_str) if threshold_str else None
-
-                # Проверка отклонения более чем на n%
-                if (last_threshold is None or current_oi > last_threshold) and current_oi > avg_oi * 1.1:
-                    message = (
-                        f"{symbol}: "
-                        f"current: {shorten_number(current_oi)}, avg({DEFAULT_LIMIT}): {shorten_number(avg_oi)}, "
-                        f"deviation: {((current_oi - avg_oi) / avg_oi * 100):.2f}%"
-                    )
-                    logger.warning(message)
-                    # Запись лога в БД
-                    await db_manager.save_log(message)
-                    new_threshold = current_oi * 1.01
-                    await redis_client.client.set(last_threshold_key, new_threshold, ex=600)
-
-                elif (last_threshold is None or current_oi < last_threshold) and current_oi < avg_oi * 0.9:
-                    message = (
-                        f"{symbol}: "
-                        f"current: {shorten_number(current_oi)}, avg({DEFAULT_LIMIT}): {shorten_number(avg_oi)}, "
-                        f"deviation: {((current_oi - avg_oi) / avg_oi * 100):.2f}%"
-                    )
-                    logger.warning(message)
-                    # Запись лога в БД
-                    await db_manager.save_log(message)
-                    new_threshold = current_oi * 0.99
-                    await redis_client.client.set(last_threshold_key, new_threshold, ex=600)
-                break                
-            else:
-                if attempt == max_retries:
-                    logger.info(
-                        f"Недостаточно данных для анализа ({len(hist_data)}/{DEFAULT_LIMIT}) для {symbol}"
-                    )
-                else:
-                    # logger.error(
-                    #     f"Нет данных для анализа {symbol} "
-                    #     f"(попытка {attempt}/{max_retries})"
-                    # )
-                    await asyncio.sleep(3)
+        if event_time:
+            REDIS_ACK_LATENCY.observe(time.time() - event_time)
+
+        ready = [rule for rule in rules if rule.detector.ready(symbol)]
+        if not ready:
+            logger.info(
+                f"Недостаточно данных для анализа ("
+                + ", ".join(f"{rule.name}: {rule.detector.windows.count(symbol)}/{rule.window}" for rule in rules)
+                + f") для {symbol}"
+            )
+            return
+
+        # Текущее значение открытого интереса - одно на все правила
+        current_oi = float(data["openInterest"])
+        for rule in ready:
+            signal = rule.detector.evaluate(symbol, current_oi)
+            if signal is None:
+                continue
+            avg_oi, deviation, new_threshold = signal
+            # Сигнал уходит в Redis Stream и пакетом в БД, не задерживая оценку
+            emit_signal(alerts, rule, symbol, current_oi, avg_oi, deviation, new_threshold)
+            # Порог хранится в детекторе; ключ в Redis - для внешних потребителей
+            await redis_client.save_thresholds({symbol: new_threshold}, OI_THRESHOLD_TTL, rule.key_suffix)
 
     except Exception as e:
         logger.error(f"Ошибка в process_symbol_current_oi для {symbol}: {e}")
 
-async def process_symbol_hist(symbol: str, session, redis_client: RedisClient):
+async def process_symbol_hist(symbol: str, hist_cache: HistCache, redis_client: RedisClient,
+                              persister: HistoryPersister = None):
+    """
+    Обновляет историю символа по всем периодам правил через общий кэш: запрос
+    уходит, только когда закрылся новый период, и только за недостающими точками.
+    Новые точки получают все правила периода; точки основного периода ещё и
+    пишутся в Redis и MariaDB.
+    """
     try:
-        data = await fetch_open_interest(session, symbol, limit=DEFAULT_LIMIT)
-        # data = await fetch_open_interest(session, symbol, PERIOD, DEFAULT_LIMIT, max_retries=3, base_delay=1.0)
-        if not data:
-            return
-        await redis_client.push_open_interest_list(symbol, data, max_length=DEFAULT_LIMIT)
+        for period in hist_windows:
+            new_points = await hist_cache.refresh(symbol, period)
+            if not new_points:
+                continue
+            for rule in rules:
+                if rule.period == period:
+                    rule.detector.add_points(symbol, new_points)
+            if period != PERIOD:
+                continue
+            await redis_client.push_open_interest_list(symbol, new_points, max_length=hist_windows[PERIOD])
+            oi_value[symbol] = float(new_points[-1].get("sumOpenInterestValue") or 0)
+            if persister is not None:
+                # Ждёт только при заполненной очереди, если MariaDB не успевает
+                await persister.put(symbol, new_points)
     except Exception as e:
         logger.error(f"Ошибка в process_symbol_hist для {symbol}: {e}")
 
-async def current_oi_loop(session, redis_client: RedisClient, db_manager: DBManager):
+async def evaluate_current_oi_tick(symbols: list, client: BinanceRestClient, redis_client: RedisClient, alerts: AlertSink):
+    """
+    Векторный режим: текущий OI по всем символам собирается в массив,
+    отклонения и пороги считаются одним проходом, пороги пишутся одним
+    пайплайном, сигналы - одной пакетной вставкой.
+    """
+    responses = await asyncio.gather(*(fetch_current_open_interest(client, symbol) for symbol in symbols))
+    received = {symbol: data for symbol, data in zip(symbols, responses) if data}
+    if not received:
+        return
+    await redis_client.save_current_open_interest_many(received)
+
+    tick_symbols = list(received)
+    current = np.array([float(received[symbol]["openInterest"]) for symbol in tick_symbols])
+    fired = 0
+    not_ready = {}
+    elapsed = 0.0
+    for rule in rules:
+        started = time.perf_counter()
+        result = rule.detector.evaluate_batch(tick_symbols, current)
+        elapsed += time.perf_counter() - started
+
+        thresholds = {}
+        for i, avg_oi, deviation, threshold in zip(
+            result["fired"], result["avg"], result["deviation"], result["threshold"]
+        ):
+            symbol = tick_symbols[i]
+            thresholds[symbol] = float(threshold)
+            emit_signal(alerts, rule, symbol, current[i], avg_oi, deviation, threshold)
+        await redis_client.save_thresholds(thresholds, OI_THRESHOLD_TTL, rule.key_suffix)
+        fired += len(thresholds)
+        not_ready[rule.name] = len(tick_symbols) - int(result["ready"].sum())
+    EVAL_SECONDS.observe(elapsed)
+
+    logger.info(
+        f"Оценка тика: {len(tick_symbols)} символов, правил {len(rules)} за {elapsed * 1000:.3f} мс, "
+        f"сигналов {fired}, недостаточно данных: {not_ready}"
+    )
+
+def symbol_tier(symbol: str, positions: set, now: float) -> str:
+    if symbol in positions or now - last_alert_at.get(symbol, 0) < OI_RECENT_ALERT_SECONDS:
+        return "fast"
+    if 0 < oi_value.get(symbol, 0) < OI_ILLIQUID_VALUE:
+        return "slow"
+    return "normal"
+
+async def current_oi_loop(client: BinanceRestClient, redis_client: RedisClient, alerts: AlertSink, universe: UniverseLoader):
     logger.info("current_oi_loop started")
-    while True:
+    if OI_EVAL_MODE == "vector":
+        # Векторный режим оценивает весь тик сразу - опрос общим тиком без дрейфа
+        cycle_seconds = CYCLE_SECONDS.labels("current")
+        async for _ in ticks(OI_POLL_INTERVAL):
+            started = time.monotonic()
+            try:
+                # Список символов перечитывается на каждой итерации
+                symbols = await universe.load()
+                await evaluate_current_oi_tick(symbols, client, redis_client, alerts)
+            except Exception as e:
+                logger.error(f"Ошибка в цикле сбора текущего OI: {e}")
+            cycle_seconds.observe(time.monotonic() - started)
+        return
+
+    # Посимвольный режим: каждый символ со своим интервалом, опросы разнесены по интервалу
+    scheduler = PollScheduler(
+        lambda symbol: process_symbol_current_oi(symbol, client, redis_client, alerts),
+        {"fast": OI_POLL_FAST_INTERVAL, "normal": OI_POLL_INTERVAL, "slow": OI_POLL_SLOW_INTERVAL}
+    )
+    report = scheduler.report
+    metrics.gauge(
+        "openinterest_poll_target_per_min", "Целевое число опросов текущего OI в минуту",
+        lambda: {tier: item["target_per_min"] for tier, item in report().items()}, ["tier"]
+    )
+    metrics.gauge(
+        "openinterest_poll_achieved_per_min", "Фактическое число опросов текущего OI в минуту",
+        lambda: {tier: item["achieved_per_min"] for tier, item in report().items()}, ["tier"]
+    )
+    runner = asyncio.create_task(scheduler.run())
+    last_report = time.monotonic()
+    try:
+        async for _ in ticks(OI_PRIORITY_REFRESH):
+            try:
+                symbols = await universe.load()
+                try:
+                    positions = await redis_client.get_open_position_symbols()
+                except Exception as e:
+                    logger.error(f"Не удалось прочитать открытые позиции: {e}")
+                    positions = set()
+                now = time.time()
+                scheduler.sync({symbol: symbol_tier(symbol, positions, now) for symbol in symbols})
+            except Exception as e:
+                logger.error(f"Ошибка обновления расписания опроса текущего OI: {e}")
+            if time.monotonic() - last_report >= OI_SCHEDULE_REPORT_INTERVAL:
+                last_report = time.monotonic()
+                for tier, item in report().items():
+                    achieved = item["achieved_interval"]
+                    logger.info(
+                        f"Опрос {tier}: символов {item['symbols']}, интервал {item['target_interval']:.0f} с, "
+                        f"факт {f'{achieved:.1f} с' if achieved else '-'}, "
+                        f"опросов в минуту {item['achieved_per_min']:.1f}/{item['target_per_min']:.1f}"
+                    )
+                    if item["missed"] or item["skipped"]:
+                        logger.warning(f"Опрос {tier}: пропущено сроков {item['missed']}, занято {item['skipped']}")
+    finally:
+        runner.cancel()
+
+async def historical_oi_loop(hist_cache: HistCache, redis_client: RedisClient, universe: UniverseLoader,
+                             persister: HistoryPersister = None):
+    logger.info(f"historical_oi_loop started, правила: {rules}")
+    cycle_seconds = CYCLE_SECONDS.labels("historical")
+    # Тик - по самому короткому периоду; более длинные периоды берутся из кэша, пока не закроются
+    async for _ in ticks(min(PERIODS_MS[period] for period in hist_windows) / 1000):
+        started = time.monotonic()
         try:
             tasks = []
-            for stream in streams:
-                symbol = parse_symbol_from_stream(stream)
-                tasks.append(process_symbol_current_oi(symbol, session, redis_client, db_manager))
+            symbols = await universe.load()
+            hist_cache.discard(symbols)
+            for symbol in symbols:
+                tasks.append(process_symbol_hist(symbol, hist_cache, redis_client, persister))
             await asyncio.gather(*tasks, return_exceptions=True)
         except Exception as e:
-            logger.error(f"Ошибка в цикле сбора текущего OI: {e}")
-        await asyncio.sleep(60)  # Каждую минуту
+            logger.error(f"Ошибка в цикле сбора исторического OI: {e}")
+        cycle_seconds.observe(time.monotonic() - started)
 
-async def historical_oi_loop(session, redis_client: RedisClient):
-    logger.info("historical_oi_loop started")
+async def checkpoint_loop(redis_client: RedisClient):
     while True:
+        await asyncio.sleep(OI_CHECKPOINT_INTERVAL)
         try:
-            tasks = []
-            for stream in streams:
-                symbol = parse_symbol_from_stream(stream)
-                tasks.append(process_symbol_hist(symbol, session, redis_client))
-            await asyncio.gather(*tasks, return_exceptions=True)
+            for rule in rules:
+                await rule.detector.save_checkpoint(redis_client.client, rule.checkpoint_key)
         except Exception as e:
-            logger.error(f"Ошибка в цикле сбора исторического OI: {e}")
-        await asyncio.sleep(300)  # Каждые 5 минут
+            logger.error(f"Ошибка сохранения контрольной точки детектора: {e}")
+
+async def maintenance_loop(db_manager: DBManager):
+    """
+    Секции на будущее, агрегаты 1h/1d по последним корзинам и удаление секций старше срока хранения.
+    """
+    while True:
+        try:
+            result = await db_manager.series.maintain(OI_RETENTION_DAYS, days_ahead=OI_PARTITIONS_AHEAD)
+            logger.info(f"Обслуживание истории OI: {result}")
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания истории OI: {e}")
+        await asyncio.sleep(OI_MAINTENANCE_INTERVAL)
 
 async def main():
     redis_client = RedisClient(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
-    # Очистка данных при старте
-    await clear_redis_data_on_startup(redis_client)
+    # Окна детектора восстанавливаются из контрольной точки - анализ доступен сразу;
+    # окна старше OI_WARM_START_MAX_AGE пропускаются и набираются заново из истории
+    try:
+        for rule in rules:
+            restored = await rule.detector.load_checkpoint(
+                redis_client.client, rule.checkpoint_key, max_age=OI_WARM_START_MAX_AGE
+            )
+            logger.info(f"Детектор {rule.name} восстановлен из контрольной точки: {restored} символов")
+    except Exception as e:
+        logger.error(f"Не удалось загрузить контрольную точку детектора: {e}")
     # Подключение к БД: создаём экземпляр DBManager и инициализируем пул соединений
     db_manager = DBManager(
         host=DB_HOST,
@@ -332,12 +485,48 @@ async def main():
         db_name=DB_NAME
     )
     await db_manager.init_pool()
+    persister = HistoryPersister(
+        db_manager,
+        queue_size=PERSIST_QUEUE_SIZE,
+        batch_size=PERSIST_BATCH_SIZE,
+        flush_interval=PERSIST_FLUSH_INTERVAL
+    )
+    persister.start()
+    metrics.gauge("openinterest_persist_queue_depth", "Строк истории в очереди на запись в MariaDB", persister.pending)
+    metrics.gauge("openinterest_persist_rows", "Строк истории, записанных в MariaDB", lambda: persister.rows)
+    metrics.gauge(
+        "openinterest_persist_dropped", "Строк истории, отброшенных при долгой недоступности MariaDB",
+        lambda: persister.dropped
+    )
+    alerts = AlertSink(db_manager, redis_client.client)
+    alerts.start()
+    metrics.gauge(
+        "openinterest_alerts", "Сигналы детектора по этапам",
+        alerts.stats, ["stage"]
+    )
+    await metrics.start_metrics_server(METRICS_PORT)
 
-    timeout = aiohttp.ClientTimeout(total=30)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
+    async with rest_client as client:
+        universe = UniverseLoader(
+            redis_client.client, client,
+            cache_ttl=UNIVERSE_CACHE_TTL,
+            fallback=[parse_symbol_from_stream(stream) for stream in streams],
+            all_symbols=UNIVERSE_ALL_SYMBOLS
+        )
+        # Общий кэш openInterestHist по (symbol, period) для всех правил
+        hist_cache = HistCache(
+            lambda symbol, period, limit, start_time: fetch_open_interest(client, symbol, period, limit, start_time),
+            hist_windows,
+            settle_delay=OI_HIST_SETTLE_DELAY
+        )
+        metrics.gauge("openinterest_hist_cache", "Обращения к кэшу истории OI", hist_cache.stats, ["stage"])
+        # Устаревшие ключи удаляются, свежая история подгружается из БД - без ожидания 30 новых точек
+        await warm_start(redis_client, db_manager, hist_cache, await universe.load())
         await asyncio.gather(
-            current_oi_loop(session, redis_client, db_manager),
-            historical_oi_loop(session, redis_client)
+            current_oi_loop(client, redis_client, alerts, universe),
+            historical_oi_loop(hist_cache, redis_client, universe, persister),
+            checkpoint_loop(redis_client),
+            maintenance_loop(db_manager)
         )
 
 if __name__ == "__main__":
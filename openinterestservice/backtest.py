@@ -0,0 +1,274 @@
+"""
+Бэктест правил сигналов OI на сохранённой истории и перебор параметров.
+
+История open_interest_series читается из MariaDB кусками (keyset по
+(symbol, ts)) и раскладывается в матрицу символы x сетка времени периода.
+Логика детектора (среднее по окну, band, сдвиг порога на step и его
+время жизни - гистерезис last_threshold) воспроизводится векторно по всем
+символам сразу; шаги времени без кандидатов на сигнал пропускаются.
+Наборы параметров раздаются пулу процессов, матрица передаётся им через
+.npy с отображением в память, без копирования в каждый процесс.
+
+В качестве «текущего» OI берётся очередная точка истории, а среднее - по
+window предыдущим точкам; сервис опрашивает текущий OI чаще, поэтому
+абсолютное число сигналов в работе будет выше - бэктест для сравнения
+наборов параметров между собой.
+
+    python backtest.py --days 90 --windows 20,30,50 --bands 0.05,0.1,0.15 --steps 0.01 --ttls 600
+    python backtest.py --cache oi_90d.npz --windows 30 --bands 0.08,0.1,0.12 --csv sweep.csv
+Подключение - DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from db import DBManager
+from series import SERIES_TABLE
+
+PERIOD_MS = 5 * 60 * 1000
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Состояние процесса пула: матрица истории и среднее по последнему окну
+_values = None
+_timestamps = None
+_mean_cache = {}
+
+
+async def load_history(db_manager, since_ms: int, until_ms: int, symbols: list = None, chunk_size: int = 100_000):
+    """
+    Читает историю кусками по chunk_size строк. Возвращает (symbols, ts, values) -
+    массивы по строкам в порядке (symbol, ts).
+    """
+    symbol_filter = ""
+    filter_args = ()
+    if symbols:
+        symbol_filter = f"AND symbol IN ({', '.join(['%s'] * len(symbols))})"
+        filter_args = tuple(symbols)
+    sql = f"""
+        SELECT symbol, ts, sum_open_interest FROM {SERIES_TABLE}
+        WHERE (symbol > %s OR (symbol = %s AND ts > %s)) AND ts >= %s AND ts < %s {symbol_filter}
+        ORDER BY symbol, ts
+        LIMIT %s
+    """
+    names, stamps, values = [], [], []
+    last_symbol, last_ts = "", -1
+    started = time.monotonic()
+    total = 0
+    while True:
+        async with db_manager.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, (last_symbol, last_symbol, last_ts, since_ms, until_ms) + filter_args + (chunk_size,))
+                rows = await cur.fetchall()
+        if not rows:
+            break
+        names.extend(row[0] for row in rows)
+        stamps.append(np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows)))
+        values.append(np.fromiter((float(row[2]) for row in rows), dtype=np.float64, count=len(rows)))
+        last_symbol, last_ts = rows[-1][0], rows[-1][1]
+        total += len(rows)
+        print(f"Прочитано {total} строк ({total / (time.monotonic() - started):,.0f} строк/с), до {last_symbol}", flush=True)
+        if len(rows) < chunk_size:
+            break
+    if not total:
+        return np.array([], dtype=object), np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+    return np.array(names, dtype=object), np.concatenate(stamps), np.concatenate(values)
+
+
+def to_matrix(names: np.ndarray, stamps: np.ndarray, values: np.ndarray, period_ms: int = PERIOD_MS) -> tuple:
+    """
+    Строки истории -> (символы, сетка времени, матрица символы x время); пропуски - NaN.
+    """
+    symbols, rows = np.unique(names, return_inverse=True)
+    start = stamps.min() - stamps.min() % period_ms
+    columns = (stamps - start) // period_ms
+    grid = start + np.arange(columns.max() + 1, dtype=np.int64) * period_ms
+    matrix = np.full((len(symbols), len(grid)), np.nan)
+    matrix[rows, columns] = values
+    return symbols, grid, matrix
+
+
+def rolling_mean(matrix: np.ndarray, window: int) -> np.ndarray:
+    """
+    Среднее по window предыдущим ячейкам (без текущей); NaN, если среди них есть пропуск.
+    """
+    valid = ~np.isnan(matrix)
+    sums = np.zeros((matrix.shape[0], matrix.shape[1] + 1))
+    counts = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.where(valid, matrix, 0.0), axis=1, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+    mean = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] > window:
+        window_sums = sums[:, window:-1] - sums[:, :-window - 1]
+        window_counts = counts[:, window:-1] - counts[:, :-window - 1]
+        mean[:, window:] = np.where(window_counts == window, window_sums / window, np.nan)
+    return mean
+
+
+def replay(matrix: np.ndarray, timestamps: np.ndarray, mean: np.ndarray, band: float, step: float,
+           ttl_ms: int) -> dict:
+    """
+    Логика OpenInterestDetector.evaluate_batch по всем шагам времени.
+    Возвращает число сигналов вверх/вниз и по символам.
+    """
+    # Без пробития band сигнала нет при любом пороге - такие шаги не нужны
+    with np.errstate(invalid="ignore"):
+        upper = matrix > mean * (1 + band)
+        lower = matrix < mean * (1 - band)
+    candidates = np.flatnonzero((upper | lower).any(axis=0))
+
+    thresholds = np.full(matrix.shape[0], np.nan)
+    expires = np.full(matrix.shape[0], np.iinfo(np.int64).min)
+    per_symbol = np.zeros(matrix.shape[0], dtype=np.int64)
+    up_total = down_total = 0
+    for column in candidates:
+        current = matrix[:, column]
+        no_threshold = expires <= timestamps[column]
+        with np.errstate(invalid="ignore"):
+            up = upper[:, column] & (no_threshold | (current > thresholds))
+            down = lower[:, column] & ~up & (no_threshold | (current < thresholds))
+        fired = up | down
+        if not fired.any():
+            continue
+        thresholds[up] = current[up] * (1 + step)
+        thresholds[down] = current[down] * (1 - step)
+        expires[fired] = timestamps[column] + ttl_ms
+        per_symbol += fired
+        up_total += int(up.sum())
+        down_total += int(down.sum())
+    return {"up": up_total, "down": down_total, "per_symbol": per_symbol, "steps": len(candidates)}
+
+
+def _init_worker(values_path: str, timestamps_path: str):
+    global _values, _timestamps
+    _values = np.load(values_path, mmap_mode="r")
+    _timestamps = np.load(timestamps_path)
+
+
+def _mean(window: int) -> np.ndarray:
+    # Параметры отсортированы по окну - в процессе держим среднее только по последнему
+    if window not in _mean_cache:
+        _mean_cache.clear()
+        _mean_cache[window] = rolling_mean(_values, window)
+    return _mean_cache[window]
+
+
+def run_params(params: tuple) -> dict:
+    window, band, step, ttl = params
+    started = time.perf_counter()
+    result = replay(_values, _timestamps, _mean(window), band, step, int(ttl * 1000))
+    days = max((_timestamps[-1] - _timestamps[0]) / DAY_MS, 1 / 288)
+    alerts = result["up"] + result["down"]
+    return {
+        "window": window,
+        "band": band,
+        "step": step,
+        "ttl": ttl,
+        "alerts": alerts,
+        "up": result["up"],
+        "down": result["down"],
+        "symbols": int((result["per_symbol"] > 0).sum()),
+        "per_symbol_day": alerts / len(result["per_symbol"]) / days,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def sweep(grid: np.ndarray, matrix: np.ndarray, param_sets: list, processes: int) -> list:
+    param_sets = sorted(param_sets)
+    with tempfile.TemporaryDirectory() as tmp:
+        values_path = os.path.join(tmp, "values.npy")
+        timestamps_path = os.path.join(tmp, "ts.npy")
+        np.save(values_path, matrix)
+        np.save(timestamps_path, grid)
+        chunksize = max(1, len(param_sets) // (processes * 4))
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=(values_path, timestamps_path)) as pool:
+            return list(pool.map(run_params, param_sets, chunksize=chunksize))
+
+
+def parse_list(value: str, cast) -> list:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+async def read_from_db(args) -> tuple:
+    db_manager = DBManager(
+        host=os.getenv("DB_HOST", "127.0.0.1"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER", "myuser"),
+        password=os.getenv("DB_PASSWORD", "mypass"),
+        db_name=os.getenv("DB_NAME", "open_interest_db")
+    )
+    await db_manager.init_pool()
+    try:
+        until_ms = int(time.time() * 1000)
+        since_ms = until_ms - args.days * DAY_MS
+        symbols = parse_list(args.symbols, str) if args.symbols else None
+        return await load_history(db_manager, since_ms, until_ms, symbols, args.chunk_size)
+    finally:
+        await db_manager.close_pool()
+
+
+def main(args):
+    started = time.monotonic()
+    if args.cache and os.path.exists(args.cache):
+        data = np.load(args.cache, allow_pickle=True)
+        symbols, grid, matrix = data["symbols"], data["grid"], data["matrix"]
+        print(f"История из {args.cache}")
+    else:
+        names, stamps, values = asyncio.run(read_from_db(args))
+        if not len(names):
+            print("История за период пуста")
+            return
+        symbols, grid, matrix = to_matrix(names, stamps, values)
+        if args.cache:
+            np.savez(args.cache, symbols=symbols, grid=grid, matrix=matrix)
+    print(
+        f"Матрица {len(symbols)} символов x {len(grid)} точек "
+        f"({(grid[-1] - grid[0]) / DAY_MS:.1f} суток), подготовка {time.monotonic() - started:.1f} с"
+    )
+
+    param_sets = list(itertools.product(
+        parse_list(args.windows, int), parse_list(args.bands, float),
+        parse_list(args.steps, float), parse_list(args.ttls, int)
+    ))
+    started = time.monotonic()
+    results = sweep(grid, matrix, param_sets, args.processes)
+    elapsed = time.monotonic() - started
+    results.sort(key=lambda item: (item["window"], item["band"], item["step"], item["ttl"]))
+
+    print(f"{'window':>6} {'band':>6} {'step':>6} {'ttl':>6} {'alerts':>8} {'up':>7} {'down':>7} "
+          f"{'symbols':>7} {'/sym/day':>8} {'sec':>6}")
+    for item in results:
+        print(
+            f"{item['window']:>6} {item['band']:>6.3f} {item['step']:>6.3f} {item['ttl']:>6} {item['alerts']:>8} "
+            f"{item['up']:>7} {item['down']:>7} {item['symbols']:>7} {item['per_symbol_day']:>8.3f} "
+            f"{item['seconds']:>6.2f}"
+        )
+    print(f"{len(results)} наборов за {elapsed:.1f} с ({args.processes} процессов)")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--symbols", default="", help="через запятую; по умолчанию - все")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--cache", default="", help=".npz с матрицей истории: читается, если есть, иначе сохраняется")
+    parser.add_argument("--windows", default="30")
+    parser.add_argument("--bands", default="0.1")
+    parser.add_argument("--steps", default="0.01")
+    parser.add_argument("--ttls", default="600", help="время жизни порога, с")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--csv", default="", help="сохранить результаты в CSV")
+    main(parser.parse_args())
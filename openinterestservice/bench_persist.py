@@ -0,0 +1,84 @@
+"""
+Сравнение скорости записи истории OI в MariaDB: построчный INSERT против
+пакетного executemany через HistoryPersister.
+
+Пишет в отдельную базу (по умолчанию oi_bench), подключение - DB_HOST/DB_PORT/DB_USER/DB_PASSWORD:
+    python bench_persist.py --symbols 400 --points 30
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from db import DBManager
+from persister import HistoryPersister
+from series import SERIES_TABLE
+
+
+def make_points(symbols: int, points: int, base_ts: int) -> dict:
+    return {
+        f"SYM{i}USDT": [
+            {
+                "timestamp": base_ts + j * 300_000,
+                "sumOpenInterest": f"{1000 + j:.8f}",
+                "sumOpenInterestValue": f"{100000 + j:.8f}",
+            }
+            for j in range(points)
+        ]
+        for i in range(symbols)
+    }
+
+
+async def truncate(db_manager: DBManager):
+    async with db_manager.pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"TRUNCATE TABLE {SERIES_TABLE}")
+
+
+async def bench_row_by_row(db_manager: DBManager, data: dict) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(db_manager.save_open_interest_row_by_row(symbol, points) for symbol, points in data.items()))
+    return time.perf_counter() - started
+
+
+async def bench_persister(db_manager: DBManager, data: dict, batch_size: int) -> float:
+    persister = HistoryPersister(db_manager, batch_size=batch_size, flush_interval=0.05)
+    persister.start()
+    started = time.perf_counter()
+    for symbol, points in data.items():
+        await persister.put(symbol, points)
+    await persister.stop()
+    return time.perf_counter() - started
+
+
+async def main(args):
+    db_manager = DBManager(
+        host=os.getenv("DB_HOST", "127.0.0.1"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER", "myuser"),
+        password=os.getenv("DB_PASSWORD", "mypass"),
+        db_name=args.db
+    )
+    await db_manager.init_pool()
+    data = make_points(args.symbols, args.points, 1_700_000_000_000)
+    rows = args.symbols * args.points
+
+    await truncate(db_manager)
+    seconds = await bench_row_by_row(db_manager, data)
+    print(f"Построчно:      {rows} строк за {seconds:.2f} с, {rows / seconds:,.0f} строк/с")
+
+    await truncate(db_manager)
+    seconds = await bench_persister(db_manager, data, args.batch_size)
+    print(f"Пакетами {args.batch_size}: {rows} строк за {seconds:.2f} с, {rows / seconds:,.0f} строк/с")
+
+    await truncate(db_manager)
+    await db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="oi_bench")
+    parser.add_argument("--symbols", type=int, default=400)
+    parser.add_argument("--points", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,8 @@
 import aiomysql
 import logging
 
+from series import OpenInterestSeries, SERIES_TABLE
+
 logger = logging.getLogger(__name__)
 
 class DBManager:
@@ -12,6 +14,7 @@ class DBManager:
         self.password = password
         self.db_name = db_name
         self.pool = None
+        self.series = None
 
     async def init_pool(self):
         try:
@@ -39,28 +42,10 @@ class DBManager:
             maxsize=5
         )
 
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS open_interest_history (
-            id BIGINT AUTO_INCREMENT PRIMARY KEY,
-            symbol VARCHAR(20) NOT NULL,
-            timestamp BIGINT NOT NULL,
-            sum_open_interest VARCHAR(50),
-            sum_open_interest_value VARCHAR(50),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        unique_index_sql = """
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_symbol_timestamp
-        ON open_interest_history (symbol, timestamp);
-        """
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(create_table_sql)
-                try:
-                    await cur.execute(unique_index_sql)
-                except Exception as e:
-                    logger.warning(f"Не удалось создать уникальный индекс (возможно, уже существует): {e}")
-        logger.info("Таблица open_interest_history и индекс проверены/созданы")
+        # История OI: секционированная таблица с числовыми колонками (см. series.py).
+        # Прежняя open_interest_history больше не пишется - перенос в migrate_series.py
+        self.series = OpenInterestSeries(self.pool)
+        await self.series.init_schema()
 
         # Создаём новую таблицу для логов
         create_log_table_sql = """
@@ -84,10 +69,27 @@ class DBManager:
     async def save_open_interest(self, symbol: str, oi_data: list):
         if not oi_data:
             return
+        await self.save_open_interest_rows([
+            (symbol, oi.get("timestamp", 0), oi.get("sumOpenInterest", ""), oi.get("sumOpenInterestValue", ""))
+            for oi in oi_data
+        ])
 
-        insert_sql = """
-            INSERT IGNORE INTO open_interest_history
-            (symbol, timestamp, sum_open_interest, sum_open_interest_value)
+    async def save_open_interest_rows(self, rows: list):
+        """
+        Пакетная вставка строк (symbol, timestamp, sum_open_interest, sum_open_interest_value)
+        в open_interest_series одним executemany: aiomysql отправляет её многострочным INSERT.
+        Строки без значений пропускаются - колонки числовые и NOT NULL.
+        """
+        rows = [row for row in rows if row[2] not in ("", None) and row[3] not in ("", None)]
+        await self.series.save_rows(rows)
+
+    async def save_open_interest_row_by_row(self, symbol: str, oi_data: list):
+        """
+        Прежний построчный путь (отдельный execute на строку) - для сравнения в bench_persist.py.
+        """
+        insert_sql = f"""
+            INSERT IGNORE INTO {SERIES_TABLE}
+            (symbol, ts, sum_open_interest, sum_open_interest_value)
             VALUES (%s, %s, %s, %s)
         """
 
@@ -106,7 +108,7 @@ class DBManager:
         """
         Возвращает максимальный (последний) timestamp для заданного символа из БД.
         """
-        query = "SELECT MAX(timestamp) FROM open_interest_history WHERE symbol = %s"
+        query = f"SELECT MAX(ts) FROM {SERIES_TABLE} WHERE symbol = %s"
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(query, (symbol,))
@@ -117,7 +119,7 @@ class DBManager:
         """
         Возвращает список timestamp последних записей для заданного символа из БД.
         """
-        query = "SELECT timestamp FROM open_interest_history WHERE symbol = %s ORDER BY timestamp DESC LIMIT %s"
+        query = f"SELECT ts FROM {SERIES_TABLE} WHERE symbol = %s ORDER BY ts DESC LIMIT %s"
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cur:
                 await cur.execute(query, (symbol, limit))
@@ -136,4 +138,19 @@ class DBManager:
                 try:
                     await cur.execute(insert_sql, (log_message,))
                 except Exception as e:
-                    logger.error(f"Ошибка при вставке лога: {e}")
\ No newline at end of file
+                    logger.error(f"Ошибка при вставке лога: {e}")
+
+    async def save_logs(self, log_messages: list):
+        """
+        Пакетная вставка логов одним executemany (многострочный INSERT).
+        Ошибки пробрасываются - повтор на стороне вызывающего (AlertSink).
+        """
+        if not log_messages:
+            return
+        insert_sql = """
+            INSERT INTO open_interest_log (log_message)
+            VALUES (%s)
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(insert_sql, [(message,) for message in log_messages])
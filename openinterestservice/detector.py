@@ -0,0 +1,282 @@
+"""
+Потоковый детектор отклонений открытого интереса.
+
+Точки openInterestHist по каждому символу лежат в кольцевом буфере
+(строка NumPy-массива на символ), сумма, сумма квадратов и EWMA окна
+обновляются за O(1) при поступлении точки. Оценка текущего OI не требует
+ни чтения Redis, ни разбора JSON. В Redis хранится только контрольная
+точка (oi_detector:checkpoint) для быстрого старта после перезапуска.
+"""
+import json
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "oi_detector:checkpoint"
+
+
+class OpenInterestWindows:
+    """
+    Скользящие окна последних window точек по символам.
+    """
+
+    def __init__(self, window: int = 30, ewma_alpha: float = None, capacity: int = 512):
+        self.window = window
+        self.ewma_alpha = ewma_alpha if ewma_alpha is not None else 2 / (window + 1)
+        self.rows = {}
+        self.values = np.zeros((capacity, window))
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.positions = np.zeros(capacity, dtype=np.int64)
+        self.sums = np.zeros(capacity)
+        self.sumsq = np.zeros(capacity)
+        self.ewma = np.zeros(capacity)
+        self.last_ts = np.full(capacity, -1, dtype=np.int64)
+
+    def _grow(self):
+        capacity = len(self.counts) * 2
+        for name in ("values", "counts", "positions", "sums", "sumsq", "ewma", "last_ts"):
+            array = getattr(self, name)
+            fill = -1 if name == "last_ts" else 0
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def row(self, symbol: str) -> int:
+        row = self.rows.get(symbol)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.counts):
+                self._grow()
+            self.rows[symbol] = row
+        return row
+
+    def push(self, symbol: str, timestamp: int, value: float) -> bool:
+        """
+        Добавляет точку; точки не новее последней учтённой пропускаются.
+        """
+        row = self.row(symbol)
+        if timestamp <= self.last_ts[row]:
+            return False
+        pos = self.positions[row]
+        old = self.values[row, pos]
+        self.values[row, pos] = value
+        if self.counts[row] < self.window:
+            self.counts[row] += 1
+            self.sums[row] += value
+            self.sumsq[row] += value * value
+            self.ewma[row] = value if self.counts[row] == 1 else self.ewma[row] + self.ewma_alpha * (value - self.ewma[row])
+        else:
+            self.sums[row] += value - old
+            self.sumsq[row] += value * value - old * old
+            self.ewma[row] += self.ewma_alpha * (value - self.ewma[row])
+        pos = (pos + 1) % self.window
+        self.positions[row] = pos
+        if pos == 0:
+            # Раз в оборот окна пересчитываем суммы точно, чтобы не копилась ошибка округления
+            count = self.counts[row]
+            self.sums[row] = self.values[row, :count].sum()
+            self.sumsq[row] = np.square(self.values[row, :count]).sum()
+        self.last_ts[row] = timestamp
+        return True
+
+    def push_points(self, symbol: str, points: list) -> int:
+        """
+        Точки openInterestHist ({"timestamp", "sumOpenInterest", ...}) в порядке времени.
+        """
+        added = 0
+        for item in points:
+            if self.push(symbol, int(item["timestamp"]), float(item["sumOpenInterest"])):
+                added += 1
+        return added
+
+    def ready(self, symbol: str) -> bool:
+        row = self.rows.get(symbol)
+        return row is not None and self.counts[row] >= self.window
+
+    def count(self, symbol: str) -> int:
+        row = self.rows.get(symbol)
+        return 0 if row is None else int(self.counts[row])
+
+    def mean(self, symbol: str) -> float:
+        row = self.rows[symbol]
+        return float(self.sums[row] / self.counts[row])
+
+    def std(self, symbol: str) -> float:
+        row = self.rows[symbol]
+        count = self.counts[row]
+        mean = self.sums[row] / count
+        return float(np.sqrt(max(self.sumsq[row] / count - mean * mean, 0.0)))
+
+    def ordered(self, symbol: str) -> tuple:
+        """
+        Значения окна от старых к новым и метка времени последней точки.
+        """
+        row = self.rows[symbol]
+        count = self.counts[row]
+        if count < self.window:
+            values = self.values[row, :count]
+        else:
+            values = np.roll(self.values[row], -self.positions[row])
+        return values.tolist(), int(self.last_ts[row])
+
+    def restore(self, symbol: str, values: list, last_ts: int):
+        row = self.row(symbol)
+        values = values[-self.window:]
+        self.values[row] = 0.0
+        self.values[row, :len(values)] = values
+        self.counts[row] = len(values)
+        self.positions[row] = len(values) % self.window
+        self.sums[row] = float(np.sum(values))
+        self.sumsq[row] = float(np.sum(np.square(values)))
+        ewma = values[0] if values else 0.0
+        for value in values[1:]:
+            ewma += self.ewma_alpha * (value - ewma)
+        self.ewma[row] = ewma
+        self.last_ts[row] = last_ts
+
+
+class OpenInterestDetector:
+    """
+    Сравнивает текущий OI со средним по окну: сигнал, если отклонение больше band,
+    и текущий OI пробил последний порог. Новый порог (ttl секунд) сдвигается
+    на step от текущего значения, чтобы не сигналить на каждом тике.
+
+    Пороги хранятся массивами по тем же строкам, что и окна, поэтому сразу
+    весь тик можно оценить одним векторным проходом (evaluate_batch).
+    """
+
+    def __init__(self, window: int = 30, band: float = 0.1, step: float = 0.01, threshold_ttl: float = 600):
+        self.windows = OpenInterestWindows(window)
+        self.band = band
+        self.step = step
+        self.threshold_ttl = threshold_ttl
+        self.thresholds = np.full(len(self.windows.counts), np.nan)
+        # Unix-время истечения порога
+        self.expires = np.zeros(len(self.windows.counts))
+
+    def _ensure_rows(self):
+        capacity = len(self.windows.counts)
+        if len(self.thresholds) < capacity:
+            grown = np.full(capacity, np.nan)
+            grown[:len(self.thresholds)] = self.thresholds
+            self.thresholds = grown
+            expires = np.zeros(capacity)
+            expires[:len(self.expires)] = self.expires
+            self.expires = expires
+
+    def _row(self, symbol: str) -> int:
+        row = self.windows.row(symbol)
+        self._ensure_rows()
+        return row
+
+    def add_points(self, symbol: str, points: list) -> int:
+        added = self.windows.push_points(symbol, points)
+        self._ensure_rows()
+        return added
+
+    def ready(self, symbol: str) -> bool:
+        return self.windows.ready(symbol)
+
+    def last_threshold(self, symbol: str):
+        row = self.windows.rows.get(symbol)
+        if row is None or np.isnan(self.thresholds[row]) or self.expires[row] <= time.time():
+            return None
+        return float(self.thresholds[row])
+
+    def _set_threshold(self, rows, values, now: float):
+        self.thresholds[rows] = values
+        self.expires[rows] = now + self.threshold_ttl
+
+    def evaluate(self, symbol: str, current_oi: float):
+        """
+        Возвращает (среднее, отклонение в долях, новый порог) при сигнале, иначе None.
+        Окно должно быть заполнено (см. ready).
+        """
+        avg_oi = self.windows.mean(symbol)
+        last_threshold = self.last_threshold(symbol)
+        if (last_threshold is None or current_oi > last_threshold) and current_oi > avg_oi * (1 + self.band):
+            new_threshold = current_oi * (1 + self.step)
+        elif (last_threshold is None or current_oi < last_threshold) and current_oi < avg_oi * (1 - self.band):
+            new_threshold = current_oi * (1 - self.step)
+        else:
+            return None
+        self._set_threshold(self._row(symbol), new_threshold, time.time())
+        return avg_oi, (current_oi - avg_oi) / avg_oi, new_threshold
+
+    def evaluate_batch(self, symbols: list, current: np.ndarray) -> dict:
+        """
+        Оценивает тик по всем символам сразу (та же логика, что в evaluate).
+        Символы с незаполненным окном пропускаются.
+
+        Возвращает массивы: ready - маска символов с заполненным окном,
+        fired - индексы символов с сигналом, avg / deviation / threshold - по fired.
+        """
+        now = time.time()
+        rows = np.fromiter((self._row(symbol) for symbol in symbols), dtype=np.int64, count=len(symbols))
+        current = np.asarray(current, dtype=np.float64)
+        counts = self.windows.counts[rows]
+        ready = counts >= self.windows.window
+        avg = self.windows.sums[rows] / np.maximum(counts, 1)
+
+        thresholds = self.thresholds[rows]
+        no_threshold = np.isnan(thresholds) | (self.expires[rows] <= now)
+        up = ready & (no_threshold | (current > thresholds)) & (current > avg * (1 + self.band))
+        down = ready & ~up & (no_threshold | (current < thresholds)) & (current < avg * (1 - self.band))
+
+        fired = np.flatnonzero(up | down)
+        new_thresholds = np.where(up[fired], current[fired] * (1 + self.step), current[fired] * (1 - self.step))
+        self._set_threshold(rows[fired], new_thresholds, now)
+        return {
+            "ready": ready,
+            "fired": fired,
+            "avg": avg[fired],
+            "deviation": (current[fired] - avg[fired]) / avg[fired],
+            "threshold": new_thresholds,
+        }
+
+    async def save_checkpoint(self, client, key: str = CHECKPOINT_KEY):
+        """
+        Сохраняет окна и пороги в хеш key (по умолчанию oi_detector:checkpoint) одним пайплайном.
+        """
+        mapping = {}
+        now = time.time()
+        for symbol, row in self.windows.rows.items():
+            values, last_ts = self.windows.ordered(symbol)
+            item = {"ts": last_ts, "v": values}
+            if not np.isnan(self.thresholds[row]) and self.expires[row] > now:
+                item["thr"], item["thr_exp"] = float(self.thresholds[row]), float(self.expires[row])
+            mapping[symbol] = json.dumps(item)
+        if not mapping:
+            return
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=mapping)
+            await pipe.execute()
+
+    async def load_checkpoint(self, client, key: str = CHECKPOINT_KEY, max_age: float = None) -> int:
+        """
+        Восстанавливает окна и непросроченные пороги; возвращает число символов.
+        Окна, последняя точка которых старше max_age секунд (долгий простой),
+        не восстанавливаются: иначе детектор сразу считался бы готовым и сравнивал
+        текущий OI со средним давно прошедшего окна.
+        """
+        raw = await client.hgetall(key)
+        now = time.time()
+        cutoff = (now - max_age) * 1000 if max_age else None
+        restored = 0
+        for symbol, value in raw.items():
+            item = json.loads(value)
+            if cutoff is not None and item["ts"] < cutoff:
+                continue
+            self.windows.restore(symbol, item["v"], item["ts"])
+            row = self._row(symbol)
+            if "thr" in item and item["thr_exp"] > now:
+                self.thresholds[row] = item["thr"]
+                self.expires[row] = item["thr_exp"]
+            restored += 1
+        if restored < len(raw):
+            logger.info(f"Контрольная точка {key}: пропущено устаревших окон: {len(raw) - restored}")
+        return restored
@@ -0,0 +1,140 @@
+"""
+Общий кэш openInterestHist по (symbol, period).
+
+Новая точка периода появляется только после его закрытия, поэтому запись
+кэша живёт до следующего закрытия (плюс settle_delay на публикацию у
+Binance). Все правила с одним периодом читают одну запись, и пока она
+свежая, запросов к бирже нет. По истечении догружаются только недостающие
+точки (startTime от последней), одновременные обновления одного ключа
+объединяются в один запрос.
+"""
+import asyncio
+import logging
+import time
+
+from rules import PERIODS_MS
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+    __slots__ = ("points", "expires")
+
+    def __init__(self):
+        self.points = []
+        self.expires = 0.0
+
+
+class HistCache:
+    """
+    fetch(symbol, period, limit, start_time) - корутина запроса openInterestHist,
+    возвращает список точек (пустой при ошибке).
+    capacities - {period: сколько последних точек хранить}.
+    """
+
+    def __init__(self, fetch, capacities: dict, settle_delay: float = 15.0):
+        self.fetch = fetch
+        self.capacities = dict(capacities)
+        self.settle_delay = settle_delay
+        self._entries = {}
+        self._inflight = {}
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def _entry(self, symbol: str, period: str) -> _CacheEntry:
+        entry = self._entries.get((symbol, period))
+        if entry is None:
+            entry = self._entries[(symbol, period)] = _CacheEntry()
+        return entry
+
+    def _expiry(self, period: str, last_ts: int) -> float:
+        # Следующая точка ожидается через период после последней (та же логика, что и missing в _update)
+        return (last_ts + PERIODS_MS[period]) / 1000 + self.settle_delay
+
+    def points(self, symbol: str, period: str) -> list:
+        entry = self._entries.get((symbol, period))
+        return entry.points if entry is not None else []
+
+    def seed(self, symbol: str, period: str, points: list):
+        """
+        Заполняет запись готовыми точками (например, из БД при быстром старте).
+        """
+        if not points:
+            return
+        entry = self._entry(symbol, period)
+        last_ts = int(entry.points[-1]["timestamp"]) if entry.points else -1
+        entry.points = (entry.points + [item for item in points if int(item["timestamp"]) > last_ts])[-self.capacities[period]:]
+        entry.expires = self._expiry(period, int(entry.points[-1]["timestamp"]))
+
+    def discard(self, symbols):
+        """
+        Удаляет записи символов, которых больше нет в списке.
+        """
+        symbols = set(symbols)
+        for key in [key for key in self._entries if key[0] not in symbols]:
+            del self._entries[key]
+
+    async def refresh(self, symbol: str, period: str) -> list:
+        """
+        Обновляет запись, если она устарела. Возвращает новые точки (пустой список,
+        если запись свежая или у биржи пока нет новых).
+        """
+        key = (symbol, period)
+        entry = self._entry(symbol, period)
+        if time.time() < entry.expires:
+            self.hits += 1
+            return []
+        future = self._inflight.get(key)
+        if future is not None:
+            # Запись уже обновляется - новые точки получит тот, кто начал обновление
+            await asyncio.shield(future)
+            return []
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            new_points = await self._update(symbol, period, entry)
+            future.set_result(None)
+            return new_points
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_result(None)
+            logger.error(f"Ошибка обновления кэша истории OI {symbol} {period}: {e}")
+            return []
+        finally:
+            del self._inflight[key]
+
+    async def _update(self, symbol: str, period: str, entry: _CacheEntry) -> list:
+        capacity = self.capacities[period]
+        period_ms = PERIODS_MS[period]
+        now_ms = int(time.time() * 1000)
+        last_ts = int(entry.points[-1]["timestamp"]) if entry.points else None
+        if last_ts is None:
+            limit, start_time = capacity, None
+        else:
+            missing = (now_ms - last_ts) // period_ms
+            if missing < 1:
+                entry.expires = self._expiry(period, last_ts)
+                return []
+            # Пропуск длиннее окна - достаточно последних capacity точек
+            limit, start_time = (capacity, None) if missing > capacity else (missing, last_ts + 1)
+
+        self.requests += 1
+        data = await self.fetch(symbol, period, limit, start_time)
+        # Биржа может вернуть уже сохранённую точку - берём только более новые
+        new_points = [item for item in data or [] if last_ts is None or int(item["timestamp"]) > last_ts]
+        if new_points:
+            entry.points = (entry.points + new_points)[-capacity:]
+            entry.expires = self._expiry(period, int(entry.points[-1]["timestamp"]))
+        else:
+            # Ошибка или точка ещё не опубликована - повторим чуть позже
+            entry.expires = time.time() + self.settle_delay
+        return new_points
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "requests": self.requests, "entries": len(self._entries)}
@@ -0,0 +1,109 @@
+"""
+Перенос истории OI из open_interest_history (VARCHAR, автоинкрементный id)
+в секционированную open_interest_series с последующим построением агрегатов.
+
+Строки копируются на стороне сервера (INSERT ... SELECT) диапазонами id по
+--batch-size, между пакетами - пауза --pause, чтобы не мешать сервису.
+Перенос можно прервать и продолжить с последнего выведенного id:
+    python migrate_series.py --batch-size 50000
+    python migrate_series.py --start-id 1250000
+Подключение - DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from db import DBManager
+from series import DAY_MS, ROLLUP_RESOLUTIONS, SERIES_TABLE, day_start
+
+LEGACY_TABLE = "open_interest_history"
+
+COPY_SQL = f"""
+    INSERT IGNORE INTO {SERIES_TABLE} (symbol, ts, sum_open_interest, sum_open_interest_value)
+    SELECT symbol, timestamp,
+           CAST(sum_open_interest AS DECIMAL(36, 8)),
+           CAST(sum_open_interest_value AS DECIMAL(36, 8))
+    FROM {LEGACY_TABLE}
+    WHERE id > %s AND id <= %s
+      AND sum_open_interest IS NOT NULL AND sum_open_interest <> ''
+      AND sum_open_interest_value IS NOT NULL AND sum_open_interest_value <> ''
+"""
+
+
+async def fetchone(db_manager: DBManager, sql: str, args=None):
+    async with db_manager.pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, args)
+            return await cur.fetchone()
+
+
+async def copy_rows(db_manager: DBManager, start_id: int, max_id: int, batch_size: int, pause: float) -> int:
+    copied = 0
+    last_id = start_id
+    started = time.monotonic()
+    while last_id < max_id:
+        upper = min(last_id + batch_size, max_id)
+        async with db_manager.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                copied += await cur.execute(COPY_SQL, (last_id, upper))
+        last_id = upper
+        elapsed = time.monotonic() - started
+        print(f"id {last_id}/{max_id}: перенесено {copied} строк, {copied / elapsed:,.0f} строк/с", flush=True)
+        if pause:
+            await asyncio.sleep(pause)
+    return copied
+
+
+async def build_rollups(db_manager: DBManager, first_ts: int, last_ts: int, chunk_days: int):
+    # Агрегаты строятся кусками по chunk_days суток, чтобы не держать один долгий запрос
+    chunk = chunk_days * DAY_MS
+    for since in range(day_start(first_ts), last_ts + 1, chunk):
+        for resolution in ROLLUP_RESOLUTIONS:
+            await db_manager.series.build_rollups(resolution, since, since + chunk)
+        print(f"Агрегаты построены до {time.strftime('%Y-%m-%d', time.gmtime((since + chunk) / 1000))}", flush=True)
+
+
+async def main(args):
+    db_manager = DBManager(
+        host=os.getenv("DB_HOST", "127.0.0.1"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        user=os.getenv("DB_USER", "myuser"),
+        password=os.getenv("DB_PASSWORD", "mypass"),
+        db_name=os.getenv("DB_NAME", "open_interest_db")
+    )
+    await db_manager.init_pool()
+    try:
+        exists = await fetchone(
+            db_manager,
+            "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (LEGACY_TABLE,)
+        )
+        if not exists[0]:
+            print(f"Таблицы {LEGACY_TABLE} нет - переносить нечего")
+            return
+        max_id, first_ts, last_ts = await fetchone(
+            db_manager, f"SELECT MAX(id), MIN(timestamp), MAX(timestamp) FROM {LEGACY_TABLE}"
+        )
+        if max_id is None:
+            print(f"Таблица {LEGACY_TABLE} пуста - переносить нечего")
+            return
+
+        # Прошлым данным нужны свои суточные секции, иначе всё ляжет в p_before
+        await db_manager.series.ensure_history_partitions(first_ts)
+        copied = await copy_rows(db_manager, args.start_id, max_id, args.batch_size, args.pause)
+        print(f"Перенесено {copied} строк из {LEGACY_TABLE} в {SERIES_TABLE}")
+        if not args.skip_rollups:
+            await build_rollups(db_manager, first_ts, last_ts, args.rollup_chunk_days)
+    finally:
+        await db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start-id", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--pause", type=float, default=0.1)
+    parser.add_argument("--skip-rollups", action="store_true")
+    parser.add_argument("--rollup-chunk-days", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
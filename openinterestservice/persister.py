@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryPersister:
+    """
+    Фоновая запись истории OI в MariaDB.
+
+    Цикл истории кладёт точки в ограниченную очередь и не ждёт базу; фоновая
+    задача собирает строки в пакеты по batch_size или раз в flush_interval
+    секунд и пишет их одним executemany (aiomysql превращает его в
+    многострочный INSERT). Если база не успевает и очередь заполнена,
+    put() ждёт - цикл истории притормаживает вместо роста памяти.
+    Пакет, не записанный за max_retries попыток, не теряется: его строки
+    пишутся первыми в следующих пакетах. Таких строк в памяти не больше
+    ёмкости очереди; при долгом простое базы самые старые отбрасываются
+    (счётчик dropped).
+    """
+
+    def __init__(self, db_manager, queue_size: int = 10000, batch_size: int = 1000, flush_interval: float = 1.0,
+                 max_retries: int = 3):
+        self.db_manager = db_manager
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._task = None
+        # Строки неудавшихся пакетов, ждущие повторной записи
+        self._failed = deque()
+
+        # Статистика
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.blocked = 0
+        self.dropped = 0
+        self._write_seconds = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Дописывает всё, что осталось в очереди, и останавливает задачу.
+        """
+        if self._task is not None:
+            await self.queue.join()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._failed:
+            rows = list(self._failed)
+            self._failed.clear()
+            await self._write(rows)
+
+    async def put(self, symbol: str, points: list):
+        for item in points:
+            row = (symbol, item.get("timestamp", 0), item.get("sumOpenInterest", ""), item.get("sumOpenInterestValue", ""))
+            try:
+                self.queue.put_nowait(row)
+            except asyncio.QueueFull:
+                self.blocked += 1
+                await self.queue.put(row)
+
+    async def _collect(self) -> tuple:
+        """
+        Пакет строк: сначала строки неудавшихся пакетов, затем из очереди.
+        Возвращает (строки, сколько из них взято из очереди).
+        """
+        rows = [self._failed.popleft() for _ in range(min(len(self._failed), self.batch_size))]
+        if rows:
+            # Повтор не ждёт новых строк - только добирает уже лежащие в очереди
+            taken = 0
+            while len(rows) < self.batch_size and not self.queue.empty():
+                rows.append(self.queue.get_nowait())
+                taken += 1
+            return rows, taken
+
+        rows = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return rows, len(rows)
+
+    async def _write(self, rows: list) -> bool:
+        # Вставка с ON DUPLICATE KEY UPDATE идемпотентна - пакет можно безопасно повторить
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self.db_manager.save_open_interest_rows(rows)
+                self.rows += len(rows)
+                self.batches += 1
+                return True
+            except Exception as e:
+                self.errors += 1
+                logger.error(
+                    f"Ошибка пакетной записи истории OI ({len(rows)} строк, "
+                    f"попытка {attempt}/{self.max_retries}): {e}"
+                )
+                if attempt < self.max_retries:
+                    await asyncio.sleep(attempt)
+        return False
+
+    def _requeue(self, rows: list):
+        """
+        Возвращает строки незаписанного пакета в начало повторов, не больше ёмкости очереди.
+        """
+        self._failed.extendleft(reversed(rows))
+        limit = self.queue.maxsize or len(self._failed)
+        overflow = len(self._failed) - limit
+        if overflow > 0:
+            for _ in range(overflow):
+                self._failed.pop()
+            self.dropped += overflow
+            logger.error(f"База недоступна: отброшено {overflow} строк истории OI (всего {self.dropped})")
+
+    async def _run(self):
+        while True:
+            rows, taken = await self._collect()
+            started = time.monotonic()
+            try:
+                if not await self._write(rows):
+                    self._requeue(rows)
+            finally:
+                self._write_seconds += time.monotonic() - started
+                for _ in range(taken):
+                    self.queue.task_done()
+
+    def pending(self) -> int:
+        return self.queue.qsize() + len(self._failed)
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "errors": self.errors,
+            "blocked": self.blocked,
+            "dropped": self.dropped,
+            "retrying": len(self._failed),
+            "queue_depth": self.queue.qsize(),
+            "rows_per_sec": self.rows / self._write_seconds if self._write_seconds else 0.0,
+        }
@@ -26,24 +26,55 @@ class RedisClient:
         await self.client.set(key, timestamp)
 
     async def push_open_interest_list(self, symbol: str, oi_list: list, max_length=10):
+        """
+        Дописывает точки в open_interest:{symbol} и одновременно сохраняет
+        метку времени последней из них (open_interest_last_ts:{symbol}).
+        """
         if not oi_list:
             return
         key = f"open_interest:{symbol}"
+        last_ts = max(int(item["timestamp"]) for item in oi_list)
         async with self.client.pipeline(transaction=False) as pipe:
-            for item in oi_list:
-                pipe.rpush(key, json.dumps(item))
+            pipe.rpush(key, *[json.dumps(item) for item in oi_list])
             pipe.ltrim(key, -max_length, -1)
+            pipe.set(f"open_interest_last_ts:{symbol}", last_ts)
             await pipe.execute()
         # logger.info(f"Сохранили {len(oi_list)} записей в Redis (list) для {symbol}, key={key}")
 
+    async def load_open_interest_lists(self, points: dict, max_length: int):
+        """
+        Массовая загрузка истории ({symbol: [точки от старых к новым]}) одним пайплайном:
+        списки open_interest:{symbol} заменяются целиком, метки времени обновляются.
+        """
+        if not points:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for symbol, oi_list in points.items():
+                if not oi_list:
+                    continue
+                key = f"open_interest:{symbol}"
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(item) for item in oi_list[-max_length:]])
+                pipe.set(f"open_interest_last_ts:{symbol}", max(int(item["timestamp"]) for item in oi_list))
+            await pipe.execute()
+
+    async def scan_keys(self, pattern: str, count: int = 1000):
+        """
+        Ключи по шаблону через SCAN (не блокирует Redis, в отличие от KEYS).
+        """
+        return [key async for key in self.client.scan_iter(match=pattern, count=count)]
+
+    async def unlink_keys(self, keys: list, batch_size: int = 500):
+        for i in range(0, len(keys), batch_size):
+            await self.client.unlink(*keys[i:i + batch_size])
+
     async def get_open_interest_list(self, symbol: str):
         key = f"open_interest:{symbol}"
         data = await self.client.lrange(key, 0, -1)
         return data
 
     async def list_oi_keys(self):
-        keys = await self.client.keys("open_interest:*")
-        return keys
+        return await self.scan_keys("open_interest:*")
 
     # Новые методы для current OI:
     async def save_current_open_interest(self, symbol: str, data: dict):
@@ -53,6 +84,26 @@ class RedisClient:
         key = f"open_interest_current:{symbol}"
         await self.client.set(key, json.dumps(data))
 
+    async def save_current_open_interest_many(self, items: dict):
+        """
+        Текущий OI по многим символам ({symbol: data}) одним MSET.
+        """
+        if not items:
+            return
+        await self.client.mset({f"open_interest_current:{symbol}": json.dumps(data) for symbol, data in items.items()})
+
+    async def save_thresholds(self, thresholds: dict, ttl: int, suffix: str = ""):
+        """
+        Пороги last_threshold:{symbol}{suffix} с TTL одним пайплайном
+        (suffix - имя правила, например ":15mx20"; у правила прежнего анализа - пустой).
+        """
+        if not thresholds:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for symbol, value in thresholds.items():
+                pipe.set(f"last_threshold:{symbol}{suffix}", value, ex=ttl)
+            await pipe.execute()
+
     async def get_current_open_interest(self, symbol: str):
         """
         Получаем текущий OI из Redis. Если нет данных, вернется None.
@@ -61,4 +112,11 @@ class RedisClient:
         raw = await self.client.get(key)
         if raw:
             return json.loads(raw)
-        return None
\ No newline at end of file
+        return None
+
+    async def get_open_position_symbols(self) -> set:
+        """
+        Символы с открытыми позициями (наборы open_long_positions / open_short_positions,
+        их ведёт userdataservise).
+        """
+        return await self.client.sunion("open_long_positions", "open_short_positions")
@@ -0,0 +1,90 @@
+"""
+Правила анализа OI: (период openInterestHist, окно, порог отклонения).
+
+Правила задаются строкой OI_RULES через запятую, каждое - period:window:band,
+например "5m:30:0.1,15m:20:0.08,1h:24:0.05". У каждого правила свой детектор
+(окна и пороги), а история периода общая для всех правил с этим периодом
+(см. histcache.py).
+
+Пороги и контрольная точка правила хранятся с суффиксом его имени
+(last_threshold:{symbol}:15mx20, oi_detector:checkpoint:15mx20). Правило,
+совпадающее с прежним единственным анализом (legacy в parse_rules), пишет
+в прежние ключи без суффикса - их читают внешние потребители.
+"""
+from detector import OpenInterestDetector, CHECKPOINT_KEY
+
+# Периоды openInterestHist в миллисекундах
+PERIODS_MS = {
+    "5m": 5 * 60 * 1000,
+    "15m": 15 * 60 * 1000,
+    "30m": 30 * 60 * 1000,
+    "1h": 60 * 60 * 1000,
+    "2h": 2 * 60 * 60 * 1000,
+    "4h": 4 * 60 * 60 * 1000,
+    "6h": 6 * 60 * 60 * 1000,
+    "12h": 12 * 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000,
+}
+
+
+class OIRule:
+    def __init__(self, period: str, window: int, band: float, step: float = 0.01, threshold_ttl: float = 600,
+                 legacy: bool = False):
+        if period not in PERIODS_MS:
+            raise ValueError(f"Неизвестный период {period}, допустимы: {', '.join(PERIODS_MS)}")
+        self.period = period
+        self.period_ms = PERIODS_MS[period]
+        self.window = window
+        self.band = band
+        self.legacy = legacy
+        self.detector = OpenInterestDetector(window=window, band=band, step=step, threshold_ttl=threshold_ttl)
+
+    @property
+    def name(self) -> str:
+        return f"{self.period}x{self.window}"
+
+    @property
+    def key_suffix(self) -> str:
+        # Суффикс ключей last_threshold:{symbol}
+        return "" if self.legacy else f":{self.name}"
+
+    @property
+    def checkpoint_key(self) -> str:
+        return f"{CHECKPOINT_KEY}{self.key_suffix}"
+
+    def __repr__(self):
+        return f"OIRule({self.period}, window={self.window}, band={self.band})"
+
+
+def parse_rules(spec: str, step: float = 0.01, threshold_ttl: float = 600, legacy: str = None) -> list:
+    """
+    "5m:30:0.1,1h:24:0.05" -> [OIRule, ...]. Повторяющиеся (period, window) не допускаются.
+    legacy - имя правила (например "5mx30"), которое хранит пороги и контрольную точку в ключах без суффикса.
+    """
+    rules = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            period, window, band = item.split(":")
+            rule = OIRule(period.strip(), int(window), float(band), step, threshold_ttl)
+            rule.legacy = rule.name == legacy
+        except ValueError as e:
+            raise ValueError(f"Неверное правило OI '{item}' (ожидается period:window:band): {e}") from e
+        if any(existing.name == rule.name for existing in rules):
+            raise ValueError(f"Правило {rule.name} задано дважды")
+        rules.append(rule)
+    if not rules:
+        raise ValueError("Не задано ни одного правила OI")
+    return rules
+
+
+def windows_by_period(rules: list) -> dict:
+    """
+    Сколько точек нужно хранить по каждому периоду - наибольшее окно среди его правил.
+    """
+    windows = {}
+    for rule in rules:
+        windows[rule.period] = max(windows.get(rule.period, 0), rule.window)
+    return windows
@@ -0,0 +1,183 @@
+"""
+Планировщик опроса символов без дрейфа периода.
+
+Каждый символ опрашивается со своим интервалом (уровень: fast / normal /
+slow). Следующий срок считается от запланированного, а не от фактического
+времени запуска, поэтому период не растягивается на длительность запросов.
+Символы одного уровня разнесены по интервалу равномерно - запросы идут
+ровным потоком, а не всплеском раз в минуту.
+"""
+import asyncio
+import heapq
+import logging
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVALS = {"fast": 15.0, "normal": 60.0, "slow": 180.0}
+
+# Насколько позже срока запущен опрос (задержка цикла событий или занятость планировщика)
+SCHEDULE_LAG = metrics.histogram(
+    "openinterest_schedule_lag_seconds", "Отставание запуска опроса от срока", ["tier"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+# Весомость последнего фактического интервала в его EWMA
+GAP_ALPHA = 0.2
+
+
+class _Entry:
+    __slots__ = ("tier", "interval", "due", "generation", "last_start", "gap", "runs", "missed", "skipped")
+
+    def __init__(self, tier: str, interval: float, due: float):
+        self.tier = tier
+        self.interval = interval
+        self.due = due
+        self.generation = 0
+        self.last_start = None
+        # EWMA фактического интервала между запусками
+        self.gap = None
+        self.runs = 0
+        self.missed = 0
+        self.skipped = 0
+
+
+class PollScheduler:
+    """
+    job(symbol) - корутина опроса одного символа. Опрос символа не
+    перекрывается: если предыдущий ещё идёт, срок пропускается (skipped).
+    Если планировщик отстал больше чем на интервал, пропущенные сроки не
+    догоняются пачкой, а считаются в missed.
+    """
+
+    def __init__(self, job, intervals: dict = None):
+        self.job = job
+        self.intervals = dict(DEFAULT_INTERVALS if intervals is None else intervals)
+        self._entries = {}
+        self._heap = []
+        self._running = {}
+        self._changed = asyncio.Event()
+
+    def _push(self, symbol: str, entry: _Entry):
+        entry.generation += 1
+        heapq.heappush(self._heap, (entry.due, entry.generation, symbol))
+        self._changed.set()
+
+    def sync(self, tiers: dict):
+        """
+        Приводит расписание к {symbol: уровень}: новые символы равномерно
+        разносятся по интервалу своего уровня, ушедшие удаляются, у
+        сменивших уровень сохраняется фаза относительно последнего запуска.
+        """
+        now = asyncio.get_running_loop().time()
+        for symbol in set(self._entries) - set(tiers):
+            del self._entries[symbol]
+
+        new = {}
+        for symbol, tier in tiers.items():
+            entry = self._entries.get(symbol)
+            if entry is None:
+                new.setdefault(tier, []).append(symbol)
+            elif entry.tier != tier:
+                entry.tier = tier
+                entry.interval = self.intervals[tier]
+                entry.gap = None
+                start = entry.last_start if entry.last_start is not None else now
+                entry.due = max(start + entry.interval, now)
+                self._push(symbol, entry)
+
+        for tier, symbols in new.items():
+            interval = self.intervals[tier]
+            step = interval / len(symbols)
+            for i, symbol in enumerate(sorted(symbols)):
+                entry = _Entry(tier, interval, now + i * step)
+                self._entries[symbol] = entry
+                self._push(symbol, entry)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+            due, generation, symbol = self._heap[0]
+            entry = self._entries.get(symbol)
+            if entry is None or entry.generation != generation:
+                # Символ удалён или перепланирован - запись в куче устарела
+                heapq.heappop(self._heap)
+                continue
+            delay = due - loop.time()
+            if delay > 0:
+                # Просыпаемся раньше, если расписание изменилось
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            now = loop.time()
+            missed = int((now - due) // entry.interval)
+            entry.missed += missed
+            entry.due = due + (missed + 1) * entry.interval
+            self._push(symbol, entry)
+
+            task = self._running.get(symbol)
+            if task is not None and not task.done():
+                entry.skipped += 1
+                continue
+            SCHEDULE_LAG.labels(entry.tier).observe(now - due)
+            if entry.last_start is not None:
+                gap = now - entry.last_start
+                entry.gap = gap if entry.gap is None else entry.gap + GAP_ALPHA * (gap - entry.gap)
+            entry.last_start = now
+            entry.runs += 1
+            self._running[symbol] = asyncio.create_task(self._run_job(symbol))
+
+    async def _run_job(self, symbol: str):
+        try:
+            await self.job(symbol)
+        except Exception as e:
+            logger.error(f"Ошибка опроса {symbol}: {e}")
+        finally:
+            self._running.pop(symbol, None)
+
+    def report(self) -> dict:
+        """
+        По уровням: число символов, целевой и фактический (среднее EWMA) интервал,
+        целевое и фактическое число опросов в минуту, пропуски.
+        """
+        result = {}
+        for tier, interval in self.intervals.items():
+            entries = [entry for entry in self._entries.values() if entry.tier == tier]
+            gaps = [entry.gap for entry in entries if entry.gap is not None]
+            achieved = sum(gaps) / len(gaps) if gaps else None
+            result[tier] = {
+                "symbols": len(entries),
+                "target_interval": interval,
+                "achieved_interval": achieved,
+                "target_per_min": len(entries) * 60 / interval,
+                "achieved_per_min": len(entries) * 60 / achieved if achieved else 0.0,
+                "missed": sum(entry.missed for entry in entries),
+                "skipped": sum(entry.skipped for entry in entries),
+            }
+        return result
+
+
+async def ticks(interval: float):
+    """
+    Тики с периодом interval без дрейфа: срок следующего - от срока
+    предыдущего; если итерация заняла больше периода, пропущенные тики
+    отбрасываются.
+    """
+    loop = asyncio.get_running_loop()
+    due = loop.time()
+    while True:
+        yield
+        due += interval
+        now = loop.time()
+        if due < now:
+            due += (now - due) // interval * interval + interval
+        await asyncio.sleep(due - now)
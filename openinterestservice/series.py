@@ -0,0 +1,251 @@
+"""
+Хранилище истории OI: open_interest_series и агрегаты open_interest_rollup.
+
+open_interest_series - числовые колонки DECIMAL, кластерный ключ (symbol, ts)
+и секции RANGE по ts: по одной на сутки (pYYYYMMDD), p_before для всего, что
+старше первой суточной секции, и pmax для будущего. Старые секции удаляются
+целиком (DROP PARTITION) вместо DELETE по строкам, будущие создаются заранее
+переразбиением пустой pmax.
+
+open_interest_rollup - агрегаты 1h/1d (open/high/low/close/avg по
+sum_open_interest), пересчитываются по последним корзинам фоновой задачей.
+"""
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+SERIES_TABLE = "open_interest_series"
+ROLLUP_TABLE = "open_interest_rollup"
+
+DAY_MS = 24 * 60 * 60 * 1000
+ROLLUP_RESOLUTIONS = {"1h": 60 * 60 * 1000, "1d": DAY_MS}
+
+_DAY_PARTITION = re.compile(r"^p\d{8}$")
+
+
+def day_start(ts_ms: int) -> int:
+    return ts_ms - ts_ms % DAY_MS
+
+
+def partition_name(day_ms: int) -> str:
+    return "p" + time.strftime("%Y%m%d", time.gmtime(day_ms / 1000))
+
+
+def partition_clause(day_ms: int) -> str:
+    # Секция суток day_ms: всё, что меньше начала следующих суток
+    return f"PARTITION {partition_name(day_ms)} VALUES LESS THAN ({day_ms + DAY_MS})"
+
+
+class OpenInterestSeries:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def _execute(self, sql: str, args=None) -> int:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                return await cur.execute(sql, args)
+
+    async def _fetchall(self, sql: str, args=None) -> list:
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, args)
+                return await cur.fetchall()
+
+    async def init_schema(self, first_day_ms: int = None, days_ahead: int = 7):
+        """
+        Создаёт таблицы, если их нет. Суточные секции - с first_day_ms
+        (по умолчанию - с сегодняшнего дня) и на days_ahead суток вперёд.
+        """
+        today = day_start(int(time.time() * 1000))
+        first_day = day_start(first_day_ms) if first_day_ms is not None else today
+        partitions = [f"PARTITION p_before VALUES LESS THAN ({first_day})"]
+        partitions += [partition_clause(day) for day in range(first_day, today + (days_ahead + 1) * DAY_MS, DAY_MS)]
+        partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+        await self._execute(f"""
+            CREATE TABLE IF NOT EXISTS {SERIES_TABLE} (
+                symbol VARCHAR(20) NOT NULL,
+                ts BIGINT NOT NULL,
+                sum_open_interest DECIMAL(36, 8) NOT NULL,
+                sum_open_interest_value DECIMAL(36, 8) NOT NULL,
+                PRIMARY KEY (symbol, ts)
+            ) ENGINE=InnoDB
+            PARTITION BY RANGE (ts) ({", ".join(partitions)})
+        """)
+        await self._execute(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                symbol VARCHAR(20) NOT NULL,
+                resolution VARCHAR(3) NOT NULL,
+                ts BIGINT NOT NULL,
+                open_oi DECIMAL(36, 8) NOT NULL,
+                high_oi DECIMAL(36, 8) NOT NULL,
+                low_oi DECIMAL(36, 8) NOT NULL,
+                close_oi DECIMAL(36, 8) NOT NULL,
+                avg_oi DECIMAL(36, 8) NOT NULL,
+                close_oi_value DECIMAL(36, 8) NOT NULL,
+                points INT NOT NULL,
+                PRIMARY KEY (symbol, resolution, ts)
+            ) ENGINE=InnoDB
+        """)
+        logger.info(f"Таблицы {SERIES_TABLE} и {ROLLUP_TABLE} проверены/созданы")
+
+    async def partitions(self) -> list:
+        """
+        Секции open_interest_series: [(имя, верхняя граница или None для MAXVALUE)] по возрастанию.
+        """
+        rows = await self._fetchall(
+            """
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            (SERIES_TABLE,)
+        )
+        return [(name, None if bound == "MAXVALUE" else int(bound)) for name, bound in rows]
+
+    async def ensure_partitions(self, days_ahead: int = 7) -> int:
+        """
+        Заранее добавляет суточные секции на days_ahead суток вперёд, разбивая pmax.
+        """
+        bounds = [bound for name, bound in await self.partitions() if bound is not None]
+        last_bound = max(bounds) if bounds else day_start(int(time.time() * 1000))
+        until = day_start(int(time.time() * 1000)) + (days_ahead + 1) * DAY_MS
+        days = list(range(last_bound, until, DAY_MS))
+        if not days:
+            return 0
+        clauses = [partition_clause(day) for day in days]
+        clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        await self._execute(f"ALTER TABLE {SERIES_TABLE} REORGANIZE PARTITION pmax INTO ({', '.join(clauses)})")
+        logger.info(f"Добавлено секций {SERIES_TABLE}: {len(days)}")
+        return len(days)
+
+    async def ensure_history_partitions(self, first_day_ms: int) -> int:
+        """
+        Суточные секции для прошлых данных (перенос истории): выделяет из p_before
+        секции с first_day_ms до первой существующей суточной секции.
+        """
+        bounds = [bound for name, bound in await self.partitions() if name == "p_before"]
+        first_day = day_start(first_day_ms)
+        if not bounds or bounds[0] <= first_day:
+            return 0
+        days = list(range(first_day, bounds[0], DAY_MS))
+        clauses = [f"PARTITION p_before VALUES LESS THAN ({first_day})"]
+        clauses += [partition_clause(day) for day in days]
+        await self._execute(f"ALTER TABLE {SERIES_TABLE} REORGANIZE PARTITION p_before INTO ({', '.join(clauses)})")
+        logger.info(f"Добавлено секций {SERIES_TABLE} для прошлых данных: {len(days)}")
+        return len(days)
+
+    async def drop_old_partitions(self, retention_days: int) -> list:
+        """
+        Удаляет секции, целиком старше retention_days суток.
+        """
+        cutoff = day_start(int(time.time() * 1000)) - retention_days * DAY_MS
+        old = [
+            name for name, bound in await self.partitions()
+            if bound is not None and bound <= cutoff and (name == "p_before" or _DAY_PARTITION.match(name))
+        ]
+        if old:
+            await self._execute(f"ALTER TABLE {SERIES_TABLE} DROP PARTITION {', '.join(old)}")
+            logger.info(f"Удалены секции {SERIES_TABLE}: {', '.join(old)}")
+        return old
+
+    async def save_rows(self, rows: list):
+        """
+        Строки (symbol, ts, sum_open_interest, sum_open_interest_value) одним executemany.
+        """
+        if not rows:
+            return
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(
+                    f"""
+                    INSERT INTO {SERIES_TABLE} (symbol, ts, sum_open_interest, sum_open_interest_value)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        sum_open_interest = VALUES(sum_open_interest),
+                        sum_open_interest_value = VALUES(sum_open_interest_value)
+                    """,
+                    rows
+                )
+
+    async def build_rollups(self, resolution: str, since_ms: int, until_ms: int = None) -> int:
+        """
+        Пересчитывает агрегаты resolution для корзин, начинающихся в [since_ms, until_ms).
+        Незакрытая текущая корзина тоже пересчитывается - при следующем проходе обновится.
+        """
+        size = ROLLUP_RESOLUTIONS[resolution]
+        since_ms -= since_ms % size
+        until_ms = until_ms if until_ms is not None else int(time.time() * 1000) + size
+        # open/close - первое и последнее значение корзины: GROUP_CONCAT по времени,
+        # от которого нужен только первый элемент (обрезка group_concat_max_len ему не мешает)
+        return await self._execute(
+            f"""
+            INSERT INTO {ROLLUP_TABLE}
+                (symbol, resolution, ts, open_oi, high_oi, low_oi, close_oi, avg_oi, close_oi_value, points)
+            SELECT
+                symbol, %s, ts - MOD(ts, %s) AS bucket,
+                CAST(SUBSTRING_INDEX(GROUP_CONCAT(sum_open_interest ORDER BY ts), ',', 1) AS DECIMAL(36, 8)),
+                MAX(sum_open_interest),
+                MIN(sum_open_interest),
+                CAST(SUBSTRING_INDEX(GROUP_CONCAT(sum_open_interest ORDER BY ts DESC), ',', 1) AS DECIMAL(36, 8)),
+                AVG(sum_open_interest),
+                CAST(SUBSTRING_INDEX(GROUP_CONCAT(sum_open_interest_value ORDER BY ts DESC), ',', 1) AS DECIMAL(36, 8)),
+                COUNT(*)
+            FROM {SERIES_TABLE}
+            WHERE ts >= %s AND ts < %s
+            GROUP BY symbol, bucket
+            ON DUPLICATE KEY UPDATE
+                open_oi = VALUES(open_oi), high_oi = VALUES(high_oi), low_oi = VALUES(low_oi),
+                close_oi = VALUES(close_oi), avg_oi = VALUES(avg_oi),
+                close_oi_value = VALUES(close_oi_value), points = VALUES(points)
+            """,
+            (resolution, size, since_ms, until_ms)
+        )
+
+    async def last_timestamp(self, symbol: str):
+        rows = await self._fetchall(f"SELECT MAX(ts) FROM {SERIES_TABLE} WHERE symbol = %s", (symbol,))
+        return rows[0][0] if rows and rows[0][0] is not None else None
+
+    async def last_points(self, limit: int, since_ms: int) -> dict:
+        """
+        Последние limit точек каждого символа не старше since_ms одним запросом:
+        {symbol: [{"symbol", "timestamp", "sumOpenInterest", "sumOpenInterestValue"}, ...]}
+        от старых к новым, в том же виде, что отдаёт openInterestHist.
+        """
+        rows = await self._fetchall(
+            f"""
+            SELECT symbol, ts, sum_open_interest, sum_open_interest_value FROM (
+                SELECT symbol, ts, sum_open_interest, sum_open_interest_value,
+                       ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY ts DESC) AS rn
+                FROM {SERIES_TABLE}
+                WHERE ts >= %s
+            ) ranked
+            WHERE rn <= %s
+            ORDER BY symbol, ts
+            """,
+            (since_ms, limit)
+        )
+        points = {}
+        for symbol, ts, sum_oi, sum_oi_value in rows:
+            points.setdefault(symbol, []).append({
+                "symbol": symbol,
+                "timestamp": int(ts),
+                "sumOpenInterest": str(sum_oi),
+                "sumOpenInterestValue": str(sum_oi_value),
+            })
+        return points
+
+    async def maintain(self, retention_days: int, days_ahead: int = 7, rollup_lookback_ms: int = 2 * DAY_MS) -> dict:
+        """
+        Один проход обслуживания: будущие секции, агрегаты за последние
+        rollup_lookback_ms и удаление секций старше retention_days.
+        """
+        result = {"added": await self.ensure_partitions(days_ahead)}
+        since = int(time.time() * 1000) - rollup_lookback_ms
+        for resolution in ROLLUP_RESOLUTIONS:
+            result[resolution] = await self.build_rollups(resolution, since)
+        if retention_days > 0:
+            result["dropped"] = await self.drop_old_partitions(retention_days)
+        return result
@@ -1,9 +1,12 @@
 from os import getenv
-import time
-import hmac
-import hashlib
-import requests
-from urllib.parse import urlencode
+import asyncio
+import os
+import sys
+
+# Запуск из каталога скрипта (python app.py): пакет common лежит в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.rest import BinanceAPIError, BinanceRestClient
 
 
 API_KEY = getenv("API_KEY_BIN")
@@ -12,25 +15,12 @@ API_SECRET = getenv("SECRET_KEY_BIN")
 
 BASE_URL = 'https://fapi.binance.com'  # Для торговли на USDS-маржинальных фьючерсах
 
-def sign(params, secret):
-    """
-    Функция для подписи запроса (HMAC SHA256).
-    params: словарь с параметрами запроса
-    secret: ваш Secret Key
-    """
-    query_string = urlencode(params)
-    signature = hmac.new(
-        secret.encode('utf-8'), 
-        query_string.encode('utf-8'), 
-        hashlib.sha256
-    ).hexdigest()
-    return signature
-
-def new_order(symbol, side, positionSide, order_type, quantity, price=None, stop_price=None, time_in_force=None):
+async def new_order(client: BinanceRestClient, symbol, side, positionSide, order_type, quantity, price=None, stop_price=None, time_in_force=None):
     """
     Функция для создания нового ордера на фьючерсном рынке Binance.
     
     Параметры:
+      client (BinanceRestClient): REST-клиент с API-ключом и секретом (подпись и timestamp - в клиенте)
       symbol (str): Символ для торговли, например 'BTCUSDT'
       side (str): BUY или SELL
       order_type (str): Тип ордера: MARKET, LIMIT, STOP, STOP_MARKET, TAKE_PROFIT и т.д.
@@ -42,9 +32,6 @@ def new_order(symbol, side, positionSide, order_type, quantity, price=None, stop
     # Эндпоинт для отправки ордера
     endpoint = '/fapi/v1/order'
     
-    # Текущее время в миллисекундах (необходимо для отправки вместе с запросом)
-    timestamp = int(time.time() * 1000)
-    
     # Параметры для тела запроса
     params = {
         'symbol': symbol,
@@ -52,7 +39,6 @@ def new_order(symbol, side, positionSide, order_type, quantity, price=None, stop
         'positionSide': positionSide,
         'type': order_type.upper(),
         'quantity': quantity,
-        'timestamp': timestamp,
     }
     
     # Если у нас лимитный ордер, добавим цену и timeInForce
@@ -68,39 +54,28 @@ def new_order(symbol, side, positionSide, order_type, quantity, price=None, stop
     if stop_price is not None:
         params['stopPrice'] = stop_price
 
-    # Подпишем запрос
-    params['signature'] = sign(params, API_SECRET)
+    # Подписанный POST: повторяется, только если соединение не было установлено,
+    # чтобы не создать ордер дважды
+    try:
+        result = await client.post(endpoint, params, signed=True)
+    except BinanceAPIError as e:
+        print(f"Ошибка. Код ответа: {e.status}, Тело: {e.msg}")
+        raise
+    print("Ордер создан успешно.")
+    return result
 
-    # Заголовки, включая API-ключ
-    headers = {
-        'X-MBX-APIKEY': API_KEY
-    }
-    
-    # Выполним POST-запрос
-    url = BASE_URL + endpoint
-    response = requests.post(url, params=params, headers=headers)
-    headers = response.headers
-    for k, v in headers.items():
-        print(k,v)
-    # print(f"Использовано за запрос: {headers.get('x-mbx-used-weight')}")
-    # print(f"Использовано за минуту: {headers.get('x-mbx-used-weight-1m')}")
-    
-    # Проверим результат
-    if response.status_code != 200:
-        print(f"Ошибка. Код ответа: {response.status_code}, Тело: {response.text}")
-    else:
-        print("Ордер создан успешно.")
-    
-    return response.json()
+async def main():
+    async with BinanceRestClient(BASE_URL, api_key=API_KEY, api_secret=API_SECRET) as client:
+        # Пример: рыночная покупка 10 ADA в паре ADAUSDT
+        result = await new_order(
+            client,
+            symbol='ADAUSDT',
+            side='BUY',
+            positionSide='LONG',
+            order_type='MARKET',
+            quantity=10
+        )
+        # print(result)
 
 if __name__ == '__main__':
-    # Пример: рыночная покупка 0.001 BTC в паре BTCUSDT
-    result = new_order(
-        symbol='ADAUSDT',
-        side='BUY',
-        positionSide='LONG',
-        order_type='MARKET',
-        quantity=10
-    )
-
-    # print(result)
+    asyncio.run(main())
@@ -1,7 +1,15 @@
-import requests
+import asyncio
+import os
+import sys
+
+# Запуск из каталога скрипта (python app.py): пакет common лежит в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.rest import BinanceAPIError, BinanceRestClient
 
 # Эндпоинт для открытого интереса (USDT-M Futures)
-url = "https://fapi.binance.com/futures/data/openInterestHist"
+BASE_URL = "https://fapi.binance.com"
+path = "/futures/data/openInterestHist"
 
 # Параметры запроса
 params = {
@@ -12,14 +20,18 @@ params = {
     # "endTime":   <время в мс>,
 }
 
-response = requests.get(url, params=params)
 
-# Если всё хорошо, то status_code == 200
-if response.status_code == 200:
-    data = response.json()
+async def main():
+    async with BinanceRestClient(BASE_URL) as client:
+        try:
+            data = await client.get(path, params)
+        except BinanceAPIError as e:
+            print(f"Ошибка при получении данных: {e.status}")
+            print(e.msg)
+            return
     print("Open Interest для SUIUSDT:")
     for item in data:
         print(item)
-else:
-    print(f"Ошибка при получении данных: {response.status_code}")
-    print(response.text)
+
+
+asyncio.run(main())
@@ -0,0 +1,28 @@
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ("marketservise", "openinterestservice", "userdataservise")
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def service_module(service: str, name: str):
+    """
+    Импорт модуля сервиса так, как он импортируется при запуске из своей
+    папки (from ringbuffer import ...). У сервисов есть одноимённые модули
+    (redis_client, app), поэтому модули других сервисов сначала выгружаются.
+    """
+    path = os.path.join(ROOT, service)
+    others = {os.path.join(ROOT, other) for other in SERVICES if other != service}
+    for module_name, module in list(sys.modules.items()):
+        file = getattr(module, "__file__", None)
+        if file and os.path.dirname(os.path.abspath(file)) in others:
+            del sys.modules[module_name]
+    sys.path.insert(0, path)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(path)
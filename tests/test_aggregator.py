@@ -0,0 +1,89 @@
+from common.candle import Candle
+from conftest import service_module
+
+aggregator = service_module("marketservise", "aggregator")
+
+MINUTE = 60_000
+# Начало 5m-интервала
+T0 = 1_700_000_100_000
+
+
+def minute(i: int, is_closed: bool = True, volume: float = 10.0) -> Candle:
+    start = T0 + i * MINUTE
+    return Candle(
+        start, start + MINUTE - 1, "BTCUSDT", "1m", i * 10, i * 10 + 9,
+        100.0 + i, 101.0 + i, 102.0 + i, 99.0 + i, volume,
+        10, is_closed, volume * 100, volume / 2, volume * 50
+    )
+
+
+def closed(result: list) -> list:
+    return [candle for candle in result if candle.is_closed]
+
+
+def test_full_interval_is_closed():
+    agg = aggregator.TimeframeAggregator(("5m",))
+    result = []
+    for i in range(5):
+        result += agg.on_candle(minute(i))
+
+    bars = closed(result)
+    assert len(bars) == 1
+    assert bars[0].start_time == T0
+    assert bars[0].open == 100.0
+    assert bars[0].close == 105.0
+    assert bars[0].volume == 50.0
+    assert agg.incomplete == 0
+
+
+def test_mid_interval_start_is_not_emitted():
+    agg = aggregator.TimeframeAggregator(("5m",))
+    result = []
+    # Сервис запущен на третьей минуте интервала
+    for i in range(3, 5):
+        result += agg.on_candle(minute(i, is_closed=False))
+        result += agg.on_candle(minute(i))
+
+    assert result == []
+    assert agg.incomplete == 1
+
+    # Следующий интервал полный - выдаётся как обычно
+    for i in range(5, 10):
+        result += agg.on_candle(minute(i))
+    bars = closed(result)
+    assert [bar.start_time for bar in bars] == [T0 + 5 * MINUTE]
+    assert bars[0].volume == 50.0
+
+
+def test_gap_inside_interval_is_not_emitted():
+    agg = aggregator.TimeframeAggregator(("5m",))
+    result = []
+    for i in (0, 1, 3, 4):
+        result += agg.on_candle(minute(i))
+
+    assert closed(result) == []
+    assert agg.incomplete == 1
+
+
+def test_lost_last_bar_is_not_closed_as_is():
+    agg = aggregator.TimeframeAggregator(("5m",))
+    result = []
+    for i in range(4):
+        result += agg.on_candle(minute(i))
+    # Последний бар интервала потерян, пришёл бар следующего
+    result += agg.on_candle(minute(5))
+
+    assert closed(result) == []
+    assert agg.incomplete == 1
+    # Опоздавший бар закрытого интервала его не открывает
+    assert agg.on_candle(minute(4)) == []
+
+
+def test_replayed_bars_do_not_reopen_closed_interval():
+    agg = aggregator.TimeframeAggregator(("5m",))
+    for i in range(5):
+        agg.on_candle(minute(i))
+
+    # Перекрытие догрузки после переподключения
+    assert agg.on_candle(minute(3)) == []
+    assert agg.on_candle(minute(4)) == []
@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from common.ratelimit import WeightRateLimiter
+from common.rest import BinanceRestClient
+from conftest import service_module
+
+backfill = service_module("marketservise", "backfill")
+mock_rest = service_module("marketservise", "mock_rest")
+
+
+def test_klines_cost_follows_limit():
+    assert WeightRateLimiter.cost("/fapi/v1/klines", {"limit": 15}) == {"weight": 1}
+    assert WeightRateLimiter.cost("/fapi/v1/klines", {"limit": 1000}) == {"weight": 5}
+    assert WeightRateLimiter.cost("/fapi/v1/klines") == {"weight": 5}
+    assert WeightRateLimiter.cost("/fapi/v1/openInterest", {"limit": 1000}) == {"weight": 1}
+
+
+async def _serve(app: web.Application):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+def _tracker(streams: list, gap_minutes: int):
+    tracker = backfill.CloseTimeTracker()
+    now_ms = int(time.time() * 1000)
+    last_close = now_ms - now_ms % 60_000 - gap_minutes * 60_000 - 1
+    for stream in streams:
+        tracker.last_close[(stream.split("@")[0].upper(), "1m")] = last_close
+    return tracker
+
+
+def test_backfill_goes_through_shared_limiter():
+    async def scenario():
+        runner, port = await _serve(mock_rest.make_app())
+        streams = ["btcusdt@kline_1m", "ethusdt@kline_1m"]
+        tracker = _tracker(streams, 5)
+        limiter = WeightRateLimiter()
+        received = []
+
+        async def on_candle(candle):
+            tracker.update(candle)
+            received.append(candle)
+
+        try:
+            async with BinanceRestClient(f"http://127.0.0.1:{port}", rate_limiter=limiter) as client:
+                result = await backfill.KlineBackfiller(client).backfill(streams, tracker, on_candle)
+        finally:
+            await runner.cleanup()
+        return result, received, limiter
+
+    result, received, limiter = asyncio.run(scenario())
+    assert result["gaps"] == 2
+    assert result["failed"] == 0
+    assert len(received) == result["candles"] >= 10
+    # Вес посчитан ограничителем по ответу сервера
+    assert limiter.used_weight == 2
+
+
+def test_rate_limited_gap_is_failed_and_not_moved():
+    async def too_many(request):
+        return web.json_response({"code": -1003, "msg": "Too many requests"}, status=429,
+                                 headers={"Retry-After": "0"})
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_get("/fapi/v1/klines", too_many)
+        runner, port = await _serve(app)
+        streams = ["btcusdt@kline_1m"]
+        tracker = _tracker(streams, 5)
+        before = dict(tracker.last_close)
+        limiter = WeightRateLimiter()
+
+        async def on_candle(candle):
+            tracker.update(candle)
+
+        try:
+            async with BinanceRestClient(f"http://127.0.0.1:{port}", rate_limiter=limiter) as client:
+                result = await backfill.KlineBackfiller(client).backfill(streams, tracker, on_candle)
+        finally:
+            await runner.cleanup()
+        return result, tracker.last_close == before, limiter
+
+    result, unchanged, limiter = asyncio.run(scenario())
+    assert result["failed"] == 1
+    assert unchanged
+    assert limiter.rate_limited == 3
+
+
+class _FlakyBackfiller:
+    """
+    Первые failures запросов падают, затем отдаёт свечи пропуска.
+    """
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = []
+
+    async def fetch_closed(self, symbol, interval, start_time, end_ms):
+        self.calls.append((symbol, interval, start_time, end_ms))
+        if len(self.calls) <= self.failures:
+            raise RuntimeError("HTTP 429")
+        return [mock_candle(symbol, start) for start in range(start_time, end_ms - 59_999, 60_000)]
+
+
+def mock_candle(symbol: str, start: int):
+    return backfill.rest_kline_to_candle(
+        symbol, "1m", [start, "1", "2", "0.5", "1.5", "10", start + 59_999, "15", 3, "5", "7", "0"]
+    )
+
+
+def test_gap_retrier_recovers_in_background_with_backoff():
+    async def scenario():
+        inserted = []
+
+        async def on_candles(symbol, interval, candles):
+            inserted.append((symbol, interval, [candle.start_time for candle in candles]))
+
+        flaky = _FlakyBackfiller(failures=2)
+        retrier = backfill.GapRetrier(flaky, on_candles, base_delay=0.01, max_delay=0.05)
+        task = asyncio.ensure_future(retrier.run())
+        retrier.add([("BTCUSDT", "1m", 0, 180_000)])
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if not retrier.pending():
+                break
+        task.cancel()
+        return flaky, retrier, inserted
+
+    flaky, retrier, inserted = asyncio.run(scenario())
+    assert len(flaky.calls) == 3
+    assert inserted == [("BTCUSDT", "1m", [0, 60_000, 120_000])]
+    assert retrier.recovered == 1
+    assert retrier.pending() == 0
+
+
+def test_gap_retrier_gives_up_after_max_attempts():
+    async def scenario():
+        async def on_candles(symbol, interval, candles):
+            raise AssertionError("не должно вызываться")
+
+        retrier = backfill.GapRetrier(_FlakyBackfiller(failures=100), on_candles, max_attempts=2)
+        retrier.add([("BTCUSDT", "1m", 0, 180_000)])
+        # Повторный пропуск того же потока расширяет диапазон
+        retrier.add([("BTCUSDT", "1m", 300_000, 600_000)])
+        assert retrier.gaps[("BTCUSDT", "1m")][:2] == [0, 600_000]
+        for _ in range(2):
+            retrier.gaps[("BTCUSDT", "1m")][3] = 0
+            await retrier.retry_due()
+        return retrier
+
+    retrier = asyncio.run(scenario())
+    assert retrier.pending() == 0
+    assert retrier.abandoned == 1
+
+
+def test_late_candles_are_merged_in_time_order():
+    fakeredis = pytest.importorskip("fakeredis")
+    redis_client_module = service_module("marketservise", "redis_client")
+
+    async def scenario():
+        client = redis_client_module.RedisClient(None, None, None, retention={"1m": 4})
+        server = fakeredis.FakeServer()
+        client.client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        client.raw_client = fakeredis.FakeAsyncRedis(server=server)
+        # Из потока после переподключения записаны минуты 5 и 6
+        for start in (300_000, 360_000):
+            await client.save_closed_candle_in_list(mock_candle("BTCUSDT", start))
+        added = await client.merge_closed_candles(
+            "BTCUSDT", "1m", [mock_candle("BTCUSDT", start) for start in range(0, 300_000, 60_000)]
+        )
+        stored = await client.get_closed_candles("BTCUSDT", "1m")
+        return added, [candle.start_time for candle in stored]
+
+    added, starts = asyncio.run(scenario())
+    assert added == 2
+    assert starts == [180_000, 240_000, 300_000, 360_000]
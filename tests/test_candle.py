@@ -0,0 +1,57 @@
+import json
+
+from common.candle import candle_from_json, candle_to_json, decode_kline, format_decimal
+
+KLINE = {
+    "t": 1700000040000, "T": 1700000099999, "s": "1000PEPEUSDT", "i": "1m", "f": 1001, "L": 1200,
+    "o": "0.00001234", "c": "0.00001250", "h": "0.00001260", "l": "0.00001200", "v": "37000.10",
+    "n": 200, "x": True, "q": "123456.78901234", "V": "18000.05", "Q": "0.22500000", "B": "0"
+}
+
+
+def old_json(k: dict) -> str:
+    # Прежняя запись свечи: json.dumps словаря с полями биржи как есть
+    return json.dumps({
+        "start_time": k["t"], "close_time": k["T"], "symbol": k["s"], "interval": k["i"],
+        "first_trade_id": k["f"], "last_trade_id": k["L"],
+        "open": k["o"], "close": k["c"], "high": k["h"], "low": k["l"], "volume": k["v"],
+        "number_of_trades": k["n"], "is_closed": k["x"], "quote_volume": k["q"],
+        "taker_buy_base_volume": k["V"], "taker_buy_quote_volume": k["Q"]
+    })
+
+
+def frame(k: dict) -> str:
+    return json.dumps({"stream": "1000pepeusdt@kline_1m", "data": {"e": "kline", "E": 1700000099999, "k": k}})
+
+
+def test_json_matches_old_format_by_value():
+    old = json.loads(old_json(KLINE))
+    new = json.loads(candle_to_json(decode_kline(frame(KLINE))))
+
+    assert list(new) == list(old)
+    for key, value in old.items():
+        assert type(new[key]) is type(value), key
+        if isinstance(value, str) and key not in ("symbol", "interval"):
+            assert "e" not in new[key].lower(), new[key]
+            assert float(new[key]) == float(value), key
+        else:
+            assert new[key] == value, key
+
+
+def test_small_prices_keep_decimal_notation():
+    new = json.loads(candle_to_json(decode_kline(frame(KLINE))))
+    assert new["open"] == "0.00001234"
+    assert new["close"] == "0.0000125"
+    assert new["volume"] == "37000.1"
+
+
+def test_json_round_trip():
+    candle = decode_kline(frame(KLINE))
+    assert candle_from_json(candle_to_json(candle)) == candle
+
+
+def test_format_decimal_never_uses_exponent():
+    assert format_decimal(2e-7) == "0.0000002"
+    assert format_decimal(1e16) == "10000000000000000"
+    assert format_decimal(0.1) == "0.1"
+    assert float(format_decimal(123456789.12345678)) == 123456789.12345678
@@ -0,0 +1,98 @@
+import asyncio
+import zlib
+
+import pytest
+
+from common.universe import EXCHANGE_INFO_CACHE_KEY, UniverseLoader
+from conftest import service_module
+
+connections = service_module("marketservise", "connections")
+
+
+class FakeConnection:
+    def __init__(self, conn_id, streams, pipeline, on_connect=None, **options):
+        self.conn_id = conn_id
+        self.streams = set(streams)
+
+    def start(self):
+        pass
+
+    async def subscribe(self, streams):
+        self.streams.update(streams)
+
+    async def unsubscribe(self, streams):
+        self.streams.difference_update(streams)
+
+    async def close(self):
+        pass
+
+
+def shard(stream: str) -> int:
+    return zlib.crc32(stream.encode()) % 2
+
+
+def streams(n: int, offset: int = 0) -> list:
+    return [f"sym{i}usdt@kline_1m" for i in range(offset, offset + n)]
+
+
+def test_rebalancing_keeps_shard_affinity(monkeypatch):
+    monkeypatch.setattr(connections, "KlineConnection", FakeConnection)
+
+    async def scenario():
+        manager = connections.ConnectionManager(None, max_streams=5, group_of=shard)
+        initial = streams(6)
+        manager.start([[s for s in initial if shard(s) == g] for g in (0, 1)])
+        await manager.apply(initial + streams(20, offset=6))
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert len(manager.streams()) == 26
+    for connection in manager.connections:
+        assert 0 < len(connection.streams) <= 5
+        assert {shard(s) for s in connection.streams} == {manager.groups[connection.conn_id]}
+
+
+def test_emptied_connections_are_closed(monkeypatch):
+    monkeypatch.setattr(connections, "KlineConnection", FakeConnection)
+
+    async def scenario():
+        manager = connections.ConnectionManager(None, max_streams=3)
+        manager.start([streams(6)])
+        result = await manager.apply(streams(2))
+        return manager, result
+
+    manager, result = asyncio.run(scenario())
+    assert result["removed"] == 4
+    assert manager.streams() == set(streams(2))
+    assert len(manager.connections) == 1
+    assert set(manager.groups) == {manager.connections[0].conn_id}
+
+
+class FakeRest:
+    async def get(self, path, params=None):
+        return {"symbols": [
+            {"symbol": symbol, "contractType": "PERPETUAL", "status": "TRADING", "quoteAsset": "USDT"}
+            for symbol in ("BTCUSDT", "ETHUSDT", "NEWUSDT")
+        ]}
+
+
+@pytest.mark.parametrize("all_symbols, expected", [
+    (False, ["BTCUSDT", "ETHUSDT"]),
+    (True, ["BTCUSDT", "ETHUSDT", "NEWUSDT"]),
+])
+def test_universe_is_curated_by_default(all_symbols, expected):
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        loader = UniverseLoader(
+            client, FakeRest(), fallback=["BTCUSDT", "ETHUSDT", "DELISTEDUSDT"], all_symbols=all_symbols
+        )
+        first = await loader.load()
+        # Второй раз - из кэша exchangeInfo, с тем же сужением
+        assert await client.exists(EXCHANGE_INFO_CACHE_KEY)
+        return first, await loader.load()
+
+    first, cached = asyncio.run(scenario())
+    assert first == expected
+    assert cached == expected
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from conftest import service_module
+
+detector = service_module("openinterestservice", "detector")
+
+
+def points(start_ms: int, values: list, step_ms: int = 300_000) -> list:
+    return [
+        {"timestamp": start_ms + i * step_ms, "sumOpenInterest": value}
+        for i, value in enumerate(values)
+    ]
+
+
+def test_stale_checkpoint_windows_are_not_restored():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        now_ms = int(time.time() * 1000)
+        saved = detector.OpenInterestDetector(window=3)
+        saved.add_points("FRESH", points(now_ms - 900_000, [100.0, 101.0, 102.0]))
+        saved.add_points("STALE", points(now_ms - 3 * 86_400_000, [100.0, 101.0, 102.0]))
+        await saved.save_checkpoint(client, "cp")
+
+        loaded = detector.OpenInterestDetector(window=3)
+        restored = await loaded.load_checkpoint(client, "cp", max_age=86_400)
+        return restored, loaded
+
+    restored, loaded = asyncio.run(scenario())
+    assert restored == 1
+    assert loaded.ready("FRESH")
+    assert not loaded.ready("STALE")
+    assert loaded.windows.count("STALE") == 0
+
+
+def test_evaluate_fires_once_per_threshold():
+    oi = detector.OpenInterestDetector(window=3, band=0.1, step=0.01)
+    oi.add_points("BTCUSDT", points(0, [100.0, 100.0, 100.0]))
+
+    avg, deviation, threshold = oi.evaluate("BTCUSDT", 120.0)
+    assert (avg, threshold) == (100.0, 120.0 * 1.01)
+    assert deviation == 0.2
+    # Тот же OI не пробивает новый порог
+    assert oi.evaluate("BTCUSDT", 120.0) is None
+    assert oi.evaluate("BTCUSDT", 105.0) is None
+    assert oi.evaluate("BTCUSDT", 80.0)[2] == 80.0 * 0.99
+
+
+def test_evaluate_batch_matches_evaluate():
+    values = {"A": [100.0, 100.0, 100.0], "B": [50.0, 52.0, 54.0], "C": [10.0, 10.0, 10.0], "D": [1.0, 1.0]}
+    current = np.array([115.0, 40.0, 10.5, 2.0])
+    single = detector.OpenInterestDetector(window=3)
+    batch = detector.OpenInterestDetector(window=3)
+    for symbol, series in values.items():
+        single.add_points(symbol, points(0, series))
+        batch.add_points(symbol, points(0, series))
+
+    result = batch.evaluate_batch(list(values), current)
+    expected = {
+        symbol: single.evaluate(symbol, value)
+        for symbol, value in zip(values, current) if single.ready(symbol)
+    }
+    assert result["ready"].tolist() == [True, True, True, False]
+    assert result["fired"].tolist() == [i for i, symbol in enumerate(values) if expected.get(symbol)]
+    for i, index in enumerate(result["fired"]):
+        avg, deviation, threshold = expected[list(values)[index]]
+        assert np.isclose(result["avg"][i], avg)
+        assert np.isclose(result["deviation"][i], deviation)
+        assert np.isclose(result["threshold"][i], threshold)
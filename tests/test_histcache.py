@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from conftest import service_module
+
+histcache = service_module("openinterestservice", "histcache")
+
+PERIOD_MS = 300_000
+
+
+def points(last_ts: int, n: int) -> list:
+    return [
+        {"timestamp": last_ts - (n - 1 - i) * PERIOD_MS, "sumOpenInterest": str(100 + i)}
+        for i in range(n)
+    ]
+
+
+class FakeFetch:
+    def __init__(self, last_ts: int, delay: float = 0.0):
+        self.last_ts = last_ts
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, symbol, period, limit, start_time):
+        self.calls.append((limit, start_time))
+        await asyncio.sleep(self.delay)
+        if start_time is None:
+            return points(self.last_ts, limit)
+        # Как и биржа, отдаём точки начиная с startTime, с запасом на уже сохранённую
+        return [item for item in points(self.last_ts, limit + 1) if item["timestamp"] >= start_time - PERIOD_MS]
+
+
+def aligned_now() -> int:
+    now_ms = int(time.time() * 1000)
+    return now_ms - now_ms % PERIOD_MS
+
+
+def test_only_missing_points_are_fetched():
+    last_ts = aligned_now()
+    fetch = FakeFetch(last_ts)
+    cache = histcache.HistCache(fetch, {"5m": 5})
+    cache.seed("BTCUSDT", "5m", points(last_ts - 3 * PERIOD_MS, 5))
+
+    new_points = asyncio.run(cache.refresh("BTCUSDT", "5m"))
+    assert fetch.calls == [(3, last_ts - 3 * PERIOD_MS + 1)]
+    assert [item["timestamp"] for item in new_points] == [last_ts - 2 * PERIOD_MS + i * PERIOD_MS for i in range(3)]
+    stored = cache.points("BTCUSDT", "5m")
+    assert len(stored) == 5
+    assert stored[-1]["timestamp"] == last_ts
+
+    # Запись свежая до закрытия следующего периода - запроса нет
+    assert asyncio.run(cache.refresh("BTCUSDT", "5m")) == []
+    assert cache.stats()["requests"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_gap_longer_than_capacity_reloads_window():
+    last_ts = aligned_now()
+    fetch = FakeFetch(last_ts)
+    cache = histcache.HistCache(fetch, {"5m": 5})
+    cache.seed("BTCUSDT", "5m", points(last_ts - 20 * PERIOD_MS, 5))
+
+    asyncio.run(cache.refresh("BTCUSDT", "5m"))
+    assert fetch.calls == [(5, None)]
+    assert [item["timestamp"] for item in cache.points("BTCUSDT", "5m")] == [item["timestamp"] for item in points(last_ts, 5)]
+
+
+def test_concurrent_refreshes_share_one_request():
+    fetch = FakeFetch(aligned_now(), delay=0.01)
+    cache = histcache.HistCache(fetch, {"5m": 5})
+
+    async def scenario():
+        return await asyncio.gather(*(cache.refresh("BTCUSDT", "5m") for _ in range(3)))
+
+    results = asyncio.run(scenario())
+    assert len(fetch.calls) == 1
+    assert sorted(len(result) for result in results) == [0, 0, 5]
+
+
+def test_failed_fetch_retries_after_settle_delay():
+    async def failing(symbol, period, limit, start_time):
+        return []
+
+    cache = histcache.HistCache(failing, {"5m": 5}, settle_delay=15.0)
+    before = time.time()
+    assert asyncio.run(cache.refresh("BTCUSDT", "5m")) == []
+    expires = cache._entries[("BTCUSDT", "5m")].expires
+    assert before + 15.0 <= expires <= time.time() + 15.0
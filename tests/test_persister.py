@@ -0,0 +1,64 @@
+import asyncio
+
+from conftest import service_module
+
+persister = service_module("openinterestservice", "persister")
+
+
+class FlakyDB:
+    """
+    Первые failures вызовов падают (база недоступна), затем пишет.
+    """
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+        self.rows = []
+
+    async def save_open_interest_rows(self, rows):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("MariaDB недоступна")
+        self.rows += rows
+
+
+def points(n: int, offset: int = 0) -> list:
+    return [{"timestamp": offset + i, "sumOpenInterest": "1", "sumOpenInterestValue": "2"} for i in range(n)]
+
+
+def test_failed_batch_is_written_after_outage(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    async def scenario():
+        db = FlakyDB(failures=4)
+        writer = persister.HistoryPersister(db, queue_size=100, batch_size=10, flush_interval=0.01, max_retries=3)
+        monkeypatch.setattr(persister.asyncio, "sleep", no_sleep)
+        await writer.put("BTCUSDT", points(5))
+        rows, taken = await writer._collect()
+        assert not await writer._write(rows)
+        writer._requeue(rows)
+        for _ in range(taken):
+            writer.queue.task_done()
+        await writer.put("BTCUSDT", points(3, offset=100))
+        # Следующий пакет начинается с неудавшихся строк
+        rows, taken = await writer._collect()
+        assert taken == 3
+        assert await writer._write(rows)
+        return db, writer
+
+    db, writer = asyncio.run(scenario())
+    assert sorted(row[1] for row in db.rows) == [0, 1, 2, 3, 4, 100, 101, 102]
+    assert writer.dropped == 0
+    assert writer.pending() == 0
+
+
+def test_requeue_is_bounded_by_queue_size():
+    writer = persister.HistoryPersister(FlakyDB(failures=0), queue_size=4)
+    writer._requeue([("BTCUSDT", i, "1", "2") for i in range(3)])
+    writer._requeue([("BTCUSDT", i, "1", "2") for i in range(10, 13)])
+
+    assert writer.dropped == 2
+    assert writer.pending() == 4
+    # Последний неудавшийся пакет идёт первым
+    assert [row[1] for row in writer._failed] == [10, 11, 12, 0]
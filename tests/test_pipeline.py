@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from conftest import service_module
+
+pipeline_module = service_module("marketservise", "pipeline")
+
+
+def message(stream: str, seq: int, is_closed: bool = False) -> str:
+    return json.dumps(
+        {"stream": stream, "data": {"E": 1_700_000_000_000 + seq, "k": {"t": seq, "x": is_closed}}},
+        separators=(",", ":")
+    )
+
+
+def test_messages_of_one_stream_are_handled_in_order():
+    streams = [f"sym{i}usdt@kline_1m" for i in range(10)]
+    handled = []
+
+    async def handler(raw: str):
+        await asyncio.sleep(0)
+        data = json.loads(raw)
+        handled.append((data["stream"], data["data"]["k"]["t"]))
+
+    async def scenario():
+        pipeline = pipeline_module.MessagePipeline(handler, workers=4, queue_size=100)
+        pipeline.start()
+        for seq in range(20):
+            for stream in streams:
+                await pipeline.put(message(stream, seq))
+        for queue in pipeline.queues:
+            await queue.join()
+        await pipeline.stop()
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert pipeline.processed == 200
+    for stream in streams:
+        assert [seq for name, seq in handled if name == stream] == list(range(20))
+        assert pipeline._queue_for(message(stream, 0)) is pipeline._queue_for(message(stream, 1))
+
+
+def test_full_queue_drops_only_open_candles():
+    handled = []
+
+    async def handler(raw: str):
+        handled.append(raw)
+
+    async def scenario():
+        pipeline = pipeline_module.MessagePipeline(handler, workers=1, queue_size=1, drop_when_full=True)
+        first = message("btcusdt@kline_1m", 1)
+        await pipeline.put(first)
+        await pipeline.put(message("btcusdt@kline_1m", 2))
+        closed = message("btcusdt@kline_1m", 3, is_closed=True)
+        # Закрытая свеча ждёт места в очереди, а не выбрасывается
+        put = asyncio.create_task(pipeline.put(closed))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+        pipeline.start()
+        await put
+        await pipeline.queues[0].join()
+        await pipeline.stop()
+        return pipeline, [first, closed]
+
+    pipeline, expected = asyncio.run(scenario())
+    assert handled == expected
+    assert pipeline.dropped == 1
+    assert pipeline.blocked == 1
+
+
+def test_extractors_without_full_parse():
+    raw = message("ethusdt@kline_5m", 5)
+    assert pipeline_module.extract_stream_name(raw) == "ethusdt@kline_5m"
+    assert pipeline_module.extract_event_time(raw) == 1_700_000_000.005
+    assert pipeline_module.extract_event_time('{"stream":"x"}') == 0.0
@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import service_module
+
+userdata_redis = service_module("userdataservise", "redis_client")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    monkeypatch.setattr(userdata_redis.redis, "Redis", lambda **kwargs: fakeredis.FakeAsyncRedis(decode_responses=True))
+    return userdata_redis.RedisClient()
+
+
+def position(side: str, amt: str) -> dict:
+    return {"positionAmt": amt, "entryPrice": "100.5", "unrealizedProfit": "0", "updateTime": 1, "positionSide": side}
+
+
+def test_positions_and_counters_in_one_call(client):
+    async def scenario():
+        counters = await client.set_positions([
+            ("BTCUSDT", position("LONG", "0.5")),
+            ("ETHUSDT", position("SHORT", "-2")),
+            ("XRPUSDT", position("LONG", "0")),
+        ])
+        first = dict(counters)
+        counters = await client.set_positions([("BTCUSDT", position("LONG", "0"))])
+        return first, counters, await client.client.smembers(userdata_redis.OPEN_SHORT_KEY)
+
+    first, counters, shorts = asyncio.run(scenario())
+    assert first == {"LONG": 1, "SHORT": 1}
+    assert counters == {"LONG": 0, "SHORT": 1}
+    assert shorts == {"ETHUSDT"}
+
+
+def test_set_position_stores_payload_unchanged(client):
+    payload = position("LONG", "1")
+
+    async def scenario():
+        await client.set_position("BTCUSDT", payload)
+        return await client.client.hget("positions:BTCUSDT", "LONG")
+
+    assert json.loads(asyncio.run(scenario())) == payload
@@ -0,0 +1,55 @@
+import gzip
+
+from common.replay import FrameRecorder, read_frames
+from conftest import service_module
+
+
+def test_frames_readable_without_close(tmp_path):
+    path = str(tmp_path / "frames.gz")
+    recorder = FrameRecorder(path, flush_interval=0)
+    for i in range(1000):
+        recorder.write(f'{{"stream":"btcusdt@kline_1m","i":{i}}}', received_at=1000.0 + i)
+
+    # Процесс завершился без close(): все сброшенные кадры должны читаться
+    frames = list(read_frames(path))
+    assert len(frames) == 1000
+    assert frames[0] == (1000.0, '{"stream":"btcusdt@kline_1m","i":0}')
+    assert frames[-1][1] == '{"stream":"btcusdt@kline_1m","i":999}'
+
+
+def test_next_run_appends_after_unclosed_run(tmp_path):
+    path = str(tmp_path / "frames.gz")
+    first = FrameRecorder(path, flush_interval=0)
+    first.write("a", received_at=1.0)
+    second = FrameRecorder(path)
+    second.write("b", received_at=2.0)
+    second.close()
+
+    assert list(read_frames(path)) == [(1.0, "a"), (2.0, "b")]
+
+
+def test_truncated_tail_keeps_read_frames(tmp_path):
+    path = str(tmp_path / "frames.gz")
+    # gzip-член без трейлера, как оставался после записи без close()
+    file = gzip.open(path, "wb", compresslevel=1)
+    for i in range(100):
+        file.write(f"{i}.000000\tframe {i}\n".encode())
+    file.flush()
+
+    frames = list(read_frames(path))
+    assert [frame for _, frame in frames] == [f"frame {i}" for i in range(100)]
+
+
+def test_decode_bench_reads_recorder_files(tmp_path):
+    bench_decode = service_module("marketservise", "bench_decode")
+    path = str(tmp_path / "kline.gz")
+    recorder = FrameRecorder(path)
+    for frame in bench_decode.synthetic_frames(10):
+        recorder.write(frame)
+    # Служебный ответ на SUBSCRIBE в записи не является свечой
+    recorder.write('{"result":null,"id":1}')
+    recorder.close()
+
+    frames = bench_decode.load_frames(path)
+    assert len(frames) == 10
+    assert [bench_decode.typed_path(frame) for frame in frames]
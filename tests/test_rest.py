@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+from common.rest import BinanceRestClient, CircuitBreaker, CircuitOpenError
+
+
+def test_breaker_opens_and_lets_one_probe_through():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    breaker.opened_at = time.monotonic() - 31
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    # Пока пробный запрос в полёте, остальные отклоняются
+    assert not breaker.allow()
+
+    breaker.failure()
+    assert breaker.state == "open"
+    breaker.opened_at = time.monotonic() - 31
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+class _BlockingLimiter:
+    """
+    Ограничитель, который не выдаёт бюджет: запрос висит в acquire.
+    """
+
+    async def acquire(self, path, params=None):
+        await asyncio.Future()
+
+
+def test_cancelled_probe_does_not_lock_the_host():
+    async def scenario():
+        client = BinanceRestClient("http://127.0.0.1:1", rate_limiter=_BlockingLimiter(), breaker_reset=30)
+        breaker = client.breaker(client.base_url)
+        breaker.failures = client.breaker_threshold
+        breaker.opened_at = time.monotonic() - 31
+
+        probe = asyncio.ensure_future(client.get("/fapi/v1/klines", {"symbol": "BTCUSDT"}))
+        await asyncio.sleep(0)
+        # Пробный запрос ждёт ограничитель, второй запрос отклоняется
+        with pytest.raises(CircuitOpenError):
+            await client.get("/fapi/v1/time")
+
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.state == "half-open"
+        assert breaker.allow()
+        await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,60 @@
+import numpy as np
+
+from common.candle import Candle
+from conftest import service_module
+
+ringbuffer = service_module("marketservise", "ringbuffer")
+
+
+def candle(i: int, close: float = 100.0, volume: float = 10.0) -> Candle:
+    start = 1_700_000_000_000 + i * 60_000
+    return Candle(
+        start, start + 59_999, "BTCUSDT", "1m", 0, 0,
+        close, close, close + 1, close - 1, volume, 1, True, 0.0, 0.0, 0.0
+    )
+
+
+def expected_zscore(volumes: list, period: int) -> float:
+    window = np.array(volumes[-period:], dtype=float)
+    return float((window[-1] - window.mean()) / window.std())
+
+
+def test_volume_zscore_is_stable_for_large_volumes():
+    store = ringbuffer.CandleRingBuffer(capacity=64)
+    volumes = [1e9 + i for i in range(200)]
+    for i, volume in enumerate(volumes):
+        store.append(candle(i, volume=volume))
+
+    assert np.isclose(store.indicators("BTCUSDT")["volume_zscore"], expected_zscore(volumes, 20), rtol=1e-6)
+
+
+def test_indicators_match_window_after_wraps():
+    rng = np.random.default_rng(1)
+    store = ringbuffer.CandleRingBuffer(capacity=32)
+    closes = list(rng.uniform(90, 110, 300))
+    volumes = list(rng.uniform(1, 1e6, 300))
+    for i in range(300):
+        store.append(candle(i, closes[i], volumes[i]))
+
+    indicators = store.indicators("BTCUSDT")
+    assert np.isclose(indicators["sma"], np.mean(closes[-20:]))
+    assert np.isclose(indicators["volume_zscore"], expected_zscore(volumes, 20))
+    assert store.last("BTCUSDT", 5)[:, ringbuffer.CLOSE].tolist() == closes[-5:]
+
+
+def test_repeated_and_old_candles_are_ignored():
+    store = ringbuffer.CandleRingBuffer(capacity=32)
+    assert store.append(candle(1))
+    assert not store.append(candle(1))
+    assert not store.append(candle(0))
+    assert store.last_times("BTCUSDT", 10).tolist() == [candle(1).start_time]
+
+
+def test_last_all_pads_missing_bars():
+    store = ringbuffer.CandleRingBuffer(capacity=32)
+    for i in range(3):
+        store.append(candle(i, close=100.0 + i))
+
+    values = store.last_all(5)
+    assert np.isnan(values[0, :2]).all()
+    assert values[0, 2:].tolist() == [100.0, 101.0, 102.0]
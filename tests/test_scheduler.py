@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import service_module
+
+scheduler = service_module("openinterestservice", "scheduler")
+
+
+async def run_for(poll: "scheduler.PollScheduler", seconds: float):
+    task = asyncio.create_task(poll.run())
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_new_symbols_are_spread_over_interval():
+    async def scenario():
+        poll = scheduler.PollScheduler(None, {"fast": 1.0, "slow": 4.0})
+        poll.sync({"A": "fast", "B": "fast", "C": "fast", "D": "fast", "E": "slow"})
+        return poll
+
+    poll = asyncio.run(scenario())
+    dues = [poll._entries[symbol].due for symbol in "ABCD"]
+    assert [round(b - a, 6) for a, b in zip(dues, dues[1:])] == [0.25, 0.25, 0.25]
+    assert poll._entries["E"].interval == 4.0
+
+
+def test_overlapping_runs_are_skipped():
+    started = []
+
+    async def job(symbol: str):
+        started.append(symbol)
+        await asyncio.sleep(0.1)
+
+    async def scenario():
+        poll = scheduler.PollScheduler(job, {"fast": 0.02})
+        poll.sync({"A": "fast"})
+        await run_for(poll, 0.09)
+        return poll
+
+    poll = asyncio.run(scenario())
+    assert started == ["A"]
+    assert poll._entries["A"].skipped >= 2
+
+
+def test_late_start_counts_missed_instead_of_burst():
+    started = []
+
+    async def job(symbol: str):
+        started.append(symbol)
+
+    async def scenario():
+        poll = scheduler.PollScheduler(job, {"fast": 0.05})
+        poll.sync({"A": "fast"})
+        # Цикл событий занят дольше трёх интервалов
+        time.sleep(0.18)
+        await run_for(poll, 0.005)
+        return poll
+
+    poll = asyncio.run(scenario())
+    entry = poll._entries["A"]
+    assert started == ["A"]
+    assert entry.missed >= 3
+    assert entry.runs == 1
+
+
+def test_removed_symbols_are_not_polled():
+    started = []
+
+    async def job(symbol: str):
+        started.append(symbol)
+
+    async def scenario():
+        poll = scheduler.PollScheduler(job, {"fast": 0.05})
+        poll.sync({"A": "fast", "B": "fast"})
+        poll.sync({"B": "fast"})
+        await run_for(poll, 0.15)
+        return poll
+
+    poll = asyncio.run(scenario())
+    assert set(started) == {"B"}
+    assert poll.report()["fast"]["symbols"] == 1
+    assert poll.report()["fast"]["achieved_interval"] == pytest.approx(0.05, abs=0.02)
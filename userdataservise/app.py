@@ -3,45 +3,51 @@ from os import getenv
 import asyncio
 import json
 import logging
+import time
 from decimal import Decimal
 from typing import Optional
 
 import websockets
-import requests
 from redis_client import RedisClient
+from common import metrics
+from common.rest import BinanceRestClient
+from common.replay import FrameRecorder
 
 API_KEY_BIN = getenv("API_KEY_BIN")
 REDIS_HOST = getenv("REDIS_HOST")
 REDIS_PORT = getenv("REDIS_PORT")
 REDIS_PASSWORD = getenv("REDIS_PASSWORD")
+METRICS_PORT = int(getenv("METRICS_PORT", "9103"))
+BINANCE_FAPI_URL = getenv("BINANCE_FAPI_URL", "https://fapi.binance.com")
+BINANCE_WS_URL = getenv("BINANCE_WS_URL", "wss://fstream.binance.com/ws")
+# Запись сырых кадров в gzip-файл для воспроизведения (bench/); пусто - не писать
+WS_RECORD_PATH = getenv("WS_RECORD_PATH", "")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Задержка от времени события биржи (поле E) до получения, разбора и записи в Redis
+INGEST_LATENCY = metrics.histogram(
+    "userdata_ingest_latency_seconds", "Задержка от времени события биржи до этапа обработки", ["stage"]
+)
+RECEIVE_LATENCY = INGEST_LATENCY.labels("receive")
+PARSE_LATENCY = INGEST_LATENCY.labels("parse")
+REDIS_ACK_LATENCY = INGEST_LATENCY.labels("redis_ack")
+WS_MESSAGES = metrics.counter("userdata_ws_messages_total", "Сообщений, прочитанных из соединения")
+WS_RECONNECTS = metrics.counter("userdata_ws_reconnects_total", "Переподключений к user data stream")
 
-def get_listen_key(api_key: str, base_url: str = "https://fapi.binance.com") -> str:
+
+async def get_listen_key(client: BinanceRestClient) -> str:
     """
-    Получает listenKey для USDS-M фьючерсов (функция синхронная, 
-    если нужно асинхронно – перепишите под aiohttp/httpx).
+    Получает listenKey для USDS-M фьючерсов через общий REST-клиент
+    (повторы, предохранитель и учёт веса - в BinanceRestClient).
     """
-    url = f"{base_url}/fapi/v1/listenKey"
-    headers = {
-        "X-MBX-APIKEY": api_key
-    }
     try:
-        response = requests.post(url, headers=headers, timeout=10)
-    except requests.RequestException as e:
-        logger.error("Ошибка сети при получении listenKey: %s", e)
-        raise RuntimeError("Сетевая ошибка при запросе listenKey") from e
-
-    if response.status_code != 200:
-        logger.error(
-            "Неуспешный статус %s при получении listenKey, тело ответа: %s",
-            response.status_code, response.text
-        )
-        raise RuntimeError(f"Не удалось получить listenKey, статус: {response.status_code}")
-
-    data = response.json()
+        data = await client.post("/fapi/v1/listenKey", api_key=True)
+    except Exception as e:
+        logger.error("Ошибка при получении listenKey: %s", e)
+        raise RuntimeError("Не удалось получить listenKey") from e
+
     lk = data.get("listenKey")
     if not lk:
         logger.error("listenKey отсутствует в ответе Binance: %s", data)
@@ -60,18 +66,21 @@ async def process_user_data_event(res: dict, redis_client: RedisClient):
     event_type = res.get("e", "")
     if event_type == "ACCOUNT_UPDATE":
 
-        positions = res["a"]["P"]  # список позиций
-        for row in positions:
-            position_data = {
+        positions = [
+            (row["s"], {
                 "symbol": row["s"],
                 "positionAmt": row["pa"],
                 "entryPrice": row["ep"],
                 "unrealizedProfit": row["up"],
                 "updateTime": res["T"],
                 "positionSide": row["ps"]
-            }
-            await redis_client.set_position(row["s"], position_data)
+            })
+            for row in res["a"]["P"]  # список позиций
+        ]
+        # Все позиции события - одним атомарным вызовом
+        counters = await redis_client.set_positions(positions)
 
+        for symbol, position_data in positions:
             # Для примера можем логировать размер в USD
             try:
                 size_usd = Decimal(position_data["entryPrice"]) * Decimal(position_data["positionAmt"])
@@ -79,11 +88,13 @@ async def process_user_data_event(res: dict, redis_client: RedisClient):
                 size_usd = Decimal(0)
             logger.info(
                 "ACCOUNT_UPDATE %s price: %s size: %s (%.0f$)",
-                position_data["symbol"],
+                symbol,
                 position_data["entryPrice"],
                 position_data["positionAmt"],
                 size_usd
             )
+        if positions:
+            logger.info("Открыто позиций: LONG %s, SHORT %s", counters["LONG"], counters["SHORT"])
 
     if event_type == "ORDER_TRADE_UPDATE":
         order = res["o"]
@@ -116,10 +127,18 @@ async def process_user_data_event(res: dict, redis_client: RedisClient):
 
 
 # Чтение сообщений (events) из WebSocket и передача в process_user_data_event
-async def receive_user_data_messages(ws, redis_client: RedisClient):
+async def receive_user_data_messages(ws, redis_client: RedisClient, recorder: FrameRecorder = None):
     async for message in ws:
+        received_at = time.time()
+        WS_MESSAGES.inc()
+        if recorder is not None:
+            recorder.write(message, received_at)
         try:
             data = json.loads(message)
+            event_time = data.get("E", 0) / 1000
+            if event_time:
+                RECEIVE_LATENCY.observe(received_at - event_time)
+                PARSE_LATENCY.observe(time.time() - event_time)
             # Если используем прямое подключение: wss://fstream.binance.com/ws/<listenKey>,
             # то событие приходит напрямую: {"e":"ACCOUNT_UPDATE",...}
             # Если используем combined stream, то может прийти {"stream":"...", "data":{...}}
@@ -131,6 +150,8 @@ async def receive_user_data_messages(ws, redis_client: RedisClient):
             #     event_payload = data["data"]
 
             await process_user_data_event(event_payload, redis_client)
+            if event_time:
+                REDIS_ACK_LATENCY.observe(time.time() - event_time)
         except Exception as e:
             logger.error("Ошибка при обработке сообщения user data stream: %s", e, exc_info=True)
 
@@ -142,37 +163,45 @@ async def subscribe_user_data_stream(api_key: str):
     2. Подключаемся по WebSocket: wss://fstream.binance.com/ws/<listenKey>
     3. Слушаем события, при ошибке переподключаемся
     """
-    # Получаем listenKey (через sync-функцию).
-    # Если нужно, можно добавлять логику keep-alive, 
+    # Если нужно, можно добавлять логику keep-alive,
     # повторно вызывать get_listen_key или PUT-запросы каждые ~30 минут.
-    try:
-        listen_key = get_listen_key(api_key)
-    except Exception as e:
-        logger.error("Невозможно получить listenKey: %s", e)
-        return  # или raise
+    async with BinanceRestClient(BINANCE_FAPI_URL, api_key=api_key) as client:
+        try:
+            listen_key = await get_listen_key(client)
+        except Exception as e:
+            logger.error("Невозможно получить listenKey: %s", e)
+            return  # или raise
 
-    url = f"wss://fstream.binance.com/ws/{listen_key}"
+    url = f"{BINANCE_WS_URL}/{listen_key}"
     # Инициализируем RedisClient
     redis_client = RedisClient(
         host=REDIS_HOST,
         port=REDIS_PORT,
         password=REDIS_PASSWORD
     )
+    await metrics.start_metrics_server(METRICS_PORT)
+    recorder = FrameRecorder(WS_RECORD_PATH) if WS_RECORD_PATH else None
 
-    while True:
-        try:
-            async with websockets.connect(
-                url, 
-                ping_interval=180, 
-                ping_timeout=600
-            ) as ws:
-                logger.info("Подключено к %s", url)
-                await receive_user_data_messages(ws, redis_client)
-        except Exception as e:
-            logger.error("Ошибка соединения или чтения WebSocket: %s", e)
-        
-        logger.info("Переподключение через 5 секунд...")
-        await asyncio.sleep(5)
+    try:
+        while True:
+            try:
+                async with websockets.connect(
+                    url, 
+                    ping_interval=180, 
+                    ping_timeout=600
+                ) as ws:
+                    logger.info("Подключено к %s", url)
+                    await receive_user_data_messages(ws, redis_client, recorder)
+            except Exception as e:
+                logger.error("Ошибка соединения или чтения WebSocket: %s", e)
+            
+            WS_RECONNECTS.inc()
+            logger.info("Переподключение через 5 секунд...")
+            await asyncio.sleep(5)
+    finally:
+        if recorder is not None:
+            # Дописываем буфер и закрываем файл записи
+            recorder.close()
 
 
 if __name__ == "__main__":
@@ -5,6 +5,34 @@ from decimal import Decimal
 from datetime import datetime
 
 
+OPEN_LONG_KEY = "open_long_positions"
+OPEN_SHORT_KEY = "open_short_positions"
+
+# KEYS: open_long_positions, open_short_positions, positions:{symbol} на каждую позицию;
+# ARGV: по 5 значений на позицию - symbol, positionSide, positionSide в верхнем регистре, JSON, открыта (1/0)
+SET_POSITIONS_LUA = """
+for i = 3, #KEYS do
+    local base = (i - 3) * 5
+    local symbol, side, side_upper = ARGV[base + 1], ARGV[base + 2], ARGV[base + 3]
+    redis.call('HSET', KEYS[i], side, ARGV[base + 4])
+    local open_key = nil
+    if side_upper == 'LONG' then
+        open_key = KEYS[1]
+    elseif side_upper == 'SHORT' then
+        open_key = KEYS[2]
+    end
+    if open_key then
+        if ARGV[base + 5] == '1' then
+            redis.call('SADD', open_key, symbol)
+        else
+            redis.call('SREM', open_key, symbol)
+        end
+    end
+end
+return {redis.call('SCARD', KEYS[1]), redis.call('SCARD', KEYS[2])}
+"""
+
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
@@ -24,45 +52,47 @@ class RedisClient:
         self.client = redis.Redis(host=self.host, port=self.port, db=self.db, password=self.password, decode_responses=True)
         # Добавляем локальный кэш настроек и блокировку для синхронизации доступа
         self._position_counters = {"LONG": 0, "SHORT": 0}
+        self._set_positions_script = self.client.register_script(SET_POSITIONS_LUA)
     
     # Методы для работы с позициями v2
     async def set_position(self, symbol: str, position_data: dict):
         """
-        Обновляет позицию для заданного символа.
+        Обновляет позицию для заданного символа (см. set_positions).
+        """
+        await self.set_positions([(symbol, position_data)])
+
+    async def set_positions(self, positions: list) -> dict:
+        """
+        Обновляет позиции - список пар (symbol, position_data) - одним атомарным
+        вызовом Lua-скрипта (один round trip). Символ передаётся скрипту отдельным
+        аргументом, position_data сохраняется как есть.
         Данные хранятся в хеше с ключом "positions:{symbol}"
         в поле, соответствующем значению positionSide (например, "LONG" или "SHORT").
         Также обновляет вспомогательные наборы open_long_positions / open_short_positions.
+        Счётчики открытых позиций возвращаются тем же вызовом и записываются в _position_counters.
         """
-        key = f"positions:{symbol}"
-        side = position_data.get("positionSide")
-        if not side:
-            raise ValueError("positionSide отсутствует в данных позиции")
-        
-        # Сохраняем данные для нужной стороны в виде JSON-строки
-        await self.client.hset(key, side, json.dumps(position_data, cls=DecimalEncoder))
+        if not positions:
+            return dict(self._position_counters)
+        keys = [OPEN_LONG_KEY, OPEN_SHORT_KEY]
+        args = []
+        for symbol, position_data in positions:
+            side = position_data.get("positionSide")
+            if not side:
+                raise ValueError("positionSide отсутствует в данных позиции")
+
+            # Определяем, открыта ли позиция (positionAmt != 0)
+            try:
+                amt = float(position_data.get("positionAmt", "0"))
+            except Exception:
+                amt = 0
 
-        # Определяем, открыта ли позиция (positionAmt != 0)
-        try:
-            amt = float(position_data.get("positionAmt", "0"))
-        except Exception:
-            amt = 0
+            keys.append(f"positions:{symbol}")
+            args += [symbol, side, side.upper(), json.dumps(position_data, cls=DecimalEncoder), 1 if amt != 0 else 0]
 
-        if amt != 0:
-            # Если позиция открыта, добавляем символ в соответствующий набор
-            if side.upper() == "LONG":
-                await self.client.sadd("open_long_positions", symbol)
-            elif side.upper() == "SHORT":
-                await self.client.sadd("open_short_positions", symbol)
-            
-        else:
-            # Если позиция закрыта, удаляем символ из набора
-            if side.upper() == "LONG":
-                await self.client.srem("open_long_positions", symbol)
-            elif side.upper() == "SHORT":
-                await self.client.srem("open_short_positions", symbol)
-        
-        self._position_counters["LONG"] = await self.client.scard("open_long_positions")
-        self._position_counters["SHORT"] = await self.client.scard("open_short_positions")
+        long_count, short_count = await self._set_positions_script(keys=keys, args=args)
+        self._position_counters["LONG"] = long_count
+        self._position_counters["SHORT"] = short_count
+        return dict(self._position_counters)
 
     async def get_position(self, symbol: str) -> dict:
         """